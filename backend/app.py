@@ -1,80 +1,93 @@
 # app.py
 
 from f1_score import compute_f1_score, generate_model_evaluation_metrics
-from flask import Flask, request, jsonify, send_from_directory
+from flask import Flask, request, jsonify, send_file, send_from_directory, Response, stream_with_context, g
 from flask_cors import CORS  # Import CORS for cross-origin requests
+import json
 import os
+import shutil
+import tempfile
+import time
 
-
-try:
-    import pyodbc
-    PYODBC_AVAILABLE = True
-except ImportError:
-    print("WARNING: pyodbc module not available. Database functionality will be disabled.")
-    PYODBC_AVAILABLE = False
-
+from database import get_db_connection, get_pool, DB_BACKEND
+from feedback_store import upsert_feedback
 from classifier_sentiment import classify_sentiment
 from classifier_sarcasm import detect_sarcasm
 from classifier_emotion import detect_emotion
 # Where is aspect-based classifier?
 from phi3resgen import generate_response
+from pipeline import classify_texts, analyze_texts, iter_chunks, feedback_writer, STREAM_CHUNK_SIZE
+from stream_input import iter_request_texts, StreamInputError
+import dashboard
+import evaluation
+import file_ingest
+import jobs
+import metrics
+import migrations
+import model_registry
+import result_cache
 
 app = Flask(__name__)
-CORS(app)  # Enable CORS for all routes
+# Enable CORS for all routes; the browser may read the dashboard's next-page cursor
+CORS(app, expose_headers=[dashboard.NEXT_CURSOR_HEADER])
 
-# Clear FeedbackResponses table on startup if it has data
-def initialize_database():
-    print("[INIT] Checking and cleaning FeedbackResponses table if needed...")
-    conn = get_db_connection()
-    if conn is None:
-        print("[INIT ERROR] Could not connect to DB for initialization.")
-        return
-    try:
-        cursor = conn.cursor()
-        cursor.execute("SELECT COUNT(*) FROM FeedbackResponses;")
-        row_count = cursor.fetchone()[0]
-        print(f"[INIT] Found {row_count} records in FeedbackResponses.")
-        if row_count > 0:
-            print("[INIT] Clearing the table...")
-            cursor.execute("DELETE FROM FeedbackResponses;")
-            conn.commit()
-            print("[INIT] Table cleared.")
-        cursor.close()
-        conn.close()
-    except Exception as e:
-        print(f"[INIT ERROR] Failed to initialize database: {str(e)}")
+# Models load lazily on first use; CAPSENSE_PRELOAD picks the ones to load now
+model_registry.preload()
 
-
-# Production DB config for Azure SQL
-DB_CONFIG = {
-    'server': '1sqlcapsenseserver.database.windows.net',
-    'database': 'SentimentAnalysisDB',
-    'username': 'capsenseadmin',
-    'password': 'Access@Capsense1'
-}
-
-def get_db_connection():
+# Bring the FeedbackResponses schema up to date (once, in the gunicorn master).
+# Only SchemaMigrations is read, so startup time doesn't grow with the tables.
+try:
+    migrations.startup()
+except Exception as e:
+    print(f"[INIT ERROR] Schema migration failed: {str(e)}")
+
+# Request metrics, exposed at /metrics
+@app.before_request
+def start_request_timer():
+    g.request_start = time.perf_counter()
+
+@app.after_request
+def record_request_metrics(response):
+    endpoint = request.url_rule.rule if request.url_rule else "unmatched"
+    start = g.get("request_start")
+    if start is not None:
+        metrics.request_duration.observe(time.perf_counter() - start, endpoint, request.method)
+    metrics.requests_total.inc(endpoint, request.method, str(response.status_code))
+    if response.status_code >= 500:
+        metrics.request_errors_total.inc(endpoint, request.method)
+    g.request_recorded = True
+    return response
+
+@app.teardown_request
+def record_request_exception(exc):
+    # Flask turns an unhandled exception into a 500 that goes through after_request,
+    # which already counted it; only count requests that never got that far
+    if exc is not None and not g.get("request_recorded"):
+        endpoint = request.url_rule.rule if request.url_rule else "unmatched"
+        metrics.request_errors_total.inc(endpoint, request.method)
+
+def _collect_runtime_stats():
     """
-    Returns a database connection or None if pyodbc is not available
+    Exports cache and connection pool statistics at scrape time.
     """
-    if not PYODBC_AVAILABLE:
-        print("WARNING: Database connection requested but pyodbc is not available")
-        return None
-        
-    conn_str = (
-        f"DRIVER={{ODBC Driver 17 for SQL Server}};"
-        f"SERVER={DB_CONFIG['server']};"
-        f"DATABASE={DB_CONFIG['database']};"
-        f"UID={DB_CONFIG['username']};"
-        f"PWD={DB_CONFIG['password']};"
-        "Encrypt=yes;TrustServerCertificate=no;Connection Timeout=30;"
-    )
-    try:
-        return pyodbc.connect(conn_str)
-    except Exception as e:
-        print(f"ERROR connecting to database: {str(e)}")
-        return None
-
+    collected = []
+    cache_stats = result_cache.all_stats()
+    for counter_name in ("memory_hits", "disk_hits", "misses", "evictions"):
+        collected.append((
+            f"capsense_cache_{counter_name}_total", "counter", f"Result cache {counter_name.replace('_', ' ')}.",
+            {(("cache", name),): stats[counter_name] for name, stats in cache_stats.items()}
+        ))
+    pool = get_pool()
+    if pool is not None:
+        pool_stats = pool.stats()
+        collected.append((
+            "capsense_db_pool_connections", "gauge", "Database pool connections by state.",
+            {(("state", "idle"),): pool_stats["idle"], (("state", "in_use"),): pool_stats["in_use"]}
+        ))
+    return collected
+
+metrics.register_collector(_collect_runtime_stats)
+metrics.register_collector(evaluation.collect_metrics)
 
 # Validation functions
 def validate_request_payload(payload):
@@ -134,39 +147,20 @@ def handle_feedback():
         conn = get_db_connection()
         if conn:
             try:
-                cursor = conn.cursor()
-
-                # Check if entry exists
-                check_query = """
-                SELECT Id FROM FeedbackResponses 
-                WHERE LOWER(LTRIM(RTRIM(CustomerText))) = ? 
-                AND LOWER(LTRIM(RTRIM(ResponseText))) = ?;
-                """
-                cursor.execute(check_query, (payload["original_text"], payload["response_text"]))
-                row = cursor.fetchone()
-
-                if row:
-                    update_query = """
-                    UPDATE FeedbackResponses 
-                    SET approved = ?, FeedbackDate = GETDATE()
-                    WHERE Id = ?;
-                    """
-                    cursor.execute(update_query, (1 if feedback_type == "approved" else 0, row[0]))
-                else:
-                    insert_query = """
-                    INSERT INTO FeedbackResponses 
-                        (CustomerText, ResponseText, approved, FeedbackDate)
-                    VALUES (?, ?, ?, GETDATE());
-                    """
-                    cursor.execute(insert_query, (
+                # One indexed upsert on FeedbackKey; returns the earlier vote, if any
+                with metrics.timer("db_feedback_upsert"):
+                    previous = upsert_feedback(
+                        conn,
                         payload["original_text"],
                         payload["response_text"],
-                        1 if feedback_type == "approved" else 0
-                    ))
+                        feedback_type == "approved",
+                        dialect=DB_BACKEND
+                    )
 
-                conn.commit()
-                cursor.close()
-                conn.close()
+                # Update the measured metrics; a changed vote replaces the earlier one
+                evaluation.record_feedback(feedback_type == "approved", previous)
+                if isinstance(payload.get("labels"), dict):
+                    evaluation.record_labels([dict(payload["labels"], text=payload["original_text"])])
 
                 return jsonify({
                     "message": f"Feedback ({feedback_type}) recorded successfully",
@@ -177,6 +171,9 @@ def handle_feedback():
                 print(f"[DB ERROR] Payload: {payload}")
                 print(f"[DB ERROR] Exception: {str(db_error)}")
                 return jsonify({"error": f"Database error: {str(db_error)}"}), 500
+            finally:
+                # Hands the connection back to the pool
+                conn.close()
         else:
             return jsonify({
                 "message": f"Feedback ({feedback_type}) received. DB not available, operation simulated.",
@@ -275,7 +272,12 @@ def respond_batch():
     2) Classify & respond to each text
     3) Insert each into DB
     4) Return array of results
+
+    With ?stream=1 the results are streamed back as NDJSON, see respond_batch_stream().
     """
+    if request.args.get("stream", "").lower() in ("1", "true", "yes"):
+        return respond_batch_stream()
+
     try:
         payload = request.get_json(force=True)
         if not payload or "customer_texts" not in payload:
@@ -292,73 +294,257 @@ def respond_batch():
     
     # Get DB connection (might be None if not available)
     conn = get_db_connection()
-    cursor = None
+    writer = None
     
     try:
         # Only set up DB operations if connection is available
         if conn:
-            cursor = conn.cursor()
-            insert_query = """
-            INSERT INTO FeedbackResponses 
-                (CustomerText, Sentiment, ResponseText, EmpathyScore, SarcasmDetected, Emotion, F1Score)
-            VALUES (?, ?, ?, ?, ?, ?, ?);
-            """
+            writer = feedback_writer(conn, DB_BACKEND)
         else:
             print("Database connection not available - skipping DB operations")
 
-        for text in texts:
-            sentiment_result = classify_sentiment(text)
-            sarcasm_result = detect_sarcasm(text)
-            emotion_result = detect_emotion(text)
-
-            classification_data = {
-                "sentiment": sentiment_result["sentiment"],
-                "sentiment_confidence": sentiment_result["confidence"],
-                "sarcasm": sarcasm_result["sarcasm"],
-                "sarcasm_confidence": sarcasm_result["confidence"],
-                "emotion": emotion_result["emotion"],
-                "emotion_confidence": emotion_result["confidence"]
-            }
-
-            # Generate AI-based response
-            ai_response = generate_response(text, classification_data)
+        try:
+            results = analyze_texts(texts, writer)
+        except Exception as e:
+            # Nothing was analyzed (rows are only buffered once the whole batch is), so don't answer 200
+            print(f"Error processing batch: {str(e)}")
+            return jsonify({"error": f"Batch analysis failed: {str(e)}"}), 500
+
+        # Write whatever is left in the buffer
+        if writer:
+            writer.flush()
             
-            # Calculate F1 score
-            f1_score = compute_f1_score(sentiment_result)
+    except Exception as e:
+        print(f"Error storing batch: {str(e)}")
+        # Continue even if DB operations fail
+    finally:
+        if conn:
+            conn.close()
 
-            # Insert in DB only if connection is available
-            if conn and cursor:
-                cursor.execute(
-                    insert_query,
-                    (
-                        text,
-                        classification_data["sentiment"],
-                        ai_response["response_text"],
-                        ai_response["empathy_score"],
-                        classification_data["sarcasm"],
-                        classification_data["emotion"],
-                        f1_score
-                    )
-                )
+    response = jsonify(results)
+    if writer:
+        db_report = writer.report()
+        if db_report["rows_failed"]:
+            print(f"[DB ERROR] respond_batch: {db_report['rows_failed']} rows not stored: {db_report['errors']}")
+        response.headers["X-DB-Rows-Written"] = str(db_report["rows_written"])
+        response.headers["X-DB-Rows-Failed"] = str(db_report["rows_failed"])
+    return response, 200
 
-            results.append({
-                "input_text": text,
-                "classification": classification_data,
-                "ai_response": ai_response,
-                "f1_score": f1_score
-            })
-        
-        # Commit and close DB resources if they were opened
-        if conn and cursor:
-            conn.commit()
-            cursor.close()
+def respond_batch_stream():
+    """
+    Streaming mode of respond_batch (?stream=1).
+    The body is read incrementally, either as the usual {"customer_texts": [...]}
+    payload or as NDJSON (Content-Type: application/x-ndjson, one text per line).
+    Texts are processed in chunks of ?chunk_size= (default CAPSENSE_STREAM_CHUNK)
+    and every result is written as one JSON line as soon as its chunk completes:
+      {"index": 0, "input_text": ..., "classification": ..., "ai_response": ..., "f1_score": ...}
+    The last line is {"summary": {...}} with the row count and DB write report,
+    or {"error": "..."} if the input turned out to be invalid.
+    """
+    try:
+        chunk_size = max(1, int(request.args.get("chunk_size", STREAM_CHUNK_SIZE)))
+    except ValueError:
+        return jsonify({"error": "'chunk_size' must be an integer."}), 400
+
+    texts = iter_request_texts(request.stream, request.content_type)
+
+    def generate():
+        conn = get_db_connection()
+        writer = None
+        count = 0
+        try:
+            if conn:
+                writer = feedback_writer(conn, DB_BACKEND)
+            else:
+                print("Database connection not available - skipping DB operations")
+
+            for chunk in iter_chunks(texts, chunk_size):
+                for result in analyze_texts(chunk, writer):
+                    result["index"] = count
+                    count += 1
+                    yield json.dumps(result) + "\n"
+
+            if writer:
+                writer.flush()
+            summary = {"count": count}
+            if writer:
+                summary.update(writer.report())
+            yield json.dumps({"summary": summary}) + "\n"
+        except StreamInputError as e:
+            log_invalid_input(str(e))
+            yield json.dumps({"error": str(e), "count": count}) + "\n"
+        except Exception as e:
+            print(f"Error processing batch stream: {str(e)}")
+            yield json.dumps({"error": str(e), "count": count}) + "\n"
+        finally:
+            if writer:
+                # Keep what was analyzed before the stream stopped
+                writer.flush()
+            if conn:
+                conn.close()
+
+    return Response(stream_with_context(generate()), mimetype="application/x-ndjson")
+
+@app.route('/api/respond_file', methods=['POST'])
+def respond_file():
+    """
+    Processes a CSV or Parquet file of customer texts and returns the results as a file.
+    Send the file as the multipart field 'file', or as the raw request body.
+    Query args:
+      column      text column (default 'customer_text')
+      format      input format, if the file name / Content-Type doesn't tell
+      output      csv or parquet (default: same as the input)
+      chunk_size  rows read and analyzed at a time (default CAPSENSE_UPLOAD_CHUNK)
+      encoding    CSV encoding (default utf-8)
+    Every text is stored in FeedbackResponses like respond_batch.
+    """
+    upload = request.files.get("file")
+    source = upload.stream if upload else request.stream
+    input_copy = None
+    try:
+        input_format = file_ingest.detect_format(
+            upload.filename if upload else None,
+            upload.mimetype if upload else request.content_type,
+            request.args.get("format")
+        )
+        output_format = file_ingest.detect_format(requested=request.args.get("output") or input_format)
+        chunk_size = max(1, int(request.args.get("chunk_size", file_ingest.UPLOAD_CHUNK_SIZE)))
+        result_file = file_ingest.ResultFileWriter(output_format)
+    except ValueError as e:
+        # FileInputError, or a non-integer chunk_size
+        log_invalid_input(str(e))
+        return jsonify({"error": str(e)}), 400
+
+    if input_format == "parquet" and not upload:
+        # Parquet is read from the footer first, so the raw body needs a seekable copy
+        input_copy = tempfile.TemporaryFile()
+        shutil.copyfileobj(request.stream, input_copy)
+        input_copy.seek(0)
+        source = input_copy
+
+    conn = get_db_connection()
+    writer = feedback_writer(conn, DB_BACKEND) if conn else None
+    count = 0
+    try:
+        chunks = file_ingest.iter_text_chunks(
+            source, input_format,
+            column=request.args.get("column", file_ingest.DEFAULT_TEXT_COLUMN),
+            chunk_size=chunk_size,
+            encoding=request.args.get("encoding", "utf-8")
+        )
+        for texts in chunks:
+            results = analyze_texts(texts, writer)
+            result_file.write([file_ingest.flatten_result(count + i, result) for i, result in enumerate(results)])
+            count += len(results)
+        path = result_file.close()
+    except file_ingest.FileInputError as e:
+        result_file.discard()
+        log_invalid_input(str(e))
+        return jsonify({"error": str(e), "count": count}), 400
+    except Exception as e:
+        result_file.discard()
+        print(f"Error processing file: {str(e)}")
+        return jsonify({"error": str(e), "count": count}), 500
+    finally:
+        if writer:
+            # Keep what was analyzed even if the file turned out to be invalid
+            writer.flush()
+        if conn:
             conn.close()
-            
+        if input_copy:
+            input_copy.close()
+
+    # The open handle keeps the data readable after the temporary file is unlinked
+    result_handle = open(path, "rb")
+    result_file.discard()
+    response = send_file(
+        result_handle,
+        mimetype=file_ingest.MIMETYPES[output_format],
+        as_attachment=True,
+        download_name=f"capsense_results.{output_format}"
+    )
+    response.headers["X-Rows-Processed"] = str(count)
+    if writer:
+        db_report = writer.report()
+        if db_report["rows_failed"]:
+            print(f"[DB ERROR] respond_file: {db_report['rows_failed']} rows not stored: {db_report['errors']}")
+        response.headers["X-DB-Rows-Written"] = str(db_report["rows_written"])
+        response.headers["X-DB-Rows-Failed"] = str(db_report["rows_failed"])
+    return response
+
+@app.route('/api/jobs', methods=['POST'])
+def create_job():
+    """
+    Queues a batch for background analysis and returns immediately.
+    JSON payload example: {"customer_texts": ["...", "..."], "store_in_db": true}
+    Returns 202 with {"job_id": ..., "status_url": ...}; poll the status URL for progress.
+    """
+    try:
+        payload = request.get_json(force=True)
+        if not payload or "customer_texts" not in payload:
+            return jsonify({"error": "Field 'customer_texts' is required."}), 400
+
+        texts = payload["customer_texts"]
+        if not isinstance(texts, list):
+            return jsonify({"error": "'customer_texts' must be a list of strings."}), 400
+
+        job_id = jobs.submit_job(texts, store_in_db=bool(payload.get("store_in_db", True)))
+        return jsonify({
+            "job_id": job_id,
+            "status": "queued",
+            "status_url": f"/api/jobs/{job_id}",
+            "results_url": f"/api/jobs/{job_id}/results"
+        }), 202
     except Exception as e:
-        print(f"Error processing batch: {str(e)}")
-        # Continue processing even if DB operations fail
+        print(f"Error creating job: {str(e)}")
+        return jsonify({"error": str(e)}), 500
 
-    return jsonify(results), 200
+@app.route('/api/jobs/<job_id>', methods=['GET'])
+def job_status(job_id):
+    """
+    Returns a job's status and progress.
+    ?offset=&limit= also return a page of the results finished so far.
+    """
+    try:
+        offset = max(0, int(request.args.get("offset", 0)))
+        limit = min(max(0, int(request.args.get("limit", 0))), 1000)
+    except ValueError:
+        return jsonify({"error": "'offset' and 'limit' must be integers."}), 400
+
+    try:
+        return jsonify(jobs.get_job(job_id, offset=offset, limit=limit)), 200
+    except jobs.JobNotFound:
+        return jsonify({"error": f"Job '{job_id}' not found"}), 404
+
+@app.route('/api/jobs/<job_id>/results', methods=['GET'])
+def job_results(job_id):
+    """
+    Returns the full output of a completed job as a JSON array, streamed from the job store.
+    """
+    try:
+        job = jobs.get_job(job_id)
+    except jobs.JobNotFound:
+        return jsonify({"error": f"Job '{job_id}' not found"}), 404
+    if job["status"] != "completed":
+        return jsonify({"error": f"Job is {job['status']}", "job": job}), 409
+
+    def generate():
+        yield "["
+        for n, result in enumerate(jobs.iter_job_results(job_id)):
+            yield ("," if n else "") + result
+        yield "]"
+
+    return Response(generate(), mimetype="application/json")
+
+@app.route('/api/jobs/<job_id>', methods=['DELETE'])
+def cancel_job(job_id):
+    """
+    Cancels a queued or running job. Results finished before the cancel are kept.
+    """
+    try:
+        return jsonify(jobs.cancel_job(job_id)), 200
+    except jobs.JobNotFound:
+        return jsonify({"error": f"Job '{job_id}' not found"}), 404
 
 @app.route('/batch-analyze', methods=['POST'])
 def batch_analyze():
@@ -373,31 +559,22 @@ def batch_analyze():
 
         text = payload["text"]
         
-        # Classification
-        sentiment_result = classify_sentiment(text)
-        sarcasm_result = detect_sarcasm(text)
-        emotion_result = detect_emotion(text)
+        # Classification (served from the result cache for repeated texts)
+        sentiment_result, classification_data = classify_texts([text])[0]
         
         # Generate response
-        classification_data = {
-            "sentiment": sentiment_result["sentiment"],
-            "sentiment_confidence": sentiment_result["confidence"],
-            "sarcasm": sarcasm_result["sarcasm"],
-            "sarcasm_confidence": sarcasm_result["confidence"],
-            "emotion": emotion_result["emotion"],
-            "emotion_confidence": emotion_result["confidence"]
-        }
-        
-        ai_response = generate_response(text, classification_data)
+        with metrics.timer("generate_response"):
+            ai_response = generate_response(text, classification_data)
         
         # Calculate F1 score
-        f1_score = compute_f1_score(sentiment_result)
+        with metrics.timer("compute_f1_score"):
+            f1_score = compute_f1_score(sentiment_result)
         
         # Note: This endpoint doesn't use the database at all, so no changes needed here
         
         return jsonify({
-            "emotion": emotion_result["emotion"],
-            "sarcasm": "Yes" if sarcasm_result["sarcasm"] else "No",
+            "emotion": classification_data["emotion"],
+            "sarcasm": "Yes" if classification_data["sarcasm"] else "No",
             "aspects": "Product quality, Customer service", # Placeholder
             "classification": sentiment_result["sentiment"],
             "response": ai_response["response_text"],
@@ -409,48 +586,110 @@ def batch_analyze():
         print(f"Error in batch analysis: {str(e)}")
         return jsonify({"error": str(e)}), 500
 
+@app.route('/metrics', methods=['GET'])
+def prometheus_metrics():
+    """
+    Stage latencies, request counts and error counters in the Prometheus text format.
+    """
+    return Response(metrics.render(), mimetype="text/plain; version=0.0.4")
+
+@app.route('/api/models', methods=['GET'])
+def model_status():
+    """
+    Reports which models are registered and which are loaded in this worker.
+    """
+    return jsonify(model_registry.status()), 200
+
+@app.route('/api/memory', methods=['GET'])
+def memory_status():
+    """
+    Reports the memory usage of the worker that serves the request.
+    Compare 'pss_kb' across workers to see how much is shared with the master.
+    """
+    return jsonify(model_registry.memory_report()), 200
+
+@app.route('/api/cache', methods=['GET'])
+def cache_status():
+    """
+    Reports hit/miss counters for the result caches in this worker.
+    """
+    return jsonify(result_cache.all_stats()), 200
+
+@app.route('/api/evaluation', methods=['GET'])
+def evaluation_status():
+    """
+    Returns the measured precision, recall, F1 and confusion matrix of each model.
+    """
+    return jsonify(evaluation.engine.summary()), 200
+
+@app.route('/api/evaluation/labels', methods=['POST'])
+def evaluation_labels():
+    """
+    Records labelled texts for the running metrics.
+    Expects: {"items": [{"text": "...", "sentiment": "Negative", "sarcasm": true, "emotion": "anger"}, ...]}
+    Any of the labels may be omitted.
+    """
+    data = request.get_json(silent=True) or {}
+    items = data.get("items")
+    if not isinstance(items, list):
+        return jsonify({"error": "'items' must be a list of {text, sentiment?, sarcasm?, emotion?} objects."}), 400
+    recorded = evaluation.record_labels(items)
+    return jsonify({"recorded": recorded, "metrics": evaluation.engine.summary()}), 200
+
 @app.route('/api/dashboard', methods=['GET'])
 def view_dashboard():
     """
-    Fetches recent feedback records from the DB.
-    Adjust query/column names to match your actual table.
+    Returns feedback records newest first, one page at a time.
+    Query args: limit, after (the cursor from the previous page's X-Next-Cursor
+    header), sentiment, emotion, from, to. The body is the array of records.
     """
     try:
-        conn = get_db_connection()
-        if not conn:
-            return jsonify({"error": "Database connection not available"}), 503
-            
-        cursor = conn.cursor()
-
-        select_query = """
-        SELECT TOP 10 CustomerText, Sentiment, ResponseText, EmpathyScore, SarcasmDetected, Emotion, CreatedAt
-        FROM FeedbackResponses
-        ORDER BY CreatedAt DESC;
-        """
-        cursor.execute(select_query)
-        rows = cursor.fetchall()
-
-        results = []
-        for row in rows:
-            results.append({
-                "customer_text": row[0],
-                "sentiment": row[1],
-                "response_text": row[2],
-                "empathy_score": row[3],
-                "sarcasm_detected": row[4],
-                "emotion": row[5],
-                "created_at": str(row[6])
-            })
-
-        cursor.close()
-        conn.close()
+        filters = dashboard.parse_filters(request.args)
+        limit = dashboard.parse_limit(request.args.get("limit"))
+        after = dashboard.parse_cursor(request.args["after"]) if request.args.get("after") else None
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
 
-        return jsonify(results), 200
+    conn = get_db_connection()
+    if not conn:
+        return jsonify({"error": "Database connection not available"}), 503
+
+    try:
+        with metrics.timer("db_dashboard_page"):
+            results, next_cursor = dashboard.fetch_page(conn, DB_BACKEND, filters, limit, after)
+        response = jsonify(results)
+        if next_cursor:
+            response.headers[dashboard.NEXT_CURSOR_HEADER] = next_cursor
+        return response, 200
     except Exception as e:
         return jsonify({"error": f"Database error: {str(e)}"}), 500
+    finally:
+        conn.close()
+
+
+@app.route('/api/dashboard/aggregates', methods=['GET'])
+def dashboard_aggregates():
+    """
+    Counts per sentiment, emotion and day for the records matching the filters
+    (sentiment, emotion, from, to).
+    """
+    try:
+        filters = dashboard.parse_filters(request.args)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    conn = get_db_connection()
+    if not conn:
+        return jsonify({"error": "Database connection not available"}), 503
 
+    try:
+        with metrics.timer("db_dashboard_aggregates"):
+            return jsonify(dashboard.fetch_aggregates(conn, DB_BACKEND, filters)), 200
+    except Exception as e:
+        return jsonify({"error": f"Database error: {str(e)}"}), 500
+    finally:
+        conn.close()
 
 if __name__ == '__main__':
-    # Initialize the database on startup
-    initialize_database()
+    # Stored feedback is kept across restarts; 'python migrations.py reset --yes' empties it
     app.run(host='0.0.0.0', debug=True, port=5000)
\ No newline at end of file
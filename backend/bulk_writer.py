@@ -0,0 +1,134 @@
+"""
+bulk_writer.py
+Buffered bulk inserts for result rows.
+Rows are collected in memory and written in chunks, one round trip per chunk
+instead of one per row:
+  - SQL Server (pyodbc): executemany with fast_executemany enabled
+  - SQLite: multi-row INSERT ... VALUES (...), (...) statements
+Each chunk is committed on its own, so a bad row only loses its chunk and the
+failure is reported instead of silently dropping the whole batch.
+An after_insert(cursor, dialect, rows, columns) hook runs in each chunk's
+transaction, before the commit (used to keep the daily rollup in step).
+"""
+import os
+
+import metrics
+
+DEFAULT_CHUNK_SIZE = int(os.getenv("CAPSENSE_DB_INSERT_CHUNK", "500"))
+
+# SQLite's default limit on bound parameters per statement (older builds)
+SQLITE_MAX_VARIABLES = 999
+
+
+class BulkInsertWriter:
+    """
+    Collects rows for `table` and flushes them in chunks of `chunk_size`.
+
+    Usage:
+        with BulkInsertWriter(conn, "FeedbackResponses", columns) as writer:
+            for row in rows:
+                writer.add(row)
+        print(writer.report())
+    """
+    def __init__(self, conn, table, columns, chunk_size=None, dialect="mssql", after_insert=None):
+        self.conn = conn
+        self.table = table
+        self.columns = list(columns)
+        self.chunk_size = max(1, chunk_size or DEFAULT_CHUNK_SIZE)
+        self.dialect = dialect
+        self.after_insert = after_insert
+
+        self.rows_written = 0
+        self.rows_failed = 0
+        self.errors = []
+        self._buffer = []
+        self._chunks_flushed = 0
+
+        placeholders = "(" + ", ".join("?" for _ in self.columns) + ")"
+        self._row_placeholders = placeholders
+        self._insert_prefix = f"INSERT INTO {self.table} ({', '.join(self.columns)}) VALUES "
+
+    def add(self, row):
+        """
+        Buffers one row (a tuple in `columns` order), flushing when the chunk is full.
+        """
+        self._buffer.append(tuple(row))
+        if len(self._buffer) >= self.chunk_size:
+            self.flush()
+
+    def flush(self):
+        """
+        Writes and commits the buffered rows. Returns True if the chunk was written.
+        """
+        if not self._buffer:
+            return True
+
+        rows = self._buffer
+        self._buffer = []
+        chunk_index = self._chunks_flushed
+        self._chunks_flushed += 1
+
+        cursor = None
+        try:
+            cursor = self.conn.cursor()
+            with metrics.timer("db_insert"):
+                if self.dialect == "sqlite":
+                    self._insert_multirow(cursor, rows)
+                else:
+                    self._insert_executemany(cursor, rows)
+                if self.after_insert is not None:
+                    self.after_insert(cursor, self.dialect, rows, self.columns)
+            with metrics.timer("db_commit"):
+                self.conn.commit()
+            self.rows_written += len(rows)
+            return True
+        except Exception as e:
+            print(f"[DB ERROR] Bulk insert of chunk {chunk_index} ({len(rows)} rows) failed: {str(e)}")
+            try:
+                self.conn.rollback()
+            except Exception:
+                pass
+            self.rows_failed += len(rows)
+            self.errors.append({
+                "chunk": chunk_index,
+                "rows": len(rows),
+                "error": str(e)
+            })
+            return False
+        finally:
+            if cursor is not None:
+                try:
+                    cursor.close()
+                except Exception:
+                    pass
+
+    def _insert_executemany(self, cursor, rows):
+        # pyodbc sends the whole parameter array in one round trip with this flag
+        if hasattr(cursor, "fast_executemany"):
+            cursor.fast_executemany = True
+        cursor.executemany(self._insert_prefix + self._row_placeholders + ";", rows)
+
+    def _insert_multirow(self, cursor, rows):
+        rows_per_statement = max(1, SQLITE_MAX_VARIABLES // len(self.columns))
+        for start in range(0, len(rows), rows_per_statement):
+            part = rows[start:start + rows_per_statement]
+            sql = self._insert_prefix + ", ".join(self._row_placeholders for _ in part) + ";"
+            params = [value for row in part for value in row]
+            cursor.execute(sql, params)
+
+    def report(self):
+        """
+        Returns a summary of what was written and which chunks failed.
+        """
+        return {
+            "rows_written": self.rows_written,
+            "rows_failed": self.rows_failed,
+            "errors": list(self.errors)
+        }
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.flush()
+        return False
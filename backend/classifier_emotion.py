@@ -1,42 +1,243 @@
-import joblib
+import functools
 import os
+import re
+import sys
 import nltk
 from nltk.corpus import stopwords
 from nltk.tokenize import word_tokenize
 
-# Ensure NLTK data is available
-nltk.download('punkt')
-nltk.download('stopwords')
+import model_registry
+from scoring import predict_with_confidence
 
 # Load model and vectorizer
 BASE_DIR = '/home/azureuser/Capgemini_SentimentApp_Remake/backend/models'
-MODEL_PATH = os.path.join(BASE_DIR, 'emotion_classifier.pkl')
-VECTORIZER_PATH = os.path.join(BASE_DIR, 'emotion_vectorizer.pkl')
-
-try:
-    model = joblib.load(MODEL_PATH)
-    vectorizer = joblib.load(VECTORIZER_PATH)
-except Exception as e:
-    print(f"[Emotion Classifier] Failed to load model or vectorizer: {e}")
-    model, vectorizer = None, None
-
-def preprocess_text(text):
-    stop_words = set(stopwords.words('english'))
-    words = word_tokenize(text.lower())
+MODEL_PATH = model_registry.artifact_path(BASE_DIR, 'emotion_classifier.pkl')
+VECTORIZER_PATH = model_registry.artifact_path(BASE_DIR, 'emotion_vectorizer.pkl')
+
+# 'nltk' (default) uses word_tokenize exactly as the model was trained;
+# 'regex' uses fast_tokenize(), which skips punkt sentence splitting and the
+# multi-pass treebank regexes. Check it with compare_tokenizers() before switching.
+TOKENIZER_MODE = os.getenv("CAPSENSE_EMOTION_TOKENIZER", "nltk").lower()
+
+NLTK_RESOURCES = {
+    'punkt': 'tokenizers/punkt',
+    'punkt_tab': 'tokenizers/punkt_tab',  # used by word_tokenize in newer NLTK releases
+    'stopwords': 'corpora/stopwords'
+}
+
+def ensure_nltk_data():
+    """
+    Ensures NLTK data is available. Only downloads resources that are missing,
+    so a warm worker doesn't hit the network on startup.
+    The punkt models are skipped in regex tokenizer mode.
+    """
+    for package, resource_path in NLTK_RESOURCES.items():
+        if TOKENIZER_MODE == "regex" and package.startswith("punkt"):
+            continue
+        try:
+            nltk.data.find(resource_path)
+        except LookupError:
+            nltk.download(package)
+
+def _load_emotion_model():
+    """
+    Returns a (model, vectorizer) tuple, or None if they could not be loaded.
+    """
+    ensure_nltk_data()
+    try:
+        model = model_registry.load_artifact(MODEL_PATH)
+        vectorizer = model_registry.load_artifact(VECTORIZER_PATH)
+        return model, vectorizer
+    except Exception as e:
+        print(f"[Emotion Classifier] Failed to load model or vectorizer: {e}")
+        return None
+
+# Loaded on first use, see model_registry
+model_registry.register("emotion", _load_emotion_model,
+                        version=lambda: model_registry.artifact_version(MODEL_PATH, VECTORIZER_PATH))
+
+@functools.lru_cache(maxsize=None)
+def get_stop_words():
+    """
+    Returns the English stopword set, read from the NLTK corpus only once.
+    """
+    return frozenset(stopwords.words('english'))
+
+# Characters NLTK's word tokenizer always splits off as separate (non-alphanumeric)
+# tokens; replacing them with a space has the same effect once those are dropped.
+_SPLIT_RE = re.compile(
+    "[\u00ab\u201c\u2018\u201e\u00bb\u201d\u2019`;@#$%&?!*\\[\\](){}<>\"\u2012-\u2015]"
+    r"|\.{2,}|--|[:,](?!\d)"
+)
+# Contractions split by word_tokenize's MacIntyre rules, e.g. cannot -> can not.
+# Case-insensitive like NLTK's; NLTK pads the text with spaces, so its trailing
+# \s also matches at the end of the text.
+_CONTRACTIONS_RE = [
+    (re.compile(pattern, re.IGNORECASE), r"\1 \2")
+    for pattern in (
+        r"\b(can)(not)\b",
+        r"\b(d)('ye)\b",
+        r"\b(gim)(me)\b",
+        r"\b(gon)(na)\b",
+        r"\b(got)(ta)\b",
+        r"\b(lem)(me)\b",
+        r"\b(more)('n)\b",
+        r"\b(wan)(na)(?=\s|$)",
+    )
+]
+_LEADING_QUOTE_RE = re.compile(r"^'(?!(?:re|ve|ll|m|t|s|d|n|ye)\b)(?=\w)")
+_CLITIC_RE = re.compile(r"^(.*[^' ])('s|'m|'d|')$")
+_CLITIC2_RE = re.compile(r"^(.*[^' ])('ll|'re|'ve|n't)$")
+# Abbreviations punkt does not treat as sentence ends, so their period stays attached
+_ABBREVIATIONS = frozenset([
+    "mr", "mrs", "ms", "dr", "prof", "st", "jr", "sr", "vs", "etc", "inc", "ltd",
+    "co", "corp", "no", "dept", "approx", "e.g", "i.e", "u.s", "a.m", "p.m"
+])
+
+def fast_tokenize(text):
+    """
+    Regex tokenizer that reproduces the alphanumeric tokens NLTK's word_tokenize
+    returns for lowercased text, without punkt sentence splitting.
+    Tokens word_tokenize would return with punctuation attached (e.g. 'well-known',
+    '3.5', 'mr.') are returned the same way, so preprocess_text drops them as before.
+    """
+    text = _SPLIT_RE.sub(" ", text)
+    for regexp, substitution in _CONTRACTIONS_RE:
+        text = regexp.sub(substitution, text)
+
+    tokens = []
+    for chunk in text.split():
+        chunk = _LEADING_QUOTE_RE.sub("", chunk)
+        # Sentence-final period, split off by punkt + treebank
+        if len(chunk) > 1 and chunk[-1] == "." and chunk[-2] != ".":
+            base = chunk[:-1]
+            if base not in _ABBREVIATIONS and not (len(base) == 1 and base.isalpha()):
+                chunk = base
+        match = _CLITIC_RE.match(chunk)
+        if match:
+            chunk = match.group(1)
+        match = _CLITIC2_RE.match(chunk)
+        if match:
+            chunk = match.group(1)
+        tokens.extend(chunk.split())
+    return tokens
+
+def preprocess_text(text, tokenizer=None):
+    """
+    Lowercases, tokenizes and drops stopwords and non-alphanumeric tokens.
+    `tokenizer` is 'nltk' or 'regex' (default: CAPSENSE_EMOTION_TOKENIZER).
+    """
+    stop_words = get_stop_words()
+    if (tokenizer or TOKENIZER_MODE) == "regex":
+        words = fast_tokenize(text.lower())
+    else:
+        words = word_tokenize(text.lower())
     return ' '.join([word for word in words if word.isalnum() and word not in stop_words])
 
+def preprocess_texts(texts, tokenizer=None):
+    """
+    Bulk version of preprocess_text. Raises if any text is not a string.
+    """
+    stop_words = get_stop_words()
+    tokenize = fast_tokenize if (tokenizer or TOKENIZER_MODE) == "regex" else word_tokenize
+    return [
+        ' '.join([word for word in tokenize(text.lower()) if word.isalnum() and word not in stop_words])
+        for text in texts
+    ]
+
+# Edge cases every parity check includes, next to the caller's sample texts
+PARITY_SAMPLES = (
+    "I wanna", "Wanna talk to a manager", "i wanna go home", "Cannot log in", "Gonna cancel",
+    "Gimme a refund", "Lemme know", "I gotta say, great service!", "D'ye think so?",
+    "It costs more'n it should", "It's not working... again", "Mr. Smith was helpful.",
+    "They're 'great' at this", "don't, won't, can't"
+)
+
+def compare_tokenizers(texts=()):
+    """
+    Parity check between the NLTK and regex preprocessing on sample texts, plus
+    PARITY_SAMPLES. Also compares the emotion vectorizer's features, which is
+    what the model sees.
+    Returns {"total", "identical", "same_features", "mismatches": [...]}.
+    """
+    loaded = model_registry.get("emotion")
+    vectorizer = loaded[1] if loaded else None
+
+    report = {"total": 0, "identical": 0, "same_features": 0, "mismatches": []}
+    for text in list(PARITY_SAMPLES) + list(texts):
+        expected = preprocess_text(text, tokenizer="nltk")
+        actual = preprocess_text(text, tokenizer="regex")
+        report["total"] += 1
+        if expected == actual:
+            report["identical"] += 1
+            report["same_features"] += 1
+            continue
+        same_features = False
+        if vectorizer is not None:
+            diff = vectorizer.transform([expected]) - vectorizer.transform([actual])
+            same_features = diff.nnz == 0
+        if same_features:
+            report["same_features"] += 1
+        else:
+            report["mismatches"].append({"text": text, "nltk": expected, "regex": actual})
+    return report
+
 def detect_emotion(text):
     """
     Returns: {"emotion": label, "confidence": 0.8} or fallback.
     """
-    if not model or not vectorizer:
-        return {"emotion": "neutral", "confidence": 0.5}
-    
+    return detect_emotion_batch([text])[0]
+
+def detect_emotion_batch(texts):
+    """
+    Batch version of detect_emotion: one transform and one predict_proba over all texts.
+    Returns a list of {"emotion": label, "confidence": float} in the same order as `texts`.
+    """
+    loaded = model_registry.get("emotion")
+    if not loaded:
+        return [{"emotion": "neutral", "confidence": 0.5} for _ in texts]
+    model, vectorizer = loaded
+
+    results = [None] * len(texts)
     try:
-        processed = preprocess_text(text)
-        X = vectorizer.transform([processed])
-        prediction = model.predict(X)[0]
-        return {"emotion": prediction, "confidence": 0.8}
+        processed = preprocess_texts(texts)
+        valid_idx = list(range(len(texts)))
+    except Exception:
+        # Some rows are unusable; preprocess one by one to find them
+        valid_idx = []
+        processed = []
+        for i, text in enumerate(texts):
+            try:
+                processed.append(preprocess_text(text))
+                valid_idx.append(i)
+            except Exception as e:
+                print(f"[Emotion Classifier] Error: {e}")
+                results[i] = {"emotion": "neutral", "confidence": 0.5}
+
+    if not processed:
+        return results
+
+    try:
+        X = vectorizer.transform(processed)
+        predictions, confidences = predict_with_confidence(model, X)
+        for i, prediction, confidence in zip(valid_idx, predictions, confidences):
+            results[i] = {"emotion": prediction, "confidence": float(confidence)}
     except Exception as e:
         print(f"[Emotion Classifier] Error: {e}")
-        return {"emotion": "neutral", "confidence": 0.5}
+        for i in valid_idx:
+            results[i] = {"emotion": "neutral", "confidence": 0.5}
+    return results
+
+
+if __name__ == '__main__':
+    # Parity check: python classifier_emotion.py samples.txt (one text per line)
+    if len(sys.argv) != 2:
+        print("Usage: python classifier_emotion.py <texts.txt>")
+        sys.exit(1)
+    with open(sys.argv[1], encoding='utf-8') as f:
+        sample = [line.strip() for line in f if line.strip()]
+    parity = compare_tokenizers(sample)
+    print(f"{parity['identical']}/{parity['total']} identical, "
+          f"{parity['same_features']}/{parity['total']} with identical features")
+    for mismatch in parity["mismatches"][:20]:
+        print(mismatch)
@@ -1,156 +1,279 @@
 """
 classifier_sarcasm.py
-Integrates a Hugging Face pipeline for sarcasm detection,
+Integrates the Hugging Face irony model (run through transformer_engine) for sarcasm detection,
 plus an optional local Naive Bayes fallback stored in 'models/'.
+Both models are loaded on first use through model_registry.
 """
 
 import os
-import joblib
-import pandas as pd
-from sklearn.feature_extraction.text import CountVectorizer
-from sklearn.naive_bayes import MultinomialNB
-from sklearn.model_selection import train_test_split
-from sklearn.metrics import accuracy_score, precision_score, recall_score, f1_score
-from transformers import pipeline
-
-# Initialize Hugging Face pipeline
-try:
-    sarcasm_detector = pipeline("text-classification", model="cardiffnlp/twitter-roberta-base-irony")
-    print("Initialized Hugging Face sarcasm pipeline successfully")
-except Exception as e:
-    print(f"Warning: Failed to initialize Hugging Face pipeline: {str(e)}")
-    sarcasm_detector = None
+
+import metrics
+import model_registry
+import transformer_engine
+from features import rows_for
+from scoring import predict_with_proba, class_probability, DEFAULT_CONFIDENCE
+
+HF_MODEL_NAME = "cardiffnlp/twitter-roberta-base-irony"
+
+# local | pipeline | cascade, see detect_sarcasm_batch
+SARCASM_MODE = os.getenv("CAPSENSE_SARCASM_MODE", "local").lower()
+# Cascade uncertainty band on the local model's P(sarcastic)
+CASCADE_BAND_LOW = float(os.getenv("CAPSENSE_SARCASM_BAND_LOW", "0.35"))
+CASCADE_BAND_HIGH = float(os.getenv("CAPSENSE_SARCASM_BAND_HIGH", "0.65"))
+
+sarcasm_rows = metrics.counter(
+    "capsense_sarcasm_rows_total",
+    "Texts scored by the sarcasm detector, by route (local, escalated, escalation_failed, pipeline, fallback).",
+    ("route",)
+)
 
 # Define the base directory for models using absolute path
 BASE_DIR = '/home/azureuser/Capgemini_SentimentApp_Remake/backend/models'
-MODEL_PATH = os.path.join(BASE_DIR, "sarcasm_classifier.pkl")
-VECTORIZER_PATH = os.path.join(BASE_DIR, "sarcasm_vectorizer.pkl")
-
-model = None
-vectorizer = None
-try:
-    if os.path.exists(MODEL_PATH) and os.path.exists(VECTORIZER_PATH):
-        model = joblib.load(MODEL_PATH)
-        vectorizer = joblib.load(VECTORIZER_PATH)
-        print(f"Loaded local sarcasm model from {MODEL_PATH}")
-        print(f"Loaded local sarcasm vectorizer from {VECTORIZER_PATH}")
-    else:
-        print(f"Warning: Local sarcasm model not found at {MODEL_PATH} or {VECTORIZER_PATH}")
-except Exception as e:
-    print(f"Warning: Failed to load local sarcasm model: {str(e)}")
-    model, vectorizer = None, None
+MODEL_PATH = model_registry.artifact_path(BASE_DIR, "sarcasm_classifier.pkl")
+VECTORIZER_PATH = model_registry.artifact_path(BASE_DIR, "sarcasm_vectorizer.pkl")
 
+# torch | onnx: how the Hugging Face model is run (export the ONNX model with export_onnx.py)
+SARCASM_BACKEND = os.getenv("CAPSENSE_SARCASM_BACKEND", "torch").lower()
+ONNX_MODEL_PATH = os.getenv("CAPSENSE_ONNX_MODEL_PATH", os.path.join(BASE_DIR, "irony_onnx", "model.onnx"))
 
-def detect_sarcasm(text):
+def _load_sarcasm_pipeline():
     """
-    Returns {"sarcasm": bool, "confidence": float}
+    Initializes the transformer backend for the Hugging Face model:
+    the batched torch engine, or the exported ONNX model when
+    CAPSENSE_SARCASM_BACKEND=onnx. torch/onnxruntime are only imported here,
+    so workers that never fall back to the transformer don't pay for them.
+    """
+    try:
+        if SARCASM_BACKEND == "onnx":
+            from transformer_engine import OnnxClassifier
+            sarcasm_detector = OnnxClassifier(ONNX_MODEL_PATH)
+        else:
+            from transformer_engine import TransformerClassifier
+            sarcasm_detector = TransformerClassifier(HF_MODEL_NAME)
+        print(f"Initialized Hugging Face sarcasm model successfully: {sarcasm_detector.describe()}")
+        return sarcasm_detector
+    except Exception as e:
+        print(f"Warning: Failed to initialize Hugging Face model: {str(e)}")
+        return None
+
+def _pipeline_version():
+    if SARCASM_BACKEND == "onnx":
+        return HF_MODEL_NAME + ":onnx:" + model_registry.artifact_version(ONNX_MODEL_PATH)
+    return HF_MODEL_NAME + (":int8" if transformer_engine.QUANTIZE else "")
+
+def _load_sarcasm_model():
+    """
+    Loads the local model and vectorizer if they exist.
+    Returns a (model, vectorizer) tuple, or None if they are not available.
+    """
+    try:
+        if os.path.exists(MODEL_PATH) and os.path.exists(VECTORIZER_PATH):
+            model = model_registry.load_artifact(MODEL_PATH)
+            vectorizer = model_registry.load_artifact(VECTORIZER_PATH)
+            print(f"Loaded local sarcasm model from {MODEL_PATH}")
+            print(f"Loaded local sarcasm vectorizer from {VECTORIZER_PATH}")
+            return model, vectorizer
+        else:
+            print(f"Warning: Local sarcasm model not found at {MODEL_PATH} or {VECTORIZER_PATH}")
+    except Exception as e:
+        print(f"Warning: Failed to load local sarcasm model: {str(e)}")
+    return None
+
+# Loaded on first use, see model_registry
+model_registry.register("sarcasm", _load_sarcasm_model,
+                        version=lambda: model_registry.artifact_version(MODEL_PATH, VECTORIZER_PATH))
+model_registry.register("sarcasm_pipeline", _load_sarcasm_pipeline, version=_pipeline_version)
+
+
+def _coerce_text(text):
+    """
+    Makes sure the input is a non-empty, stripped string.
+    Returns the text, or None if it is empty or cannot be converted.
     """
-    # Access global variables
-    global model, vectorizer, sarcasm_detector
-    
-    # Make sure text is a string
     try:
         if isinstance(text, (int, float)) or hasattr(text, 'dtype'):  # Handle numpy types
             text = str(text)
-        
+
         text = text.strip()
-        if not text:
-            return {"sarcasm": False, "confidence": 0.0}
+        return text or None
     except Exception as e:
         print(f"Error converting input to string: {e}")
-        return {"sarcasm": False, "confidence": 0.0}
-    
-    # Try the local model first
-    if model and vectorizer:
-        try:
-            # Vectorize the text
-            text_vectorized = vectorizer.transform([text])
-            
-            # Predict with the model
-            pred_label = model.predict(text_vectorized)[0]
-            confidence = float(model.predict_proba(text_vectorized)[0][1])  # Probability of class 1
-            
-            return {"sarcasm": bool(pred_label == 1), "confidence": confidence}
-        except Exception as e:
-            print(f"Error using local sarcasm model: {str(e)}")
-            # Fall through to Hugging Face if local model fails
-    
-    # Use Hugging Face pipeline as backup
-    if sarcasm_detector:
-        try:
-            result = sarcasm_detector(text)[0]
-            label = result["label"]
-            score = float(result["score"])
-            is_sarcastic = (label.upper() == "IRONY") # Note: This model uses "IRONY" rather than "SARCASM"
-            return {"sarcasm": is_sarcastic, "confidence": score}
-        except Exception as e:
-            print(f"Error using Hugging Face sarcasm model: {str(e)}")
-    
+        return None
+
+def detect_sarcasm(text):
+    """
+    Returns {"sarcasm": bool, "confidence": float}
+    """
+    return detect_sarcasm_batch([text])[0]
+
+def _score_local(texts, features=None, rows=None):
+    """
+    Scores texts with the local Naive Bayes model.
+    `features`/`rows` optionally give precomputed features (see features.py) and the
+    rows of that matrix that correspond to `texts`.
+    Returns a list of P(sarcastic) per text, or None if the model is unavailable or fails.
+    """
+    loaded = model_registry.get("sarcasm")
+    if not loaded:
+        return None
+    model, vectorizer = loaded
+    try:
+        # Vectorize the texts, unless the fused extractor already did
+        texts_vectorized = rows_for(features, vectorizer, rows)
+        if texts_vectorized is None:
+            texts_vectorized = vectorizer.transform(texts)
+
+        # One scoring pass gives both the label and the probability of class 1
+        pred_labels, proba = predict_with_proba(model, texts_vectorized)
+        if proba is not None:
+            return [float(p) for p in class_probability(model, proba, 1)]
+        return [1.0 if label == 1 else 0.0 for label in pred_labels]
+    except Exception as e:
+        print(f"Error using local sarcasm model: {str(e)}")
+        return None
+
+def _score_pipeline(texts):
+    """
+    Scores texts with the Hugging Face pipeline in one call.
+    Returns a list of (is_sarcastic, score of the predicted label), or None on failure.
+    """
+    sarcasm_detector = model_registry.get("sarcasm_pipeline")
+    if not sarcasm_detector:
+        return None
+    try:
+        outputs = sarcasm_detector(texts)
+        # Note: This model uses "IRONY" rather than "SARCASM"
+        return [(result["label"].upper() == "IRONY", float(result["score"])) for result in outputs]
+    except Exception as e:
+        print(f"Error using Hugging Face sarcasm model: {str(e)}")
+        return None
+
+def sarcasm_config_version():
+    """
+    Describes the routing settings that change sarcasm results, for cache keys.
+    """
+    if SARCASM_MODE == "cascade":
+        return f"cascade:{CASCADE_BAND_LOW}-{CASCADE_BAND_HIGH}"
+    return SARCASM_MODE
+
+def detect_sarcasm_batch(texts, features=None):
+    """
+    Batch version of detect_sarcasm.
+    The local model vectorizes and scores all texts in one pass; the Hugging Face
+    pipeline receives the whole list at once.
+    CAPSENSE_SARCASM_MODE picks the route:
+      - local (default): Naive Bayes, with the pipeline as a backup
+      - pipeline: the transformer for every text, with Naive Bayes as a backup
+      - cascade: Naive Bayes for every text; only texts whose P(sarcastic) falls in
+        [CAPSENSE_SARCASM_BAND_LOW, CAPSENSE_SARCASM_BAND_HIGH] go to the transformer
+    `features` is this model's entry from features.extract_features(texts), if already computed.
+    Returns a list of {"sarcasm": bool, "confidence": float} in the same order as `texts`.
+    """
+    results = [None] * len(texts)
+    valid_idx = []
+    valid_texts = []
+    for i, text in enumerate(texts):
+        text = _coerce_text(text)
+        if text is None:
+            results[i] = {"sarcasm": False, "confidence": 0.0}
+        else:
+            valid_idx.append(i)
+            valid_texts.append(text)
+
+    if not valid_texts:
+        return results
+
+    if SARCASM_MODE != "pipeline":
+        probabilities = _score_local(valid_texts, features, valid_idx)
+        if probabilities is not None:
+            for i, probability in zip(valid_idx, probabilities):
+                results[i] = {"sarcasm": probability >= 0.5, "confidence": probability}
+            if SARCASM_MODE == "cascade":
+                _escalate_uncertain(results, valid_idx, valid_texts)
+            else:
+                sarcasm_rows.inc("local", amount=len(valid_idx))
+            return results
+
+    # Hugging Face pipeline (primary in pipeline mode, otherwise the backup)
+    outputs = _score_pipeline(valid_texts)
+    if outputs is not None:
+        for i, (is_sarcastic, score) in zip(valid_idx, outputs):
+            results[i] = {"sarcasm": is_sarcastic, "confidence": score}
+        sarcasm_rows.inc("pipeline", amount=len(valid_idx))
+        return results
+
+    if SARCASM_MODE == "pipeline":
+        probabilities = _score_local(valid_texts, features, valid_idx)
+        if probabilities is not None:
+            for i, probability in zip(valid_idx, probabilities):
+                results[i] = {"sarcasm": probability >= 0.5, "confidence": probability}
+            sarcasm_rows.inc("local", amount=len(valid_idx))
+            return results
+
     # Fallback if both methods fail
-    return {"sarcasm": False, "confidence": 0.5}
+    for i in valid_idx:
+        results[i] = {"sarcasm": False, "confidence": 0.5}
+    sarcasm_rows.inc("fallback", amount=len(valid_idx))
+    return results
 
-def train_sarcasm_model(dataset_path="sarcasm_dataset.csv"):
+def _escalate_uncertain(results, valid_idx, valid_texts):
+    """
+    Cascade step: re-scores, in one batch, the texts the local model is unsure
+    about. The transformer's answer is stored as P(sarcastic) so confidences mean
+    the same thing for every row. If the pipeline is unavailable, the local
+    results are kept.
+    """
+    uncertain = [
+        (i, text) for i, text in zip(valid_idx, valid_texts)
+        if CASCADE_BAND_LOW <= results[i]["confidence"] <= CASCADE_BAND_HIGH
+    ]
+    sarcasm_rows.inc("local", amount=len(valid_idx) - len(uncertain))
+    if not uncertain:
+        return
+
+    outputs = _score_pipeline([text for _, text in uncertain])
+    if outputs is None:
+        sarcasm_rows.inc("escalation_failed", amount=len(uncertain))
+        return
+    for (i, _), (is_sarcastic, score) in zip(uncertain, outputs):
+        probability = score if is_sarcastic else 1.0 - score
+        results[i] = {"sarcasm": is_sarcastic, "confidence": probability}
+    sarcasm_rows.inc("escalated", amount=len(uncertain))
+
+def train_sarcasm_model(dataset_path="sarcasm_dataset.csv", chunk_size=None):
     """
     Writes the trained model/vectorizer to the 'models/' folder.
+    The CSV is streamed in chunks and the model trained with partial_fit, so large
+    datasets don't have to fit in memory (see train_models.train_streaming).
     """
+    from train_models import train_streaming
+
     if not os.path.exists(dataset_path):
         return {"error": f"Dataset file '{dataset_path}' not found."}
 
-    # Try different encodings
-    encodings_to_try = ['utf-8', 'latin1', 'cp1252', 'ISO-8859-1']
-    data = None
-    
-    for encoding in encodings_to_try:
-        try:
-            print(f"Trying to read with {encoding} encoding...")
-            data = pd.read_csv(dataset_path, encoding=encoding)
-            print(f"Successfully read with {encoding} encoding")
-            break
-        except UnicodeDecodeError:
-            print(f"Failed to read with {encoding} encoding")
-            continue
-    
-    if data is None:
-        return {"error": "Could not read the dataset with any of the attempted encodings."}
-
-    if "text" not in data.columns or "label" not in data.columns:
-        # Try to guess columns if standard names aren't found
-        print("Standard columns 'text' and 'label' not found. Available columns:")
-        for col in data.columns:
-            print(f"  {col}")
-        return {"error": "Dataset must have 'text' and 'label' columns."}
-
-    data = data.dropna(subset=["text", "label"])
-    data = data[data["text"].str.strip() != ""]
-
-    X = data["text"]
-    y = data["label"]
-
-    global model, vectorizer
-    vectorizer = CountVectorizer(stop_words="english")
-    X_vectorized = vectorizer.fit_transform(X)
-
-    X_train, X_test, y_train, y_test = train_test_split(
-        X_vectorized, y, test_size=0.2, random_state=42
-    )
-
-    model = MultinomialNB()
-    model.fit(X_train, y_train)
-
-    y_pred = model.predict(X_test)
-    accuracy = accuracy_score(y_test, y_pred)
-    precision = precision_score(y_test, y_pred, pos_label=1)
-    recall = recall_score(y_test, y_pred, pos_label=1)
-    f1 = f1_score(y_test, y_pred, pos_label=1)
-
-    os.makedirs(BASE_DIR, exist_ok=True)
-    joblib.dump(model, MODEL_PATH)
-    joblib.dump(vectorizer, VECTORIZER_PATH)
+    try:
+        report = train_streaming(
+            "sarcasm", dataset_path,
+            mode=model_registry.VECTORIZER_MODE,
+            output_dir=os.path.dirname(MODEL_PATH),
+            chunk_size=chunk_size,
+            pos_label=1
+        )
+    except ValueError as e:
+        # Missing 'text'/'label' columns or no usable rows
+        return {"error": f"Dataset must have 'text' and 'label' columns with data: {str(e)}"}
+
+    # Serve the freshly trained model without a restart
+    model = model_registry.load_artifact(MODEL_PATH)
+    vectorizer = model_registry.load_artifact(VECTORIZER_PATH)
+    model_registry.set_model("sarcasm", (model, vectorizer))
 
     return {
         "message": "Sarcasm model trained successfully",
-        "accuracy": float(accuracy),
-        "precision": float(precision),
-        "recall": float(recall),
-        "f1_score": float(f1)
-    }
\ No newline at end of file
+        "accuracy": report["accuracy"],
+        "precision": report["precision"],
+        "recall": report["recall"],
+        "f1_score": report["f1_score"],
+        "train_rows": report["train_rows"],
+        "test_rows": report["test_rows"]
+    }
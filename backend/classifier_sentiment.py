@@ -1,87 +1,128 @@
 import os
-import joblib
 import numpy as np
 
+import model_registry
+from features import rows_for
+from scoring import predict_with_confidence
+
 # Define the base directory for models using absolute path
 BASE_DIR = '/home/azureuser/Capgemini_SentimentApp_Remake/backend/models'
-MODEL_PATH = os.path.join(BASE_DIR, "sentiment_classifier.pkl")
+MODEL_PATH = model_registry.artifact_path(BASE_DIR, "sentiment_classifier.pkl")
 # changed it from ...sentiment_vectorizer.pkl to just 'vectorizer.pkl' though i don't know if theres training in there
 
-VECTORIZER_PATH = os.path.join(BASE_DIR, "vectorizer.pkl")
+VECTORIZER_PATH = model_registry.artifact_path(BASE_DIR, "vectorizer.pkl")
 
-# Initialize model and vectorizer as None
-model = None
-vectorizer = None
+def _load_sentiment_model():
+    """
+    Loads the model and vectorizer if they exist.
+    Returns a (model, vectorizer) tuple, or None if they are not available.
+    """
+    try:
+        if os.path.exists(MODEL_PATH) and os.path.exists(VECTORIZER_PATH):
+            model = model_registry.load_artifact(MODEL_PATH)
+            vectorizer = model_registry.load_artifact(VECTORIZER_PATH)
+            print(f"Loaded sentiment model from {MODEL_PATH}")
+            print(f"Loaded sentiment vectorizer from {VECTORIZER_PATH}")
+            return model, vectorizer
+        else:
+            print(f"Warning: Local sentiment model not found at {MODEL_PATH} or {VECTORIZER_PATH}")
+    except Exception as e:
+        print(f"Warning: Failed to load local sentiment model: {str(e)}")
+    return None
 
-# Try to load the model and vectorizer if they exist
-try:
-    if os.path.exists(MODEL_PATH) and os.path.exists(VECTORIZER_PATH):
-        model = joblib.load(MODEL_PATH)
-        vectorizer = joblib.load(VECTORIZER_PATH)
-        print(f"Loaded sentiment model from {MODEL_PATH}")
-        print(f"Loaded sentiment vectorizer from {VECTORIZER_PATH}")
-    else:
-        print(f"Warning: Local sentiment model not found at {MODEL_PATH} or {VECTORIZER_PATH}")
-except Exception as e:
-    print(f"Warning: Failed to load local sentiment model: {str(e)}")
-    model, vectorizer = None, None
+# Loaded on first use, see model_registry
+model_registry.register("sentiment", _load_sentiment_model,
+                        version=lambda: model_registry.artifact_version(MODEL_PATH, VECTORIZER_PATH))
 
-def classify_sentiment(text):
+def _coerce_text(text):
     """
-    Returns a dict like {"sentiment": "Positive", "confidence": 0.85} or similar.
-    If local model is not available, provides a basic fallback.
+    Makes sure the input is a usable string.
+    Returns the text, or None if it is empty or cannot be converted.
     """
-    # Access the global model and vectorizer
-    global model, vectorizer
-    
-    # Make sure text is a string
     try:
         if isinstance(text, (int, float)) or hasattr(text, 'dtype'):  # Handle numpy types
             text = str(text)
-        
+
         if not text or not text.strip():
-            return {
-                "sentiment": "Neutral",
-                "confidence": 0.5
-            }
+            return None
+        return text
     except Exception as e:
         print(f"Error converting input to string: {e}")
+        return None
+
+def _keyword_fallback(text):
+    """
+    Basic fallback logic used when no local model is available.
+    """
+    text_lower = text.lower()
+    if any(word in text_lower for word in ["great", "love", "excellent", "amazing", "good", "happy"]):
+        return {
+            "sentiment": "positive",
+            "confidence": 0.7
+        }
+    elif any(word in text_lower for word in ["terrible", "awful", "bad", "hate", "disappointed", "angry"]):
         return {
-            "sentiment": "Neutral",
+            "sentiment": "negative",
+            "confidence": 0.7
+        }
+    else:
+        return {
+            "sentiment": "neutral",
             "confidence": 0.5
         }
-        
-    if model and vectorizer:
+
+def classify_sentiment(text):
+    """
+    Returns a dict like {"sentiment": "Positive", "confidence": 0.85} or similar.
+    If local model is not available, provides a basic fallback.
+    """
+    return classify_sentiment_batch([text])[0]
+
+def classify_sentiment_batch(texts, features=None):
+    """
+    Batch version of classify_sentiment.
+    Vectorizes all texts with a single transform and scores them with one predict_proba call,
+    instead of paying the sklearn overhead once per row.
+    `features` is this model's entry from features.extract_features(texts), if already computed.
+    Returns a list of result dicts in the same order as `texts`.
+    """
+    results = [None] * len(texts)
+    valid_idx = []
+    valid_texts = []
+    for i, text in enumerate(texts):
+        text = _coerce_text(text)
+        if text is None:
+            results[i] = {"sentiment": "Neutral", "confidence": 0.5}
+        else:
+            valid_idx.append(i)
+            valid_texts.append(text)
+
+    if not valid_texts:
+        return results
+
+    loaded = model_registry.get("sentiment")
+    if loaded:
+        model, vectorizer = loaded
         try:
-            X_vectorized = vectorizer.transform([text])
-            sentiment_label = model.predict(X_vectorized)[0]
-            confidence = 0.8  # placeholder or model.predict_proba
-            return {
-                "sentiment": sentiment_label,
-                "confidence": confidence
-            }
+            X_vectorized = rows_for(features, vectorizer, valid_idx)
+            if X_vectorized is None:
+                X_vectorized = vectorizer.transform(valid_texts)
+            sentiment_labels, confidences = predict_with_confidence(model, X_vectorized)
+            for i, sentiment_label, confidence in zip(valid_idx, sentiment_labels, confidences):
+                results[i] = {
+                    "sentiment": sentiment_label,
+                    "confidence": float(confidence)
+                }
         except Exception as e:
             print(f"Error classifying sentiment: {str(e)}")
             # fallback on error
-            return {
-                "sentiment": "Neutral",
-                "confidence": 0.5
-            }
+            for i in valid_idx:
+                results[i] = {
+                    "sentiment": "Neutral",
+                    "confidence": 0.5
+                }
     else:
-        # Basic fallback logic if no model is available
-        text_lower = text.lower()
-        if any(word in text_lower for word in ["great", "love", "excellent", "amazing", "good", "happy"]):
-            return {
-                "sentiment": "positive",
-                "confidence": 0.7
-            }
-        elif any(word in text_lower for word in ["terrible", "awful", "bad", "hate", "disappointed", "angry"]):
-            return {
-                "sentiment": "negative",
-                "confidence": 0.7
-            }
-        else:
-            return {
-                "sentiment": "neutral",
-                "confidence": 0.5
-            }
\ No newline at end of file
+        for i, text in zip(valid_idx, valid_texts):
+            results[i] = _keyword_fallback(text)
+
+    return results
@@ -0,0 +1,239 @@
+"""
+dashboard.py
+Queries behind /api/dashboard and /api/dashboard/aggregates.
+
+Pages are read newest first with keyset pagination: the cursor is the
+(CreatedAt, Id) of the last row returned, and the next page starts strictly
+after it, so each page is an index range read on (CreatedAt, Id) no matter how
+deep the client has paged. Aggregates are GROUP BY queries run in the database,
+normally over the daily rollup table.
+
+Filters (query string): sentiment, emotion, from, to. `from` is inclusive, `to`
+is exclusive; a date without a time in `to` includes that whole day.
+"""
+import os
+from datetime import datetime, time, timedelta
+
+DEFAULT_PAGE_SIZE = int(os.getenv("CAPSENSE_DASHBOARD_PAGE_SIZE", "10"))
+MAX_PAGE_SIZE = int(os.getenv("CAPSENSE_DASHBOARD_MAX_PAGE_SIZE", "500"))
+# Aggregate from FeedbackDailyRollup (see rollup.py) instead of the raw table
+USE_ROLLUP = os.getenv("CAPSENSE_DASHBOARD_ROLLUP", "1") not in ("0", "false", "no")
+
+# Response header carrying the cursor of the next page (absent on the last page)
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
+
+_PAGE_COLUMNS = "Id, CustomerText, Sentiment, ResponseText, EmpathyScore, SarcasmDetected, Emotion, CreatedAt"
+
+
+def _parse_timestamp(text, name):
+    try:
+        return datetime.fromisoformat(text.strip())
+    except (AttributeError, ValueError):
+        raise ValueError(f"'{name}' must be an ISO date or timestamp, got {text!r}")
+
+
+def _db_timestamp(value, dialect):
+    # SQLite stores CURRENT_TIMESTAMP as 'YYYY-MM-DD HH:MM:SS' text
+    return value.isoformat(sep=" ") if dialect == "sqlite" else value
+
+
+def encode_cursor(created_at, row_id):
+    """
+    Returns the cursor for a row: "<CreatedAt>,<Id>".
+    """
+    if isinstance(created_at, datetime):
+        created_at = created_at.isoformat(sep=" ")
+    return f"{created_at},{row_id}"
+
+
+def parse_cursor(cursor):
+    """
+    Parses "<CreatedAt>,<Id>" into (datetime, int). Raises ValueError if malformed.
+    """
+    created_at, sep, row_id = (cursor or "").rpartition(",")
+    if not sep or not row_id.strip().isdigit():
+        raise ValueError(f"'after' must look like '<CreatedAt>,<Id>', got {cursor!r}")
+    return _parse_timestamp(created_at, "after"), int(row_id)
+
+
+def parse_filters(args):
+    """
+    Reads the filters from request args.
+    Returns {"sentiment", "emotion", "from", "to"} with None for unset filters.
+    Raises ValueError on malformed dates.
+    """
+    filters = {
+        "sentiment": (args.get("sentiment") or "").strip() or None,
+        "emotion": (args.get("emotion") or "").strip() or None,
+        "from": None,
+        "to": None
+    }
+    if args.get("from"):
+        filters["from"] = _parse_timestamp(args["from"], "from")
+    if args.get("to"):
+        to = _parse_timestamp(args["to"], "to")
+        if len(args["to"].strip()) == 10:
+            to += timedelta(days=1)
+        filters["to"] = to
+    return filters
+
+
+def parse_limit(value):
+    """
+    Returns the page size from the `limit` argument, clamped to MAX_PAGE_SIZE.
+    """
+    if value in (None, ""):
+        return DEFAULT_PAGE_SIZE
+    try:
+        limit = int(value)
+    except ValueError:
+        raise ValueError(f"'limit' must be an integer, got {value!r}")
+    if limit < 1:
+        raise ValueError("'limit' must be at least 1")
+    return min(limit, MAX_PAGE_SIZE)
+
+
+def _where(filters, dialect, after=None):
+    clauses, params = [], []
+    if filters.get("sentiment"):
+        clauses.append("Sentiment = ?")
+        params.append(filters["sentiment"])
+    if filters.get("emotion"):
+        clauses.append("Emotion = ?")
+        params.append(filters["emotion"])
+    if filters.get("from"):
+        clauses.append("CreatedAt >= ?")
+        params.append(_db_timestamp(filters["from"], dialect))
+    if filters.get("to"):
+        clauses.append("CreatedAt < ?")
+        params.append(_db_timestamp(filters["to"], dialect))
+    if after is not None:
+        created_at, row_id = after
+        created_at = _db_timestamp(created_at, dialect)
+        if dialect == "sqlite":
+            # Row values compile to a range seek on the (CreatedAt, Id) index
+            clauses.append("(CreatedAt, Id) < (?, ?)")
+            params.extend([created_at, row_id])
+        else:
+            # The leading CreatedAt <= ? is the seek predicate. pyodbc sends datetime2;
+            # the cast keeps the equality exact against the DATETIME column.
+            clauses.append(
+                "CreatedAt <= CAST(? AS DATETIME) AND "
+                "(CreatedAt < CAST(? AS DATETIME) OR Id < ?)"
+            )
+            params.extend([created_at, created_at, row_id])
+    return (" WHERE " + " AND ".join(clauses) if clauses else ""), params
+
+
+def fetch_page(conn, dialect, filters, limit, after=None):
+    """
+    Returns (rows as dicts, next cursor or None) for one page, newest first.
+    `after` is a parsed cursor.
+    """
+    where, params = _where(filters, dialect, after)
+    if dialect == "sqlite":
+        query = f"SELECT {_PAGE_COLUMNS} FROM FeedbackResponses{where} ORDER BY CreatedAt DESC, Id DESC LIMIT ?;"
+        params.append(limit + 1)
+    else:
+        query = f"SELECT TOP (?) {_PAGE_COLUMNS} FROM FeedbackResponses{where} ORDER BY CreatedAt DESC, Id DESC;"
+        params.insert(0, limit + 1)
+
+    cursor = conn.cursor()
+    cursor.execute(query, params)
+    rows = cursor.fetchall()
+    cursor.close()
+
+    # One extra row tells whether there is a next page
+    next_cursor = encode_cursor(rows[limit - 1][7], rows[limit - 1][0]) if len(rows) > limit else None
+    return [
+        {
+            "id": row[0],
+            "customer_text": row[1],
+            "sentiment": row[2],
+            "response_text": row[3],
+            "empathy_score": row[4],
+            "sarcasm_detected": row[5],
+            "emotion": row[6],
+            "created_at": str(row[7])
+        }
+        for row in rows[:limit]
+    ], next_cursor
+
+
+def _whole_days(filters):
+    return all(
+        filters.get(name) is None or filters[name].time() == time.min
+        for name in ("from", "to")
+    )
+
+
+def _rollup_where(filters, dialect):
+    clauses, params = [], []
+    if filters.get("sentiment"):
+        clauses.append("Sentiment = ?")
+        params.append(filters["sentiment"])
+    if filters.get("emotion"):
+        clauses.append("Emotion = ?")
+        params.append(filters["emotion"])
+    for name, op in (("from", ">="), ("to", "<")):
+        if filters.get(name):
+            day = filters[name].date()
+            clauses.append(f"Day {op} ?")
+            params.append(day.isoformat() if dialect == "sqlite" else day)
+    return (" WHERE " + " AND ".join(clauses) if clauses else ""), params
+
+
+def fetch_aggregates(conn, dialect, filters):
+    """
+    Counts matching rows per sentiment, per emotion and per day, with average
+    empathy and F1 per day, in SQL. Read from FeedbackDailyRollup unless the
+    date filters cut through a day (or CAPSENSE_DASHBOARD_ROLLUP=0), in which
+    case FeedbackResponses is aggregated directly.
+    Returns {"total", "by_sentiment", "by_emotion", "by_day": [{"day", "count",
+    "avg_empathy", "avg_f1"}], "source"}.
+    """
+    if USE_ROLLUP and _whole_days(filters):
+        source = "rollup"
+        where, params = _rollup_where(filters, dialect)
+        table = "FeedbackDailyRollup"
+        day = "Day"
+        count = "SUM(RowTotal)"
+        measures = "SUM(EmpathySum), SUM(EmpathyCount), SUM(F1Sum), SUM(F1Count)"
+    else:
+        source = "table"
+        where, params = _where(filters, dialect)
+        table = "FeedbackResponses"
+        day = "DATE(CreatedAt)" if dialect == "sqlite" else "CAST(CreatedAt AS DATE)"
+        count = "COUNT(*)"
+        measures = "SUM(EmpathyScore), COUNT(EmpathyScore), SUM(F1Score), COUNT(F1Score)"
+    cursor = conn.cursor()
+
+    def grouped(expression, extra=""):
+        cursor.execute(
+            f"SELECT {expression}, {count}{extra} FROM {table}{where} "
+            f"GROUP BY {expression} ORDER BY {expression};",
+            params
+        )
+        return cursor.fetchall()
+
+    average = lambda total, n: round(float(total) / n, 4) if n else None
+    # '' is how the rollup stores a missing value
+    by_sentiment = {str(key): int(n) for key, n in grouped("Sentiment") if key not in (None, "")}
+    by_emotion = {str(key): int(n) for key, n in grouped("Emotion") if key not in (None, "")}
+    by_day = [
+        {
+            "day": str(key),
+            "count": int(n),
+            "avg_empathy": average(empathy_sum, empathy_n),
+            "avg_f1": average(f1_sum, f1_n)
+        }
+        for key, n, empathy_sum, empathy_n, f1_sum, f1_n in grouped(day, ", " + measures)
+    ]
+    cursor.close()
+    return {
+        "total": sum(entry["count"] for entry in by_day),
+        "by_sentiment": by_sentiment,
+        "by_emotion": by_emotion,
+        "by_day": by_day,
+        "source": source
+    }
@@ -0,0 +1,104 @@
+"""
+database.py
+Database configuration and the shared connection pool used by every endpoint.
+
+CAPSENSE_DB_BACKEND selects the backend:
+  - 'mssql' (default): Azure SQL through pyodbc
+  - 'sqlite': local file, see db_fallback.py
+
+Pool settings: CAPSENSE_DB_POOL_SIZE, CAPSENSE_DB_POOL_TIMEOUT (checkout timeout
+in seconds), CAPSENSE_DB_POOL_IDLE (idle eviction in seconds) and
+CAPSENSE_DB_POOL_HEALTH_CHECK (seconds of idleness before a connection is tested).
+"""
+import os
+import threading
+
+from db_pool import ConnectionPool
+
+try:
+    import pyodbc
+    PYODBC_AVAILABLE = True
+except ImportError:
+    print("WARNING: pyodbc module not available. Database functionality will be disabled.")
+    PYODBC_AVAILABLE = False
+
+
+# Production DB config for Azure SQL
+DB_CONFIG = {
+    'server': '1sqlcapsenseserver.database.windows.net',
+    'database': 'SentimentAnalysisDB',
+    'username': 'capsenseadmin',
+    'password': 'Access@Capsense1'
+}
+
+DB_BACKEND = os.getenv("CAPSENSE_DB_BACKEND", "mssql").lower()
+
+POOL_SIZE = int(os.getenv("CAPSENSE_DB_POOL_SIZE", "5"))
+POOL_CHECKOUT_TIMEOUT = float(os.getenv("CAPSENSE_DB_POOL_TIMEOUT", "10"))
+POOL_IDLE_TIMEOUT = float(os.getenv("CAPSENSE_DB_POOL_IDLE", "300"))
+POOL_HEALTH_CHECK_INTERVAL = float(os.getenv("CAPSENSE_DB_POOL_HEALTH_CHECK", "30"))
+
+
+def _connect_mssql():
+    conn_str = (
+        f"DRIVER={{ODBC Driver 17 for SQL Server}};"
+        f"SERVER={DB_CONFIG['server']};"
+        f"DATABASE={DB_CONFIG['database']};"
+        f"UID={DB_CONFIG['username']};"
+        f"PWD={DB_CONFIG['password']};"
+        "Encrypt=yes;TrustServerCertificate=no;Connection Timeout=30;"
+    )
+    return pyodbc.connect(conn_str)
+
+
+def _connect_sqlite():
+    from db_fallback import get_fallback_db_connection
+    return get_fallback_db_connection()
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_pool():
+    """
+    Returns the process-wide connection pool, creating it on first use.
+    Returns None if the configured backend is not available.
+    """
+    global _pool
+    if _pool is not None:
+        return _pool
+
+    with _pool_lock:
+        if _pool is None:
+            if DB_BACKEND == "sqlite":
+                connect = _connect_sqlite
+            elif PYODBC_AVAILABLE:
+                connect = _connect_mssql
+            else:
+                return None
+            _pool = ConnectionPool(
+                connect,
+                max_size=POOL_SIZE,
+                checkout_timeout=POOL_CHECKOUT_TIMEOUT,
+                idle_timeout=POOL_IDLE_TIMEOUT,
+                health_check_interval=POOL_HEALTH_CHECK_INTERVAL
+            )
+    return _pool
+
+
+def get_db_connection():
+    """
+    Returns a pooled database connection or None if the database is not available.
+    Call close() on it when done to hand it back to the pool.
+    """
+    pool = get_pool()
+    if pool is None:
+        print("WARNING: Database connection requested but pyodbc is not available")
+        return None
+
+    try:
+        return pool.acquire()
+    except Exception as e:
+        print(f"ERROR connecting to database: {str(e)}")
+        return None
@@ -1,11 +1,16 @@
 """
 db_fallback.py
-Commented-out code to illustrate a simple local fallback DB (e.g. SQLite).
-Uncomment if you want to test locally without Azure.
+A simple local fallback DB (SQLite) to test locally without Azure.
+Select it with CAPSENSE_DB_BACKEND=sqlite; the file location can be changed
+with CAPSENSE_SQLITE_PATH.
 """
 
-# import sqlite3
+import os
+import sqlite3
 
-# def get_fallback_db_connection():
-#     conn = sqlite3.connect('fallback_local.db')
-#     return conn
+SQLITE_PATH = os.getenv("CAPSENSE_SQLITE_PATH", "fallback_local.db")
+
+def get_fallback_db_connection():
+    # Pooled connections are handed to whichever thread serves the request
+    conn = sqlite3.connect(SQLITE_PATH, check_same_thread=False)
+    return conn
@@ -0,0 +1,230 @@
+"""
+db_pool.py
+A small, thread-safe pool of persistent DB-API connections.
+Opening an encrypted ODBC connection to Azure SQL costs a TLS handshake and a
+login on every request; the pool keeps a bounded number of connections open
+and hands them out again.
+
+Connections are checked out with acquire() and returned by calling close() on
+the object it returns, so existing code that does `conn.close()` keeps working.
+"""
+import collections
+import os
+import threading
+import time
+
+
+class PoolTimeout(Exception):
+    """
+    Raised when no connection becomes available within the checkout timeout.
+    """
+    pass
+
+
+class PooledConnection:
+    """
+    Wraps a raw connection checked out from a ConnectionPool.
+    Everything except close() is delegated to the raw connection.
+    """
+    def __init__(self, pool, raw, generation=None):
+        self._pool = pool
+        self._raw = raw
+        self._generation = generation
+        self._released = False
+
+    def __getattr__(self, name):
+        return getattr(self._raw, name)
+
+    @property
+    def raw(self):
+        return self._raw
+
+    def close(self):
+        """
+        Returns the connection to the pool instead of closing it.
+        Uncommitted work is rolled back. Calling close() twice is harmless.
+        """
+        if not self._released:
+            self._released = True
+            self._pool.release(self._raw, generation=self._generation)
+
+    def discard(self):
+        """
+        Closes the underlying connection for good, e.g. after a network error.
+        """
+        if not self._released:
+            self._released = True
+            self._pool.release(self._raw, broken=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+        return False
+
+
+class ConnectionPool:
+    """
+    Bounded pool of connections created by `connect`, a zero-argument function.
+
+    max_size: most connections open at once (checked out + idle)
+    checkout_timeout: seconds acquire() waits for a free connection before raising PoolTimeout
+    idle_timeout: idle connections older than this many seconds are closed
+    health_check_interval: a connection idle for longer than this is tested with
+                           `health_check_query` before it is handed out
+    """
+    def __init__(self, connect, max_size=5, checkout_timeout=10.0, idle_timeout=300.0,
+                 health_check_interval=30.0, health_check_query="SELECT 1"):
+        self._connect = connect
+        self.max_size = max_size
+        self.checkout_timeout = checkout_timeout
+        self.idle_timeout = idle_timeout
+        self.health_check_interval = health_check_interval
+        self.health_check_query = health_check_query
+
+        self._idle = collections.deque()  # (raw connection, time it was returned)
+        self._size = 0  # open connections, idle and checked out
+        self._generation = 0  # bumped by close_all; older connections are closed when returned
+        self._cond = threading.Condition()
+        self._pid = os.getpid()
+
+    def acquire(self):
+        """
+        Checks out a connection, opening a new one if the pool isn't full.
+        Raises PoolTimeout if none is free in time, or whatever `connect` raises.
+        """
+        deadline = time.monotonic() + self.checkout_timeout
+        while True:
+            raw, last_used, generation = self._checkout(deadline)
+
+            if raw is None:
+                try:
+                    raw = self._connect()
+                except Exception:
+                    with self._cond:
+                        self._size -= 1
+                        self._cond.notify()
+                    raise
+                return PooledConnection(self, raw, generation)
+
+            if time.monotonic() - last_used < self.health_check_interval or self._is_healthy(raw):
+                return PooledConnection(self, raw, generation)
+
+            # Stale connection (server restart, network blip), drop it and try again
+            print("[DB POOL] Discarding connection that failed its health check")
+            self._close_quietly(raw)
+            with self._cond:
+                self._size -= 1
+                self._cond.notify()
+
+    def _checkout(self, deadline):
+        """
+        Returns (raw, last_used, generation) for an idle connection, or
+        (None, None, generation) when the caller should open a new one (a slot has
+        been reserved for it).
+        """
+        with self._cond:
+            self._reset_after_fork()
+            self._evict_idle()
+            while True:
+                if self._idle:
+                    # Most recently used first, so rarely used connections age out
+                    return self._idle.pop() + (self._generation,)
+                if self._size < self.max_size:
+                    self._size += 1
+                    return None, None, self._generation
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise PoolTimeout(
+                        f"No database connection available after {self.checkout_timeout}s "
+                        f"(pool size {self.max_size})"
+                    )
+                self._cond.wait(remaining)
+
+    def release(self, raw, broken=False, generation=None):
+        """
+        Returns a raw connection to the pool, or closes it if it is broken or was
+        checked out before the last close_all() (`generation` from checkout).
+        """
+        if not broken:
+            try:
+                raw.rollback()
+            except Exception:
+                broken = True
+
+        with self._cond:
+            if self._pid != os.getpid():
+                # Checked out before a fork; it belongs to the parent
+                return
+            if broken or (generation is not None and generation != self._generation):
+                self._size -= 1
+                self._close_quietly(raw)
+            else:
+                self._idle.append((raw, time.monotonic()))
+            self._cond.notify()
+
+    def _evict_idle(self):
+        """
+        Closes connections that have been idle longer than idle_timeout.
+        Must be called with the lock held.
+        """
+        cutoff = time.monotonic() - self.idle_timeout
+        # Oldest returns are on the left
+        while self._idle and self._idle[0][1] < cutoff:
+            raw, _ = self._idle.popleft()
+            self._size -= 1
+            self._close_quietly(raw)
+
+    def _reset_after_fork(self):
+        """
+        A forked worker must not reuse sockets opened by its parent.
+        Must be called with the lock held.
+        """
+        if self._pid != os.getpid():
+            self._pid = os.getpid()
+            self._idle.clear()
+            self._size = 0
+
+    def _is_healthy(self, raw):
+        try:
+            cursor = raw.cursor()
+            cursor.execute(self.health_check_query)
+            cursor.fetchone()
+            cursor.close()
+            return True
+        except Exception:
+            return False
+
+    @staticmethod
+    def _close_quietly(raw):
+        try:
+            raw.close()
+        except Exception:
+            pass
+
+    def close_all(self):
+        """
+        Closes every idle connection. Checked-out connections are closed when returned.
+        The pool stays usable and opens new connections as needed.
+        """
+        with self._cond:
+            self._generation += 1
+            while self._idle:
+                raw, _ = self._idle.pop()
+                self._size -= 1
+                self._close_quietly(raw)
+            self._cond.notify_all()
+
+    def stats(self):
+        """
+        Returns a dict with the current pool usage.
+        """
+        with self._cond:
+            idle = len(self._idle)
+            return {
+                "max_size": self.max_size,
+                "open": self._size,
+                "idle": idle,
+                "in_use": self._size - idle
+            }
@@ -0,0 +1,314 @@
+"""
+evaluation.py
+Measured model quality, updated incrementally.
+Each model has a running confusion matrix of (true label, predicted label) counts:
+  - sentiment / sarcasm / emotion: updated from labelled texts (POST /api/evaluation/labels)
+    and from label corrections sent with /api/feedback
+  - response: updated from approve/reject feedback; every generated response is a
+    prediction of "approved", so its precision is the approval rate. A macro
+    average would mix in the "rejected" class, which is never predicted, so its
+    precision / recall / F1 are those of the "approved" class alone, and the
+    approval rate is reported as well
+
+An update only touches the cells and per-class totals of the two labels involved,
+and the per-class F1 sum is kept up to date, so recording a label and reading
+precision / recall / F1 are O(1) and never rescan the feedback table.
+
+Counts are persisted in a SQLite file (CAPSENSE_EVAL_DB) shared by all workers;
+each worker keeps an in-memory copy, refreshed every CAPSENSE_EVAL_REFRESH seconds.
+Counts are kept per model version, so a retrained model starts from zero.
+"""
+import os
+import sqlite3
+import threading
+import time
+from collections import Counter
+
+import model_registry
+
+EVAL_DB_PATH = os.getenv("CAPSENSE_EVAL_DB", "capsense_eval.db")
+REFRESH_SECONDS = float(os.getenv("CAPSENSE_EVAL_REFRESH", "30"))
+# Below this many labelled samples a model's F1 is reported as None
+MIN_SAMPLES = int(os.getenv("CAPSENSE_EVAL_MIN_SAMPLES", "20"))
+
+MODELS = ("sentiment", "sarcasm", "emotion", "response")
+
+_TRUE_VALUES = ("1", "true", "yes", "y", "sarcastic", "sarcasm")
+
+# Models scored on one class instead of the macro average (see above)
+SCORED_CLASS = {"response": "approved"}
+
+
+def normalize_label(model, value):
+    """
+    Maps a prediction or a user-supplied label to the form used in the matrix.
+    """
+    if model == "sarcasm":
+        return "sarcastic" if str(value).strip().lower() in _TRUE_VALUES else "not_sarcastic"
+    return str(value).strip().lower()
+
+
+class ConfusionMatrix:
+    """
+    Running confusion matrix with O(1) updates and O(1) per-class and macro metrics.
+    """
+    def __init__(self):
+        self.cells = Counter()         # (true, predicted) -> count
+        self.true_totals = Counter()   # true label -> count (tp + fn)
+        self.pred_totals = Counter()   # predicted label -> count (tp + fp)
+        self.total = 0
+        self.correct = 0
+        self._f1 = {}                  # label -> current F1
+        self._f1_sum = 0.0
+
+    def update(self, true, predicted, weight=1):
+        """
+        Adds `weight` observations (use -1 to retract one).
+        """
+        self.cells[(true, predicted)] += weight
+        self.true_totals[true] += weight
+        self.pred_totals[predicted] += weight
+        self.total += weight
+        if true == predicted:
+            self.correct += weight
+        self._refresh_f1(true)
+        if predicted != true:
+            self._refresh_f1(predicted)
+
+    def _refresh_f1(self, label):
+        previous = self._f1.pop(label, 0.0)
+        self._f1_sum -= previous
+        # A label with no observations left (after retractions) drops out of the average
+        if self.true_totals.get(label) or self.pred_totals.get(label):
+            f1 = self.class_metrics(label)["f1"]
+            self._f1_sum += f1
+            self._f1[label] = f1
+
+    def class_metrics(self, label):
+        tp = self.cells.get((label, label), 0)
+        predicted = self.pred_totals.get(label, 0)
+        actual = self.true_totals.get(label, 0)
+        precision = tp / predicted if predicted else 0.0
+        recall = tp / actual if actual else 0.0
+        f1 = 2 * precision * recall / (precision + recall) if precision + recall else 0.0
+        return {"precision": precision, "recall": recall, "f1": f1, "support": actual}
+
+    def macro_f1(self):
+        return self._f1_sum / len(self._f1) if self._f1 else 0.0
+
+    def accuracy(self):
+        return self.correct / self.total if self.total else 0.0
+
+    def summary(self):
+        labels = sorted(self._f1)
+        per_class = {label: self.class_metrics(label) for label in labels}
+        macro = lambda key: sum(m[key] for m in per_class.values()) / len(per_class) if per_class else 0.0
+        return {
+            "samples": self.total,
+            "accuracy": round(self.accuracy(), 4),
+            "precision": round(macro("precision"), 4),
+            "recall": round(macro("recall"), 4),
+            "f1_score": round(self.macro_f1(), 4),
+            "per_class": {
+                label: {k: (round(v, 4) if isinstance(v, float) else v) for k, v in m.items()}
+                for label, m in per_class.items()
+            },
+            "matrix": [[true, pred, count] for (true, pred), count in sorted(self.cells.items()) if count]
+        }
+
+
+def _model_version(model):
+    if model == "response":
+        return ""
+    try:
+        return model_registry.model_version(model) or ""
+    except KeyError:
+        # Classifier module not imported in this process
+        return ""
+
+
+class EvaluationEngine:
+    """
+    Per-model confusion matrices backed by a shared SQLite table.
+    """
+    def __init__(self, path=EVAL_DB_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+        self._matrices = {}      # model -> (version, ConfusionMatrix)
+        self._loaded_at = 0.0
+        self._schema_ready = False
+
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=10)
+        if not self._schema_ready:
+            conn.execute("PRAGMA journal_mode=WAL;")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS eval_confusion ("
+                "  model TEXT NOT NULL,"
+                "  model_version TEXT NOT NULL,"
+                "  true_label TEXT NOT NULL,"
+                "  predicted_label TEXT NOT NULL,"
+                "  count INTEGER NOT NULL,"
+                "  PRIMARY KEY (model, model_version, true_label, predicted_label)"
+                ");"
+            )
+            conn.commit()
+            self._schema_ready = True
+        return conn
+
+    def _reload(self):
+        # Must be called with the lock held
+        versions = {model: _model_version(model) for model in MODELS}
+        matrices = {model: (versions[model], ConfusionMatrix()) for model in MODELS}
+        try:
+            conn = self._connect()
+            try:
+                for model, version, true, predicted, count in conn.execute(
+                    "SELECT model, model_version, true_label, predicted_label, count FROM eval_confusion;"
+                ):
+                    if model in matrices and versions[model] == version:
+                        matrices[model][1].update(true, predicted, count)
+            finally:
+                conn.close()
+        except Exception as e:
+            print(f"[EVALUATION] Could not load confusion counts: {str(e)}")
+        self._matrices = matrices
+        self._loaded_at = time.time()
+
+    def _matrix(self, model):
+        # Must be called with the lock held
+        entry = self._matrices.get(model)
+        if (entry is None or time.time() - self._loaded_at > REFRESH_SECONDS
+                or entry[0] != _model_version(model)):
+            self._reload()
+        return self._matrices[model][1]
+
+    def record(self, observations):
+        """
+        Records a list of (model, true label, predicted label, weight) observations
+        in one transaction. Labels are normalized per model.
+        """
+        rows = []
+        with self._lock:
+            for model, true, predicted, weight in observations:
+                true = normalize_label(model, true)
+                predicted = normalize_label(model, predicted)
+                self._matrix(model).update(true, predicted, weight)
+                rows.append((model, self._matrices[model][0], true, predicted, weight))
+        if not rows:
+            return
+        try:
+            conn = self._connect()
+            try:
+                conn.executemany(
+                    "INSERT INTO eval_confusion (model, model_version, true_label, predicted_label, count) "
+                    "VALUES (?, ?, ?, ?, ?) "
+                    "ON CONFLICT (model, model_version, true_label, predicted_label) "
+                    "DO UPDATE SET count = count + excluded.count;",
+                    rows
+                )
+                conn.commit()
+            finally:
+                conn.close()
+        except Exception as e:
+            print(f"[EVALUATION] Could not persist {len(rows)} observations: {str(e)}")
+
+    def f1(self, model):
+        """
+        Returns the model's macro F1, or None with fewer than MIN_SAMPLES observations.
+        """
+        with self._lock:
+            matrix = self._matrix(model)
+            if matrix.total < MIN_SAMPLES:
+                return None
+            if model in SCORED_CLASS:
+                return round(matrix.class_metrics(SCORED_CLASS[model])["f1"], 4)
+            return round(matrix.macro_f1(), 4)
+
+    def _summary(self, model):
+        version, matrix = self._matrices[model]
+        summary = dict(matrix.summary(), model_version=version, average="macro")
+        if model in SCORED_CLASS:
+            label = SCORED_CLASS[model]
+            scored = matrix.class_metrics(label)
+            summary.update({key: round(scored[key], 4) for key in ("precision", "recall")})
+            summary["f1_score"] = round(scored["f1"], 4)
+            summary["average"] = label
+            if model == "response":
+                summary["approval_rate"] = round(scored["precision"], 4)
+        return summary
+
+    def summary(self, model=None):
+        """
+        Returns the metrics of one model, or of all models keyed by name.
+        `average` tells whether precision / recall / F1 are macro averages or
+        those of a single class (SCORED_CLASS).
+        """
+        with self._lock:
+            if model is not None:
+                self._matrix(model)
+                return self._summary(model)
+            self._matrix(MODELS[0])
+            return {name: self._summary(name) for name in self._matrices}
+
+
+engine = EvaluationEngine()
+
+
+def record_labels(items):
+    """
+    Records labelled texts: each item is {"text": ..., and any of "sentiment",
+    "sarcasm", "emotion"}. The texts are classified (usually a cache hit) and each
+    given label is compared with the prediction.
+    Returns the number of observations recorded.
+    """
+    from pipeline import classify_texts
+
+    items = [item for item in items if isinstance(item, dict) and isinstance(item.get("text"), str)]
+    if not items:
+        return 0
+    predictions = classify_texts([item["text"] for item in items])
+    observations = []
+    for item, (_, classification) in zip(items, predictions):
+        if item.get("sentiment") is not None:
+            observations.append(("sentiment", item["sentiment"], classification["sentiment"], 1))
+        if item.get("sarcasm") is not None:
+            observations.append(("sarcasm", item["sarcasm"], classification["sarcasm"], 1))
+        if item.get("emotion") is not None:
+            observations.append(("emotion", item["emotion"], classification["emotion"], 1))
+    engine.record(observations)
+    return len(observations)
+
+
+def record_feedback(approved, previous=None):
+    """
+    Records an approve/reject decision on a generated response. `previous` is the
+    earlier decision on the same response (True/False), if any, which is retracted
+    so a changed vote isn't counted twice.
+    """
+    observations = []
+    if previous is not None:
+        if bool(previous) == bool(approved):
+            return
+        observations.append(("response", "approved" if previous else "rejected", "approved", -1))
+    observations.append(("response", "approved" if approved else "rejected", "approved", 1))
+    engine.record(observations)
+
+
+def collect_metrics():
+    """
+    metrics.register_collector callback: current F1 and sample count per model,
+    and the response approval rate.
+    """
+    summary = engine.summary()
+    response = summary.get("response")
+    return [
+        ("capsense_model_f1_score", "gauge",
+         "Measured F1 per model (current model version): macro for the classifiers, "
+         "of the approved class for response.",
+         {(("model", name),): s["f1_score"] for name, s in summary.items() if s["samples"]}),
+        ("capsense_response_approval_rate", "gauge", "Share of rated responses that were approved.",
+         {(): response["approval_rate"]} if response and response["samples"] else {}),
+        ("capsense_model_eval_samples", "gauge", "Labelled observations behind the measured metrics.",
+         {(("model", name),): s["samples"] for name, s in summary.items()})
+    ]
@@ -0,0 +1,199 @@
+"""
+export_onnx.py
+Offline tooling for the ONNX Runtime backend of the irony model
+(CAPSENSE_SARCASM_BACKEND=onnx).
+
+    python export_onnx.py export [--output DIR] [--quantize]
+        Exports cardiffnlp/twitter-roberta-base-irony to DIR/model.onnx together with
+        tokenizer.json and labels.json. --quantize also writes DIR/model.int8.onnx
+        (dynamic int8 weights).
+
+    python export_onnx.py parity [--model PATH] [--texts FILE]
+        Runs the torch model and the ONNX model on sample texts and reports label
+        agreement and the largest score difference. Exits with 1 on disagreement.
+
+    python export_onnx.py benchmark [--model PATH] [--texts FILE] [--repeat N]
+        Compares latency and throughput of the torch and ONNX backends.
+
+Exporting needs torch and transformers; serving the exported model only needs
+onnxruntime and tokenizers.
+"""
+import argparse
+import json
+import os
+import sys
+import time
+
+from classifier_sarcasm import HF_MODEL_NAME, ONNX_MODEL_PATH
+from transformer_engine import TransformerClassifier, OnnxClassifier, QUANTIZED_SUFFIX
+
+SAMPLE_TEXTS = [
+    "Oh great, another delay. Just what I needed today.",
+    "The support team solved my problem in five minutes, thank you!",
+    "Wow, I love waiting on hold for an hour.",
+    "Delivery was on time and the packaging was fine.",
+    "Sure, because charging me twice is exactly what I expected from you.",
+    "The app crashes every time I open the settings page.",
+    "Fantastic. The replacement is broken too.",
+    "ok",
+    "I can't believe how easy the setup was, really impressed with the whole experience "
+    "from ordering to installation, and the manual was clear as well.",
+    "Thanks for nothing."
+]
+
+
+def export(output_dir, quantize=False, opset=14):
+    """
+    Exports the Hugging Face model to ONNX with dynamic batch and sequence axes.
+    Returns the paths of the written model files.
+    """
+    import torch
+    from transformers import AutoModelForSequenceClassification, AutoTokenizer
+
+    os.makedirs(output_dir, exist_ok=True)
+    tokenizer = AutoTokenizer.from_pretrained(HF_MODEL_NAME)
+    model = AutoModelForSequenceClassification.from_pretrained(HF_MODEL_NAME)
+    model.eval()
+
+    model_path = os.path.join(output_dir, "model.onnx")
+    dummy = tokenizer(["a sample input", "another one"], padding=True, return_tensors="pt")
+    with torch.inference_mode():
+        torch.onnx.export(
+            model,
+            (dummy["input_ids"], dummy["attention_mask"]),
+            model_path,
+            input_names=["input_ids", "attention_mask"],
+            output_names=["logits"],
+            dynamic_axes={
+                "input_ids": {0: "batch", 1: "sequence"},
+                "attention_mask": {0: "batch", 1: "sequence"},
+                "logits": {0: "batch"}
+            },
+            opset_version=opset
+        )
+    print(f"[ONNX] Wrote {model_path}")
+
+    # tokenizer.json is what OnnxClassifier loads through the tokenizers library
+    tokenizer.save_pretrained(output_dir)
+    with open(os.path.join(output_dir, "labels.json"), "w", encoding="utf-8") as f:
+        json.dump({
+            "model": HF_MODEL_NAME,
+            "id2label": {str(k): v for k, v in model.config.id2label.items()},
+            "pad_token_id": tokenizer.pad_token_id
+        }, f, indent=2)
+
+    paths = [model_path]
+    if quantize:
+        from onnxruntime.quantization import quantize_dynamic, QuantType
+        quantized_path = model_path[:-len(".onnx")] + QUANTIZED_SUFFIX
+        quantize_dynamic(model_path, quantized_path, weight_type=QuantType.QInt8)
+        print(f"[ONNX] Wrote {quantized_path}")
+        paths.append(quantized_path)
+
+    for path in paths:
+        print(f"[ONNX] {os.path.basename(path)}: {os.path.getsize(path) / 1024 / 1024:.1f} MB")
+    return paths
+
+
+def parity(model_path, texts, tolerance=0.02):
+    """
+    Compares the ONNX model against the torch model on `texts`.
+    Returns {"total", "label_matches", "max_score_diff", "mismatches": [...], "ok"}.
+    Quantized models are expected to drift more, so raise `tolerance` for those.
+    """
+    reference = TransformerClassifier(HF_MODEL_NAME)(texts)
+    candidate = OnnxClassifier(model_path)(texts)
+
+    report = {"total": len(texts), "label_matches": 0, "max_score_diff": 0.0, "mismatches": []}
+    for text, expected, actual in zip(texts, reference, candidate):
+        diff = abs(expected["score"] - actual["score"])
+        report["max_score_diff"] = max(report["max_score_diff"], diff)
+        if expected["label"] == actual["label"]:
+            report["label_matches"] += 1
+        else:
+            report["mismatches"].append({"text": text, "torch": expected, "onnx": actual})
+    report["ok"] = not report["mismatches"] and report["max_score_diff"] <= tolerance
+    return report
+
+
+def _time_backend(classifier, texts, repeat):
+    classifier(texts[:2])  # warm-up
+    latencies = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        classifier(texts)
+        latencies.append(time.perf_counter() - start)
+    latencies.sort()
+    return {
+        "batch_p50_ms": round(latencies[len(latencies) // 2] * 1000, 2),
+        "batch_max_ms": round(latencies[-1] * 1000, 2),
+        "texts_per_second": round(len(texts) * repeat / sum(latencies), 1)
+    }
+
+
+def benchmark(model_path, texts, repeat=20):
+    """
+    Measures batch latency and throughput of each backend, including load time.
+    Returns {backend name: stats}.
+    """
+    backends = {
+        "torch": lambda: TransformerClassifier(HF_MODEL_NAME),
+        "torch-int8": lambda: TransformerClassifier(HF_MODEL_NAME, quantize=True),
+        "onnx": lambda: OnnxClassifier(model_path)
+    }
+    quantized_path = model_path[:-len(".onnx")] + QUANTIZED_SUFFIX
+    if not model_path.endswith(QUANTIZED_SUFFIX) and os.path.exists(quantized_path):
+        backends["onnx-int8"] = lambda: OnnxClassifier(quantized_path)
+
+    report = {}
+    for name, create in backends.items():
+        start = time.perf_counter()
+        classifier = create()
+        load_seconds = time.perf_counter() - start
+        stats = _time_backend(classifier, texts, repeat)
+        stats["load_seconds"] = round(load_seconds, 2)
+        report[name] = stats
+        print(f"[BENCHMARK] {name}: {stats}")
+    return report
+
+
+def _read_texts(path):
+    if not path:
+        return list(SAMPLE_TEXTS)
+    with open(path, encoding="utf-8") as f:
+        return [line.strip() for line in f if line.strip()]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="ONNX export, parity check and benchmark for the irony model.")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    export_cmd = commands.add_parser("export")
+    export_cmd.add_argument("--output", default=os.path.dirname(ONNX_MODEL_PATH))
+    export_cmd.add_argument("--quantize", action="store_true")
+    export_cmd.add_argument("--opset", type=int, default=14)
+
+    for name in ("parity", "benchmark"):
+        cmd = commands.add_parser(name)
+        cmd.add_argument("--model", default=ONNX_MODEL_PATH)
+        cmd.add_argument("--texts", help="file with one text per line (default: built-in samples)")
+        if name == "parity":
+            cmd.add_argument("--tolerance", type=float, default=0.02)
+        else:
+            cmd.add_argument("--repeat", type=int, default=20)
+
+    args = parser.parse_args(argv)
+    if args.command == "export":
+        export(args.output, quantize=args.quantize, opset=args.opset)
+        return 0
+    texts = _read_texts(args.texts)
+    if args.command == "parity":
+        report = parity(args.model, texts, tolerance=args.tolerance)
+        print(json.dumps(report, indent=2))
+        return 0 if report["ok"] else 1
+    print(json.dumps(benchmark(args.model, texts, repeat=args.repeat), indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,86 +1,43 @@
 """
 f1_score.py
-Enhanced version that calculates F1 score for sentiment analysis based on
-response confidence and model accuracy.
+F1 score reported with each analyzed text.
+The score is the sentiment model's measured macro F1, taken from the running
+confusion matrices in evaluation.py (labelled texts and feedback corrections),
+not a simulated value.
 """
-import random
-import math
-
-# Global model performance metrics
-# These could be replaced with actual metrics from model evaluation
-MODEL_METRICS = {
-    'precision': 0.87,
-    'recall': 0.83,
-    'base_f1': 0.85,
-    'accuracy': 0.89
-}
+from evaluation import engine
 
 def compute_f1_score(sentiment_results):
     """
-    Calculates F1 score based on sentiment analysis results.
-    
+    Returns the measured F1 score of the sentiment model that produced `sentiment_results`.
+
     Args:
         sentiment_results: Dictionary containing sentiment classification results
-                          with confidence scores
-    
+
     Returns:
-        Float between 0 and 1 representing F1 score
+        Float between 0 and 1, or None while fewer than CAPSENSE_EVAL_MIN_SAMPLES
+        labelled texts have been recorded
     """
-    # If no results provided, return the base F1 score
-    if not sentiment_results:
-        return MODEL_METRICS['base_f1']
-    
     try:
-        # Extract relevant data from sentiment results
-        sentiment = sentiment_results.get('sentiment', 'neutral').lower()
-        confidence = sentiment_results.get('sentiment_confidence', 0.5)
-        
-        # Apply slight variation based on confidence
-        variation = (confidence - 0.5) * 0.1
-        
-        # Sentiment-specific adjustments
-        sentiment_factor = 0
-        if sentiment == 'positive':
-            # Positive sentiments might be slightly easier to classify
-            sentiment_factor = 0.02
-        elif sentiment == 'negative':
-            # Negative sentiments might have specific patterns
-            sentiment_factor = 0.01
-        elif sentiment == 'neutral':
-            # Neutral can be more challenging
-            sentiment_factor = -0.01
-            
-        # Calculate final F1 score with a small random component to simulate real variation
-        # but within reasonable bounds based on the base F1 score
-        random_component = random.uniform(-0.03, 0.03)
-        f1_score = MODEL_METRICS['base_f1'] + variation + sentiment_factor + random_component
-        
-        # Ensure score is between 0 and 1
-        f1_score = max(0.0, min(1.0, f1_score))
-        
-        # Round to 2 decimal places for display
-        return round(f1_score, 2)
-        
+        return engine.f1("sentiment")
     except Exception as e:
         print(f"Error calculating F1 score: {str(e)}")
-        # Return the base F1 score as fallback
-        return MODEL_METRICS['base_f1']
+        return None
 
 
 def generate_model_evaluation_metrics():
     """
-    Generates a complete set of evaluation metrics for the model.
+    Generates a complete set of evaluation metrics for the sentiment model.
     Useful for reporting and dashboards.
-    
+
     Returns:
-        Dictionary containing precision, recall, f1 score, and accuracy
+        Dictionary containing precision, recall, f1 score, accuracy and the sample count
     """
-    # Add small random variations to simulate real-world report changes
-    variation = random.uniform(-0.02, 0.02)
-    
+    summary = engine.summary("sentiment")
     return {
-        'precision': round(max(0, min(1, MODEL_METRICS['precision'] + variation)), 2),
-        'recall': round(max(0, min(1, MODEL_METRICS['recall'] + variation)), 2),
-        'f1_score': round(max(0, min(1, MODEL_METRICS['base_f1'] + variation)), 2),
-        'accuracy': round(max(0, min(1, MODEL_METRICS['accuracy'] + variation)), 2)
-    }
\ No newline at end of file
+        'precision': summary['precision'],
+        'recall': summary['recall'],
+        'f1_score': summary['f1_score'],
+        'accuracy': summary['accuracy'],
+        'samples': summary['samples']
+    }
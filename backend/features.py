@@ -0,0 +1,231 @@
+"""
+features.py
+Fused feature extraction for the sklearn models.
+The sentiment and sarcasm vectorizers lowercase and tokenize every text the same
+way, so instead of each running its own transform(), texts are tokenized once
+and the token stream is looked up in a combined vocabulary index that maps each
+term to its column in every vectorizer. The resulting sparse matrices are
+identical to vectorizer.transform().
+
+Vectorizers are grouped by analyzer signature (lowercasing, accent stripping,
+token pattern); within a group, texts are tokenized once, and each distinct
+stop-word list / n-gram range is applied once. Anything that isn't a plain
+word-analyzer CountVectorizer (HashingVectorizer, TfidfVectorizer, custom
+analyzers or tokenizers) falls back to its own transform().
+
+The emotion model is not included: it vectorizes NLTK-preprocessed text, not the
+raw input.
+"""
+import sys
+import threading
+from collections import Counter
+
+import numpy as np
+import scipy.sparse as sp
+from sklearn.feature_extraction.text import CountVectorizer
+
+import model_registry
+
+# Models whose vectorizers read the raw customer text
+FUSED_MODELS = ("sentiment", "sarcasm")
+
+
+def _analyzer_signature(vectorizer):
+    """
+    Returns a hashable description of how a vectorizer turns text into tokens,
+    or None if it can't be fused.
+    """
+    if type(vectorizer) is not CountVectorizer:
+        return None
+    if (vectorizer.analyzer != "word" or vectorizer.preprocessor is not None
+            or vectorizer.tokenizer is not None or vectorizer.input != "content"):
+        return None
+    return (vectorizer.lowercase, vectorizer.strip_accents, vectorizer.token_pattern)
+
+
+def _term_signature(vectorizer):
+    stop_words = vectorizer.get_stop_words()
+    return (frozenset(stop_words) if stop_words else None, tuple(vectorizer.ngram_range))
+
+
+def _terms(tokens, stop_words, ngram_range):
+    """
+    Same as CountVectorizer._word_ngrams: drops stop words, then builds n-grams.
+    """
+    if stop_words is not None:
+        tokens = [w for w in tokens if w not in stop_words]
+    min_n, max_n = ngram_range
+    if max_n == 1:
+        return tokens
+    terms = list(tokens) if min_n == 1 else []
+    n_tokens = len(tokens)
+    for n in range(max(min_n, 2), min(max_n, n_tokens) + 1):
+        for i in range(n_tokens - n + 1):
+            terms.append(" ".join(tokens[i:i + n]))
+    return terms
+
+
+class _TermStream:
+    """
+    Vectorizers of one group that also share stop words and n-gram range, with
+    the combined vocabulary index: term -> column in each vectorizer (-1 if absent).
+    """
+    def __init__(self, signature, members):
+        self.stop_words, self.ngram_range = signature
+        self.members = members  # list of (name, vectorizer)
+        index = {}
+        for k, (_, vectorizer) in enumerate(members):
+            for term, column in vectorizer.vocabulary_.items():
+                columns = index.get(term)
+                if columns is None:
+                    columns = index[term] = [-1] * len(members)
+                columns[k] = column
+        self.index = {term: tuple(columns) for term, columns in index.items()}
+
+
+class _Group:
+    """
+    Vectorizers that tokenize text identically.
+    """
+    def __init__(self, members):
+        first = members[0][1]
+        self.preprocess = first.build_preprocessor()
+        self.tokenize = first.build_tokenizer()
+        streams = {}
+        for name, vectorizer in members:
+            streams.setdefault(_term_signature(vectorizer), []).append((name, vectorizer))
+        self.streams = [_TermStream(signature, stream) for signature, stream in streams.items()]
+
+
+class FusedExtractor:
+    """
+    Transforms texts with several vectorizers at once.
+    `vectorizers` maps a name to a fitted vectorizer; transform() returns a dict
+    with the same names, each holding the CSR matrix vectorizer.transform() would.
+    """
+    def __init__(self, vectorizers):
+        self.vectorizers = dict(vectorizers)
+        grouped = {}
+        self.unfused = []
+        for name, vectorizer in self.vectorizers.items():
+            signature = _analyzer_signature(vectorizer)
+            if signature is None:
+                self.unfused.append(name)
+            else:
+                grouped.setdefault(signature, []).append((name, vectorizer))
+        self.groups = [_Group(members) for members in grouped.values()]
+
+    def transform(self, texts):
+        matrices = {name: self.vectorizers[name].transform(texts) for name in self.unfused}
+        for group in self.groups:
+            token_lists = [group.tokenize(group.preprocess(text)) for text in texts]
+            for stream in group.streams:
+                matrices.update(self._transform_stream(stream, token_lists))
+        return matrices
+
+    def _transform_stream(self, stream, token_lists):
+        n_members = len(stream.members)
+        indices = [[] for _ in range(n_members)]
+        values = [[] for _ in range(n_members)]
+        indptrs = [[0] for _ in range(n_members)]
+        index = stream.index
+
+        for tokens in token_lists:
+            for term, count in Counter(_terms(tokens, stream.stop_words, stream.ngram_range)).items():
+                columns = index.get(term)
+                if columns is None:
+                    continue
+                for k, column in enumerate(columns):
+                    if column >= 0:
+                        indices[k].append(column)
+                        values[k].append(count)
+            for k in range(n_members):
+                indptrs[k].append(len(indices[k]))
+
+        matrices = {}
+        for k, (name, vectorizer) in enumerate(stream.members):
+            data = np.asarray(values[k], dtype=vectorizer.dtype)
+            if vectorizer.binary:
+                data.fill(1)
+            X = sp.csr_matrix(
+                (data, np.asarray(indices[k], dtype=np.int32), np.asarray(indptrs[k], dtype=np.int64)),
+                shape=(len(token_lists), len(vectorizer.vocabulary_))
+            )
+            X.sort_indices()
+            matrices[name] = X
+        return matrices
+
+
+_cached = None  # (model versions, vectorizers, extractor)
+_cache_lock = threading.Lock()
+
+
+def get_extractor():
+    """
+    Returns the extractor for the currently loaded FUSED_MODELS, rebuilding the
+    combined vocabulary index only when one of the models changes.
+    Returns (extractor, {name: vectorizer}); models that aren't available are left out.
+    """
+    global _cached
+    vectorizers = {}
+    for name in FUSED_MODELS:
+        loaded = model_registry.get(name)
+        if loaded:
+            vectorizers[name] = loaded[1]
+    versions = tuple((name, id(v), model_registry.model_version(name)) for name, v in vectorizers.items())
+
+    with _cache_lock:
+        if _cached is None or _cached[0] != versions:
+            _cached = (versions, vectorizers, FusedExtractor(vectorizers))
+        return _cached[2], _cached[1]
+
+
+def extract_features(texts):
+    """
+    Vectorizes `texts` once for all FUSED_MODELS.
+    Non-string rows are converted with str(); classifiers skip the rows they consider invalid.
+    Returns {model name: (vectorizer, X)}; pass the pair to the classifier's batch function,
+    which only uses X if the vectorizer is still the one it has loaded.
+    """
+    extractor, vectorizers = get_extractor()
+    if not vectorizers:
+        return {}
+    texts = [text if isinstance(text, str) else str(text) for text in texts]
+    matrices = extractor.transform(texts)
+    return {name: (vectorizers[name], matrices[name]) for name in vectorizers}
+
+
+def rows_for(features, vectorizer, rows):
+    """
+    Returns the rows of a precomputed feature matrix, or None if `features` is
+    missing or was built with a different vectorizer.
+    """
+    if features is None or features[0] is not vectorizer:
+        return None
+    return features[1][rows]
+
+
+def check_parity(texts):
+    """
+    Compares the fused matrices against each vectorizer's own transform().
+    Returns {model name: number of rows that differ}.
+    """
+    extractor, vectorizers = get_extractor()
+    fused = extractor.transform(texts)
+    report = {}
+    for name, vectorizer in vectorizers.items():
+        diff = abs(fused[name] - vectorizer.transform(texts))
+        report[name] = int(np.count_nonzero(diff.sum(axis=1)))
+    return report
+
+
+if __name__ == "__main__":
+    # Parity check: python features.py samples.txt (one text per line)
+    if len(sys.argv) != 2:
+        print("Usage: python features.py <texts.txt>")
+        sys.exit(1)
+    with open(sys.argv[1], encoding="utf-8") as f:
+        sample = [line.strip() for line in f if line.strip()]
+    mismatches = check_parity(sample)
+    print(f"Rows differing from transform() out of {len(sample)}: {mismatches}")
+    sys.exit(1 if any(mismatches.values()) else 0)
@@ -0,0 +1,108 @@
+"""
+feedback_store.py
+Approve/reject feedback on generated responses, keyed by FeedbackKey.
+
+FeedbackKey is the SHA-256 of the normalized (CustomerText, ResponseText) pair,
+computed here and stored in an indexed column (see migrations.py), so finding
+the row a vote belongs to is an index seek instead of a scan comparing
+LOWER(LTRIM(RTRIM(...))) of every row.
+
+The key is not unique: the same text analyzed twice gives two rows with the
+same key, and a vote updates all of them.
+
+A vote on a pair that was never stored inserts a row, which is counted in the
+daily rollup in the same transaction.
+"""
+import hashlib
+
+import rollup
+
+# Separates the two texts so ("ab", "c") and ("a", "bc") hash differently
+_KEY_SEPARATOR = "\x1f"
+
+
+def normalize_text(text):
+    """
+    Returns the form of a text the feedback key is computed from. Non-string
+    texts (the classifiers accept numbers) are keyed by their str().
+    """
+    return ("" if text is None else str(text)).strip().lower()
+
+
+def feedback_key(customer_text, response_text):
+    """
+    Returns the 64-character hex FeedbackKey of a customer text / response pair.
+    """
+    pair = normalize_text(customer_text) + _KEY_SEPARATOR + normalize_text(response_text)
+    return hashlib.sha256(pair.encode("utf-8")).hexdigest()
+
+
+# SQL Server: one MERGE, with HOLDLOCK so two concurrent votes on a new pair
+# can't both take the insert branch. deleted.approved is the earlier vote
+# (NULL when the row is inserted).
+_MSSQL_UPSERT = """
+MERGE FeedbackResponses WITH (HOLDLOCK) AS target
+USING (SELECT ? AS FeedbackKey, ? AS CustomerText, ? AS ResponseText, ? AS approved) AS source
+ON target.FeedbackKey = source.FeedbackKey
+WHEN MATCHED THEN
+    UPDATE SET approved = source.approved, FeedbackDate = GETDATE()
+WHEN NOT MATCHED THEN
+    INSERT (FeedbackKey, CustomerText, ResponseText, approved, FeedbackDate)
+    VALUES (source.FeedbackKey, source.CustomerText, source.ResponseText, source.approved, GETDATE())
+OUTPUT $action, deleted.approved;
+"""
+
+
+def _upsert_mssql(cursor, key, customer_text, response_text, approved):
+    # Returns (earlier vote, whether a row was inserted)
+    cursor.execute(_MSSQL_UPSERT, (key, customer_text, response_text, approved))
+    rows = cursor.fetchall()
+    if not rows:
+        return None, False
+    return rows[0][1], rows[0][0] == "INSERT"
+
+
+def _upsert_sqlite(cursor, key, customer_text, response_text, approved):
+    # ON CONFLICT needs a unique key, which FeedbackKey isn't (see above).
+    # BEGIN IMMEDIATE takes the write lock up front, so the lookup and the
+    # update/insert run as one unit.
+    cursor.execute("BEGIN IMMEDIATE;")
+    cursor.execute("SELECT approved FROM FeedbackResponses WHERE FeedbackKey = ? LIMIT 1;", (key,))
+    row = cursor.fetchone()
+    if row:
+        cursor.execute(
+            "UPDATE FeedbackResponses SET approved = ?, FeedbackDate = CURRENT_TIMESTAMP "
+            "WHERE FeedbackKey = ?;",
+            (approved, key)
+        )
+        return row[0], False
+    cursor.execute(
+        "INSERT INTO FeedbackResponses (FeedbackKey, CustomerText, ResponseText, approved, FeedbackDate) "
+        "VALUES (?, ?, ?, ?, CURRENT_TIMESTAMP);",
+        (key, customer_text, response_text, approved)
+    )
+    return None, True
+
+
+def upsert_feedback(conn, customer_text, response_text, approved, dialect="mssql"):
+    """
+    Records a vote on the rows of a customer text / response pair, inserting a
+    row if the pair hasn't been stored yet, and commits.
+    Returns the earlier vote (True/False), or None if there wasn't one.
+    """
+    key = feedback_key(customer_text, response_text)
+    cursor = conn.cursor()
+    try:
+        upsert = _upsert_sqlite if dialect == "sqlite" else _upsert_mssql
+        previous, inserted = upsert(cursor, key, customer_text, response_text, 1 if approved else 0)
+        if inserted:
+            rollup.record_inserted_rows(
+                cursor, dialect, [(customer_text, response_text)], ("CustomerText", "ResponseText")
+            )
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        cursor.close()
+    return None if previous is None else bool(previous)
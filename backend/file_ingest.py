@@ -0,0 +1,188 @@
+"""
+file_ingest.py
+CSV / Parquet input and output for /api/respond_file.
+
+The text column is read in chunks (pandas read_csv chunksize for CSV, pyarrow
+iter_batches for Parquet), each chunk goes through the batch pipeline, and its
+results are appended to a temporary CSV or Parquet file that is returned as the
+download. Only one chunk of texts and results is held in memory at a time.
+
+Parquet needs pyarrow (requirements-optional.txt), which is imported only when
+a Parquet file is read or written.
+"""
+import os
+import tempfile
+
+import pandas as pd
+
+FORMATS = ("csv", "parquet")
+UPLOAD_CHUNK_SIZE = int(os.getenv("CAPSENSE_UPLOAD_CHUNK", "500"))
+DEFAULT_TEXT_COLUMN = "customer_text"
+
+MIMETYPES = {
+    "csv": "text/csv",
+    "parquet": "application/vnd.apache.parquet"
+}
+
+# Columns of the result file, in order
+RESULT_COLUMNS = [
+    "row", "input_text",
+    "sentiment", "sentiment_confidence",
+    "sarcasm", "sarcasm_confidence",
+    "emotion", "emotion_confidence",
+    "response_text", "empathy_score", "f1_score"
+]
+
+
+class FileInputError(ValueError):
+    """
+    Raised when an uploaded file can't be read as requested.
+    """
+    pass
+
+
+def _pyarrow_parquet():
+    try:
+        import pyarrow
+        import pyarrow.parquet
+    except ImportError:
+        raise FileInputError(
+            "Parquet support needs the 'pyarrow' package (see requirements-optional.txt), which is not installed."
+        )
+    return pyarrow, pyarrow.parquet
+
+
+def detect_format(filename=None, content_type=None, requested=None):
+    """
+    Returns "csv" or "parquet" from an explicit format, the file extension or the
+    content type, in that order. Raises FileInputError if none of them match.
+    """
+    if requested:
+        requested = requested.lower()
+        if requested not in FORMATS:
+            raise FileInputError(f"Unsupported format '{requested}'; use one of {', '.join(FORMATS)}.")
+        return requested
+    extension = os.path.splitext(filename or "")[1].lower()
+    if extension in (".csv", ".txt"):
+        return "csv"
+    if extension in (".parquet", ".pq"):
+        return "parquet"
+    content_type = (content_type or "").split(";")[0].strip().lower()
+    if content_type in ("text/csv", "text/plain", "application/csv"):
+        return "csv"
+    if "parquet" in content_type:
+        return "parquet"
+    raise FileInputError("Could not tell the file format; pass ?format=csv or ?format=parquet.")
+
+
+def iter_text_chunks(source, fmt, column=DEFAULT_TEXT_COLUMN, chunk_size=None, encoding="utf-8"):
+    """
+    Yields lists of up to `chunk_size` texts from the `column` of a CSV or Parquet
+    file. `source` is a path or a binary file object (seekable for Parquet).
+    Missing values become empty strings.
+    """
+    chunk_size = max(1, chunk_size or UPLOAD_CHUNK_SIZE)
+    if fmt == "parquet":
+        _, parquet = _pyarrow_parquet()
+        try:
+            parquet_file = parquet.ParquetFile(source)
+        except Exception as e:
+            raise FileInputError(f"Could not read the Parquet file: {str(e)}")
+        if column not in parquet_file.schema_arrow.names:
+            raise FileInputError(f"Column '{column}' not found in the Parquet file.")
+        for batch in parquet_file.iter_batches(batch_size=chunk_size, columns=[column]):
+            yield ["" if text is None else str(text) for text in batch.column(0).to_pylist()]
+        return
+
+    try:
+        reader = pd.read_csv(
+            source,
+            usecols=[column],
+            dtype=str,
+            keep_default_na=False,
+            chunksize=chunk_size,
+            encoding=encoding,
+            encoding_errors="replace"
+        )
+        for frame in reader:
+            yield frame[column].tolist()
+    except ValueError as e:
+        # usecols with a missing column, or a malformed file
+        raise FileInputError(f"Could not read column '{column}' from the CSV file: {str(e)}")
+
+
+def flatten_result(index, result):
+    """
+    Returns one result row (a dict with RESULT_COLUMNS) for a pipeline result.
+    """
+    classification = result["classification"]
+    ai_response = result["ai_response"]
+    return {
+        "row": index,
+        "input_text": result["input_text"],
+        "sentiment": classification["sentiment"],
+        "sentiment_confidence": classification["sentiment_confidence"],
+        "sarcasm": bool(classification["sarcasm"]),
+        "sarcasm_confidence": classification["sarcasm_confidence"],
+        "emotion": classification["emotion"],
+        "emotion_confidence": classification["emotion_confidence"],
+        "response_text": ai_response["response_text"],
+        "empathy_score": ai_response["empathy_score"],
+        "f1_score": result["f1_score"]
+    }
+
+
+def _result_schema(pa):
+    # Fixed, so a chunk where a column is all null (e.g. f1_score) keeps the same types
+    types = {
+        "row": pa.int64(), "sarcasm": pa.bool_(),
+        "input_text": pa.string(), "sentiment": pa.string(), "emotion": pa.string(), "response_text": pa.string()
+    }
+    return pa.schema([(name, types.get(name, pa.float64())) for name in RESULT_COLUMNS])
+
+
+class ResultFileWriter:
+    """
+    Appends result rows to a temporary CSV or Parquet file, one chunk at a time.
+    close() finishes the file and returns its path; the caller deletes it.
+    """
+    def __init__(self, fmt, directory=None):
+        self._schema = None
+        if fmt == "parquet":
+            self._pyarrow, self._parquet = _pyarrow_parquet()
+            self._schema = _result_schema(self._pyarrow)
+        self.fmt = fmt
+        handle, self.path = tempfile.mkstemp(suffix="." + fmt, prefix="capsense_results_", dir=directory)
+        os.close(handle)
+        self.rows_written = 0
+        self._parquet_writer = None
+
+    def write(self, rows):
+        if not rows:
+            return
+        frame = pd.DataFrame(rows, columns=RESULT_COLUMNS)
+        if self.fmt == "csv":
+            frame.to_csv(self.path, mode="a", header=self.rows_written == 0, index=False)
+        else:
+            table = self._pyarrow.Table.from_pandas(frame, schema=self._schema, preserve_index=False)
+            if self._parquet_writer is None:
+                self._parquet_writer = self._parquet.ParquetWriter(self.path, self._schema)
+            self._parquet_writer.write_table(table)
+        self.rows_written += len(rows)
+
+    def close(self):
+        if self._parquet_writer is not None:
+            self._parquet_writer.close()
+        elif self.rows_written == 0:
+            # Empty input still gets a file with the header / schema
+            if self.fmt == "csv":
+                pd.DataFrame(columns=RESULT_COLUMNS).to_csv(self.path, index=False)
+            else:
+                self._parquet.write_table(self._schema.empty_table(), self.path)
+        return self.path
+
+    def discard(self):
+        try:
+            os.remove(self.path)
+        except OSError:
+            pass
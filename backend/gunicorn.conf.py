@@ -0,0 +1,61 @@
+"""
+gunicorn.conf.py
+Loads the app (and the models listed in CAPSENSE_PRELOAD) once in the master
+process before forking, so every worker shares the same physical copy of the
+model pages instead of holding private ones.
+
+Usage: gunicorn --config backend/gunicorn.conf.py backend.app:app
+"""
+import gc
+import glob
+import os
+import tempfile
+
+# The backend modules import each other by plain module name
+pythonpath = os.path.dirname(os.path.abspath(__file__))
+
+bind = os.getenv("GUNICORN_BIND", "0.0.0.0:8000")
+workers = int(os.getenv("GUNICORN_WORKERS", "3"))
+timeout = int(os.getenv("GUNICORN_TIMEOUT", "120"))
+
+# Import the app in the master so the models are loaded before fork
+preload_app = True
+
+# The local sklearn models are small and used on every request; the RoBERTa
+# pipeline is only a fallback, so it is left out unless asked for.
+os.environ.setdefault("CAPSENSE_PRELOAD", "sentiment,sarcasm,emotion")
+
+# Workers write their metrics here so /metrics reports the sum of all of them
+# (see metrics.py). Set before the app is imported; files from an earlier run are
+# removed so totals start from zero with the server.
+if not os.getenv("CAPSENSE_METRICS_DIR"):
+    os.environ["CAPSENSE_METRICS_DIR"] = tempfile.mkdtemp(prefix="capsense_metrics_")
+for stale in glob.glob(os.path.join(os.environ["CAPSENSE_METRICS_DIR"], "metrics_*.json*")):
+    os.remove(stale)
+
+
+def pre_fork(server, worker):
+    # Move everything loaded so far into the permanent generation, so the garbage
+    # collector doesn't write to (and un-share) the model objects in the workers.
+    gc.freeze()
+
+
+def post_fork(server, worker):
+    # Split the cores between workers before torch (if ever used) starts its thread pools.
+    # server.cfg.workers also reflects a -w given on the command line; the engines
+    # read the count from GUNICORN_WORKERS (see transformer_engine.torch_thread_settings).
+    os.environ["GUNICORN_WORKERS"] = str(server.cfg.workers)
+    from transformer_engine import configure_torch_threads
+    configure_torch_threads()
+
+    from model_registry import memory_report
+    server.log.info(f"[MEMORY] Worker {worker.pid} started: {memory_report()}")
+
+
+def worker_exit(server, worker):
+    # The last few seconds of this worker's metrics, which stay in the totals after it exits
+    import metrics
+    metrics.flush()
+
+    from model_registry import memory_report
+    server.log.info(f"[MEMORY] Worker {worker.pid} exiting: {memory_report()}")
@@ -0,0 +1,361 @@
+"""
+jobs.py
+Background jobs for large batch analysis.
+A POSTed batch is queued and processed in chunks by an in-process thread pool
+(CAPSENSE_JOB_WORKERS threads per web worker), using the same pipeline as
+respond_batch. Job state, progress and partial results live in a local SQLite
+file (CAPSENSE_JOBS_DB), so any gunicorn worker can answer a poll, not just the
+one running the job.
+
+Each job records the process running it. A queued or running job whose process
+is gone (a restart or a crashed worker) is marked failed the next time a
+process opens the jobs database, so it doesn't stay "running" forever. Finished
+jobs older than CAPSENSE_JOB_TTL seconds are deleted when a new job is
+submitted (0 keeps them).
+
+Job statuses: queued -> running -> completed | failed | cancelled
+"""
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+from database import get_db_connection, DB_BACKEND
+from pipeline import analyze_texts, iter_chunks, feedback_writer, STREAM_CHUNK_SIZE
+
+JOBS_DB_PATH = os.getenv("CAPSENSE_JOBS_DB", "capsense_jobs.db")
+JOB_WORKERS = int(os.getenv("CAPSENSE_JOB_WORKERS", "2"))
+JOB_CHUNK_SIZE = int(os.getenv("CAPSENSE_JOB_CHUNK", str(STREAM_CHUNK_SIZE)))
+JOB_TTL = int(os.getenv("CAPSENSE_JOB_TTL", str(24 * 3600)))
+
+FINISHED_STATUSES = ("completed", "failed", "cancelled")
+
+
+class JobNotFound(KeyError):
+    pass
+
+
+def _connect():
+    # Short-lived connections: cheap for SQLite, and safe across threads and forks
+    conn = sqlite3.connect(JOBS_DB_PATH, timeout=10)
+    conn.row_factory = sqlite3.Row
+    return conn
+
+
+def _process_tag(pid):
+    """
+    Returns an id for the process `pid` that isn't reused after a restart
+    ("<pid>:<start time>" where /proc is available), or None if it isn't running.
+    """
+    if os.path.isdir("/proc/self"):
+        try:
+            with open(f"/proc/{pid}/stat") as f:
+                stat = f.read()
+        except OSError:
+            return None
+        # Field 22 (starttime), counted after the parenthesised command name
+        return f"{pid}:{stat.rsplit(')', 1)[1].split()[19]}"
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return None
+    except PermissionError:
+        pass
+    return str(pid)
+
+
+def _owner_alive(owner):
+    if not owner:
+        return False
+    pid = owner.split(":", 1)[0]
+    return pid.isdigit() and _process_tag(int(pid)) == owner
+
+
+def _fail_orphaned_jobs(conn):
+    # Jobs left queued/running by a process that no longer exists will never finish
+    orphaned = [
+        r["id"] for r in conn.execute("SELECT id, owner FROM jobs WHERE status IN ('queued', 'running');")
+        if not _owner_alive(r["owner"])
+    ]
+    for job_id in orphaned:
+        conn.execute(
+            "UPDATE jobs SET status = 'failed', error = ?, finished_at = ? WHERE id = ?;",
+            ("Interrupted: the server process running the job stopped", time.time(), job_id)
+        )
+    conn.commit()
+    if orphaned:
+        print(f"[JOBS] Marked {len(orphaned)} interrupted jobs as failed")
+
+
+_schema_ready = False
+_schema_lock = threading.Lock()
+
+
+def _ensure_schema():
+    global _schema_ready
+    if _schema_ready:
+        return
+    with _schema_lock:
+        if _schema_ready:
+            return
+        conn = _connect()
+        try:
+            conn.execute("PRAGMA journal_mode=WAL;")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS jobs ("
+                "  id TEXT PRIMARY KEY,"
+                "  status TEXT NOT NULL,"
+                "  total INTEGER NOT NULL,"
+                "  processed INTEGER NOT NULL DEFAULT 0,"
+                "  store_results INTEGER NOT NULL DEFAULT 1,"
+                "  owner TEXT,"
+                "  cancel_requested INTEGER NOT NULL DEFAULT 0,"
+                "  error TEXT,"
+                "  db_report TEXT,"
+                "  created_at REAL NOT NULL,"
+                "  started_at REAL,"
+                "  finished_at REAL"
+                ");"
+            )
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS job_results ("
+                "  job_id TEXT NOT NULL,"
+                "  idx INTEGER NOT NULL,"
+                "  result TEXT NOT NULL,"
+                "  PRIMARY KEY (job_id, idx)"
+                ");"
+            )
+            # Job databases created before the owner column
+            if "owner" not in [r["name"] for r in conn.execute("PRAGMA table_info(jobs);")]:
+                conn.execute("ALTER TABLE jobs ADD COLUMN owner TEXT;")
+            conn.commit()
+            _fail_orphaned_jobs(conn)
+            _schema_ready = True
+        finally:
+            conn.close()
+
+
+_executor = None
+_executor_pid = None
+_executor_lock = threading.Lock()
+
+
+def _get_executor():
+    """
+    Returns this process's job thread pool, creating it after a fork if needed.
+    """
+    global _executor, _executor_pid
+    with _executor_lock:
+        if _executor is None or _executor_pid != os.getpid():
+            _executor = ThreadPoolExecutor(max_workers=max(1, JOB_WORKERS), thread_name_prefix="capsense-job")
+            _executor_pid = os.getpid()
+        return _executor
+
+
+def submit_job(texts, store_in_db=True):
+    """
+    Queues a batch for background analysis.
+    If `store_in_db` is set, results are also written to FeedbackResponses like respond_batch does.
+    Also deletes finished jobs older than JOB_TTL.
+    Returns the job id.
+    """
+    _ensure_schema()
+    job_id = uuid.uuid4().hex
+    conn = _connect()
+    try:
+        conn.execute(
+            "INSERT INTO jobs (id, status, total, store_results, owner, created_at) "
+            "VALUES (?, 'queued', ?, ?, ?, ?);",
+            (job_id, len(texts), 1 if store_in_db else 0, _process_tag(os.getpid()), time.time())
+        )
+        conn.commit()
+    finally:
+        conn.close()
+
+    if JOB_TTL > 0:
+        removed = delete_finished_jobs(JOB_TTL)
+        if removed:
+            print(f"[JOBS] Deleted {removed} finished jobs older than {JOB_TTL}s")
+
+    _get_executor().submit(_run_job, job_id, list(texts), store_in_db)
+    print(f"[JOBS] Queued job {job_id} with {len(texts)} texts")
+    return job_id
+
+
+def _is_cancel_requested(conn, job_id):
+    row = conn.execute("SELECT cancel_requested FROM jobs WHERE id = ?;", (job_id,)).fetchone()
+    return bool(row and row["cancel_requested"])
+
+
+def _run_job(job_id, texts, store_in_db):
+    """
+    Processes a job chunk by chunk, saving results and progress after each chunk
+    and stopping between chunks if cancellation was requested.
+    """
+    conn = _connect()
+    db_report = {"rows_written": 0, "rows_failed": 0, "errors": []}
+    try:
+        if _is_cancel_requested(conn, job_id):
+            _finish(conn, job_id, "cancelled")
+            return
+        conn.execute("UPDATE jobs SET status = 'running', started_at = ? WHERE id = ?;", (time.time(), job_id))
+        conn.commit()
+
+        processed = 0
+        for chunk in iter_chunks(texts, max(1, JOB_CHUNK_SIZE)):
+            if _is_cancel_requested(conn, job_id):
+                _finish(conn, job_id, "cancelled", db_report=db_report)
+                print(f"[JOBS] Job {job_id} cancelled after {processed} texts")
+                return
+
+            results = _analyze_chunk(chunk, store_in_db, db_report)
+            conn.executemany(
+                "INSERT INTO job_results (job_id, idx, result) VALUES (?, ?, ?);",
+                [(job_id, processed + n, json.dumps(result)) for n, result in enumerate(results)]
+            )
+            processed += len(results)
+            conn.execute("UPDATE jobs SET processed = ? WHERE id = ?;", (processed, job_id))
+            conn.commit()
+
+        _finish(conn, job_id, "completed", db_report=db_report)
+        print(f"[JOBS] Job {job_id} completed ({processed} texts)")
+    except Exception as e:
+        print(f"[JOBS] Job {job_id} failed: {str(e)}")
+        try:
+            conn.rollback()
+            _finish(conn, job_id, "failed", error=str(e), db_report=db_report)
+        except Exception as inner:
+            print(f"[JOBS] Could not record failure of job {job_id}: {str(inner)}")
+    finally:
+        conn.close()
+
+
+def _analyze_chunk(chunk, store_in_db, db_report):
+    """
+    Runs one chunk through the pipeline. A pooled DB connection is only held for
+    the chunk, so long jobs don't starve the web requests.
+    """
+    db_conn = get_db_connection() if store_in_db else None
+    if db_conn is None:
+        return analyze_texts(chunk)
+    try:
+        writer = feedback_writer(db_conn, DB_BACKEND)
+        results = analyze_texts(chunk, writer)
+        writer.flush()
+        report = writer.report()
+        db_report["rows_written"] += report["rows_written"]
+        db_report["rows_failed"] += report["rows_failed"]
+        db_report["errors"].extend(report["errors"])
+        return results
+    finally:
+        db_conn.close()
+
+
+def _finish(conn, job_id, status, error=None, db_report=None):
+    conn.execute(
+        "UPDATE jobs SET status = ?, error = ?, db_report = ?, finished_at = ? WHERE id = ?;",
+        (status, error, json.dumps(db_report) if db_report else None, time.time(), job_id)
+    )
+    conn.commit()
+
+
+def _job_dict(row):
+    total = row["total"]
+    return {
+        "job_id": row["id"],
+        "status": row["status"],
+        "total": total,
+        "processed": row["processed"],
+        "store_in_db": bool(row["store_results"]),
+        "progress": round(row["processed"] / total, 4) if total else 1.0,
+        "cancel_requested": bool(row["cancel_requested"]),
+        "error": row["error"],
+        "db_report": json.loads(row["db_report"]) if row["db_report"] else None,
+        "created_at": row["created_at"],
+        "started_at": row["started_at"],
+        "finished_at": row["finished_at"]
+    }
+
+
+def get_job(job_id, offset=0, limit=0):
+    """
+    Returns the job's status and progress. With `limit` > 0, also returns up to
+    `limit` results starting at `offset` (partial results while the job runs).
+    Raises JobNotFound for unknown ids.
+    """
+    _ensure_schema()
+    conn = _connect()
+    try:
+        row = conn.execute("SELECT * FROM jobs WHERE id = ?;", (job_id,)).fetchone()
+        if row is None:
+            raise JobNotFound(job_id)
+        job = _job_dict(row)
+        if limit > 0:
+            job["offset"] = offset
+            job["results"] = [
+                json.loads(r["result"]) for r in conn.execute(
+                    "SELECT result FROM job_results WHERE job_id = ? AND idx >= ? ORDER BY idx LIMIT ?;",
+                    (job_id, offset, limit)
+                )
+            ]
+        return job
+    finally:
+        conn.close()
+
+
+def iter_job_results(job_id):
+    """
+    Yields every stored result of a job in input order, without loading them all at once.
+    """
+    _ensure_schema()
+    conn = _connect()
+    try:
+        for r in conn.execute("SELECT result FROM job_results WHERE job_id = ? ORDER BY idx;", (job_id,)):
+            yield r["result"]
+    finally:
+        conn.close()
+
+
+def cancel_job(job_id):
+    """
+    Requests cancellation. A queued job never starts; a running job stops after
+    its current chunk. Returns the job status after the request.
+    """
+    _ensure_schema()
+    conn = _connect()
+    try:
+        row = conn.execute("SELECT status FROM jobs WHERE id = ?;", (job_id,)).fetchone()
+        if row is None:
+            raise JobNotFound(job_id)
+        if row["status"] not in FINISHED_STATUSES:
+            conn.execute("UPDATE jobs SET cancel_requested = 1 WHERE id = ?;", (job_id,))
+            conn.commit()
+    finally:
+        conn.close()
+    return get_job(job_id)
+
+
+def delete_finished_jobs(older_than_seconds):
+    """
+    Removes finished jobs (and their results) older than the given age.
+    Returns the number of jobs removed.
+    """
+    _ensure_schema()
+    cutoff = time.time() - older_than_seconds
+    conn = _connect()
+    try:
+        placeholders = ", ".join("?" for _ in FINISHED_STATUSES)
+        ids = [r["id"] for r in conn.execute(
+            f"SELECT id FROM jobs WHERE status IN ({placeholders}) AND finished_at < ?;",
+            (*FINISHED_STATUSES, cutoff)
+        )]
+        for job_id in ids:
+            conn.execute("DELETE FROM job_results WHERE job_id = ?;", (job_id,))
+            conn.execute("DELETE FROM jobs WHERE id = ?;", (job_id,))
+        conn.commit()
+        return len(ids)
+    finally:
+        conn.close()
@@ -0,0 +1,357 @@
+"""
+metrics.py
+Lightweight latency and request metrics, exposed in the Prometheus text format
+at /metrics.
+
+    with metrics.timer("classify_sentiment"):
+        ...
+
+Stage timings go to the capsense_stage_duration_seconds histogram; the app adds
+per-endpoint request counts, latencies and error counters.
+
+Metrics are kept per process. With CAPSENSE_METRICS_DIR set (gunicorn.conf.py
+sets it), every process also writes its counters and histograms to a file in
+that directory every CAPSENSE_METRICS_FLUSH seconds and when it exits, and
+/metrics sums the files of all processes, exited workers included. Totals then
+don't depend on which worker answers the scrape and never go backwards (a
+scrape may lag the other workers by up to one flush interval). Counters from
+collectors are summed the same way; collector gauges are those of the
+answering worker (or shared state, like the evaluation metrics).
+
+Set CAPSENSE_METRICS=0 to disable: timer() then returns a shared no-op context
+manager and the counters return immediately.
+"""
+import bisect
+import contextlib
+import glob
+import json
+import os
+import threading
+import time
+
+METRICS_ENABLED = os.getenv("CAPSENSE_METRICS", "1") not in ("0", "false", "no")
+# Directory shared by all workers of one server (see above); empty = per process only
+METRICS_DIR = os.getenv("CAPSENSE_METRICS_DIR", "")
+FLUSH_SECONDS = float(os.getenv("CAPSENSE_METRICS_FLUSH", "5"))
+
+# Seconds; covers sub-millisecond sklearn calls up to slow Phi-3 batches
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5,
+                   1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+_NULL_TIMER = contextlib.nullcontext()
+
+
+def _format_labels(label_names, label_values, extra=None):
+    pairs = list(zip(label_names, label_values))
+    if extra:
+        pairs.append(extra)
+    if not pairs:
+        return ""
+    escaped = []
+    for name, value in pairs:
+        value = str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+        escaped.append(f'{name}="{value}"')
+    return "{" + ",".join(escaped) + "}"
+
+
+class Counter:
+    """
+    A monotonically increasing counter, optionally split by labels.
+    """
+    def __init__(self, name, documentation, label_names=()):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = tuple(label_names)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *label_values, amount=1):
+        if not METRICS_ENABLED:
+            return
+        if METRICS_DIR:
+            _ensure_flusher()
+        with self._lock:
+            self._values[label_values] = self._values.get(label_values, 0) + amount
+
+    def value(self, *label_values):
+        return self._values.get(label_values, 0)
+
+    def _snapshot(self):
+        with self._lock:
+            return dict(self._values)
+
+    def _reset(self):
+        self._lock = threading.Lock()
+        self._values = {}
+
+    def render(self, values=None):
+        """
+        Returns the exposition lines, for this process's values or the given
+        {label values: value} (summed across processes).
+        """
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} counter"]
+        values = self._snapshot() if values is None else values
+        for label_values, value in sorted(values.items()):
+            lines.append(f"{self.name}{_format_labels(self.label_names, label_values)} {value}")
+        return lines
+
+
+class Histogram:
+    """
+    A cumulative histogram of observed values, optionally split by labels.
+    """
+    def __init__(self, name, documentation, label_names=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = tuple(label_names)
+        self.buckets = tuple(sorted(buckets))
+        self._series = {}  # label values -> [bucket counts..., +Inf count, sum]
+        self._lock = threading.Lock()
+
+    def observe(self, value, *label_values):
+        if not METRICS_ENABLED:
+            return
+        if METRICS_DIR:
+            _ensure_flusher()
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(label_values)
+            if series is None:
+                series = [0] * (len(self.buckets) + 1) + [0.0]
+                self._series[label_values] = series
+            series[index] += 1
+            series[-1] += value
+
+    @contextlib.contextmanager
+    def _time(self, label_values):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, *label_values)
+
+    def time(self, *label_values):
+        """
+        Context manager that observes the duration of its block.
+        """
+        if not METRICS_ENABLED:
+            return _NULL_TIMER
+        return self._time(label_values)
+
+    def _snapshot(self):
+        with self._lock:
+            return {label_values: list(series) for label_values, series in self._series.items()}
+
+    def _reset(self):
+        self._lock = threading.Lock()
+        self._series = {}
+
+    def render(self, series_by_labels=None):
+        """
+        Returns the exposition lines, for this process's series or the given
+        {label values: series} (summed across processes).
+        """
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        series_by_labels = self._snapshot() if series_by_labels is None else series_by_labels
+        for label_values, series in sorted(series_by_labels.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), series[:-1]):
+                cumulative += count
+                le = "+Inf" if bound == float("inf") else repr(bound)
+                labels = _format_labels(self.label_names, label_values, ("le", le))
+                lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            labels = _format_labels(self.label_names, label_values)
+            lines.append(f"{self.name}_sum{labels} {series[-1]}")
+            lines.append(f"{self.name}_count{labels} {cumulative}")
+        return lines
+
+
+_metrics = []
+_collectors = []
+
+
+def counter(name, documentation, label_names=()):
+    """
+    Creates and registers a Counter.
+    """
+    metric = Counter(name, documentation, label_names)
+    _metrics.append(metric)
+    return metric
+
+
+def histogram(name, documentation, label_names=(), buckets=DEFAULT_BUCKETS):
+    """
+    Creates and registers a Histogram.
+    """
+    metric = Histogram(name, documentation, label_names, buckets)
+    _metrics.append(metric)
+    return metric
+
+
+def register_collector(collect):
+    """
+    Registers a function called at scrape time. It returns a list of
+    (name, type, documentation, {label_tuple: value}) for values owned elsewhere,
+    such as cache or pool statistics.
+    """
+    _collectors.append(collect)
+
+
+stage_duration = histogram(
+    "capsense_stage_duration_seconds",
+    "Time spent in each pipeline stage.",
+    ("stage",)
+)
+request_duration = histogram(
+    "capsense_request_duration_seconds",
+    "Request latency per endpoint.",
+    ("endpoint", "method")
+)
+requests_total = counter(
+    "capsense_requests_total",
+    "Requests handled per endpoint and status code.",
+    ("endpoint", "method", "status")
+)
+request_errors_total = counter(
+    "capsense_request_errors_total",
+    "Requests that raised an exception or returned a 5xx status.",
+    ("endpoint", "method")
+)
+
+
+def timer(stage):
+    """
+    Times a pipeline stage into capsense_stage_duration_seconds.
+    """
+    if not METRICS_ENABLED:
+        return _NULL_TIMER
+    return stage_duration._time((stage,))
+
+
+def _collect():
+    # Yields every collector's (name, type, documentation, values), skipping failed collectors
+    for collect in _collectors:
+        try:
+            yield from collect()
+        except Exception as e:
+            print(f"[METRICS] Collector failed: {str(e)}")
+
+
+_flusher_pid = None
+_flusher_lock = threading.Lock()
+
+
+def _snapshot_path(pid=None):
+    return os.path.join(METRICS_DIR, f"metrics_{pid or os.getpid()}.json")
+
+
+def flush():
+    """
+    Writes this process's counters and histograms (and collector counters) to
+    its file in CAPSENSE_METRICS_DIR. No-op without the directory.
+    """
+    if not (METRICS_ENABLED and METRICS_DIR):
+        return
+    snapshot = {
+        "metrics": {
+            metric.name: [[list(labels), value] for labels, value in metric._snapshot().items()]
+            for metric in _metrics
+        },
+        "collected": {
+            name: [[[list(pair) for pair in labels], value] for labels, value in values.items()]
+            for name, metric_type, _, values in _collect() if metric_type == "counter"
+        }
+    }
+    path = _snapshot_path()
+    # Written aside and renamed, so a scrape never reads half a file
+    with open(path + ".tmp", "w", encoding="utf-8") as f:
+        json.dump(snapshot, f)
+    os.replace(path + ".tmp", path)
+
+
+def _flush_loop():
+    while True:
+        time.sleep(FLUSH_SECONDS)
+        try:
+            flush()
+        except Exception as e:
+            print(f"[METRICS] Could not write {_snapshot_path()}: {str(e)}")
+
+
+def _ensure_flusher():
+    """
+    Starts this process's flush thread on first use (again in a forked worker).
+    """
+    global _flusher_pid
+    if _flusher_pid == os.getpid():
+        return
+    with _flusher_lock:
+        if _flusher_pid != os.getpid():
+            _flusher_pid = os.getpid()
+            threading.Thread(target=_flush_loop, name="capsense-metrics", daemon=True).start()
+
+
+def _after_fork_in_child():
+    # The parent's values stay in the parent's file; a worker starts from zero,
+    # with fresh locks in case another thread held one at fork time
+    global _flusher_lock
+    _flusher_lock = threading.Lock()
+    for metric in _metrics:
+        metric._reset()
+
+
+if METRICS_DIR and hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_after_fork_in_child)
+
+
+def _merge(total, value):
+    if isinstance(value, list):
+        return [a + b for a, b in zip(total, value)] if total is not None else list(value)
+    return (total or 0) + value
+
+
+def _read_shared():
+    """
+    Sums the files of every process in CAPSENSE_METRICS_DIR, after writing this one's.
+    Returns ({metric name: {labels: value}}, {collector counter name: {labels: value}}).
+    """
+    flush()
+    metric_values, collected = {}, {}
+    for path in glob.glob(os.path.join(METRICS_DIR, "metrics_*.json")):
+        try:
+            with open(path, encoding="utf-8") as f:
+                snapshot = json.load(f)
+        except (OSError, ValueError) as e:
+            print(f"[METRICS] Skipping {path}: {str(e)}")
+            continue
+        for name, entries in snapshot.get("metrics", {}).items():
+            values = metric_values.setdefault(name, {})
+            for labels, value in entries:
+                labels = tuple(labels)
+                values[labels] = _merge(values.get(labels), value)
+        for name, entries in snapshot.get("collected", {}).items():
+            values = collected.setdefault(name, {})
+            for labels, value in entries:
+                labels = tuple(tuple(pair) for pair in labels)
+                values[labels] = _merge(values.get(labels), value)
+    return metric_values, collected
+
+
+def render():
+    """
+    Returns all metrics in the Prometheus text exposition format, summed across
+    processes when CAPSENSE_METRICS_DIR is set.
+    """
+    lines = []
+    shared = _read_shared() if METRICS_ENABLED and METRICS_DIR else None
+    for metric in _metrics:
+        lines.extend(metric.render(shared[0].get(metric.name, {}) if shared else None))
+    for name, metric_type, documentation, values in _collect():
+        if shared and metric_type == "counter":
+            values = shared[1].get(name, values)
+        lines.append(f"# HELP {name} {documentation}")
+        lines.append(f"# TYPE {name} {metric_type}")
+        for labels, value in sorted(values.items()):
+            label_text = _format_labels([k for k, _ in labels], [v for _, v in labels])
+            lines.append(f"{name}{label_text} {value}")
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,390 @@
+"""
+migrations.py
+Schema migrations for the FeedbackResponses database, for both backends
+(CAPSENSE_DB_BACKEND=mssql|sqlite).
+
+Applied versions are recorded in SchemaMigrations; migrate() runs the missing
+ones in order, each committed on its own.
+
+    1  FeedbackResponses base table (created only if it doesn't exist)
+    2  FeedbackKey column (see feedback_store.py) with an index, backfilled
+       in batches for existing rows
+    3  (CreatedAt, Id) index for the dashboard
+    4  FeedbackDailyRollup (see rollup.py), built from the existing rows
+    5  renames the rollup's RowCount column (reserved in T-SQL) to RowTotal
+
+On startup the app reads SchemaMigrations and, if migrations are pending,
+checks whether FeedbackResponses has any row (see startup()). Pending migrations
+are applied there only when the table is missing or empty, so there is nothing
+to backfill; on a database with data they are reported, and applied with
+'python migrations.py migrate' (migrations 2 and 4 scan the whole table).
+Data is never deleted on startup. Emptying the tables is an explicit command.
+
+    python migrations.py migrate          apply pending migrations
+    python migrations.py status           list applied / pending migrations
+    python migrations.py backfill         fill missing FeedbackKey values
+    python migrations.py reset --yes      empty the feedback tables (TRUNCATE)
+"""
+import argparse
+import os
+import sys
+
+from database import get_db_connection, DB_BACKEND
+from feedback_store import feedback_key
+import rollup
+
+# Startup behaviour for pending migrations: check = apply on an empty database,
+# otherwise report only; 1 = always apply; 0 = skip
+AUTO_MIGRATE = os.getenv("CAPSENSE_AUTO_MIGRATE", "check").lower()
+BACKFILL_BATCH_SIZE = int(os.getenv("CAPSENSE_BACKFILL_BATCH", "1000"))
+
+
+def _column_exists(cursor, dialect, table, column):
+    if dialect == "sqlite":
+        cursor.execute(f"PRAGMA table_info({table});")
+        return any(row[1] == column for row in cursor.fetchall())
+    cursor.execute("SELECT COL_LENGTH(?, ?);", (table, column))
+    return cursor.fetchone()[0] is not None
+
+
+def _create_base_schema(conn, dialect):
+    cursor = conn.cursor()
+    if dialect == "sqlite":
+        cursor.execute("""
+        CREATE TABLE IF NOT EXISTS FeedbackResponses (
+            Id INTEGER PRIMARY KEY AUTOINCREMENT,
+            CustomerText TEXT,
+            Sentiment TEXT,
+            ResponseText TEXT,
+            EmpathyScore REAL,
+            SarcasmDetected INTEGER,
+            Emotion TEXT,
+            F1Score REAL,
+            approved INTEGER,
+            FeedbackDate TIMESTAMP,
+            CreatedAt TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        );
+        """)
+    else:
+        cursor.execute("""
+        IF OBJECT_ID('FeedbackResponses', 'U') IS NULL
+        CREATE TABLE FeedbackResponses (
+            Id INT IDENTITY(1,1) PRIMARY KEY,
+            CustomerText NVARCHAR(MAX),
+            Sentiment NVARCHAR(50),
+            ResponseText NVARCHAR(MAX),
+            EmpathyScore FLOAT,
+            SarcasmDetected BIT,
+            Emotion NVARCHAR(50),
+            F1Score FLOAT,
+            approved BIT NULL,
+            FeedbackDate DATETIME NULL,
+            CreatedAt DATETIME NOT NULL DEFAULT GETDATE()
+        );
+        """)
+    conn.commit()
+
+
+def _add_feedback_key(conn, dialect):
+    cursor = conn.cursor()
+    if not _column_exists(cursor, dialect, "FeedbackResponses", "FeedbackKey"):
+        column_type = "TEXT" if dialect == "sqlite" else "CHAR(64) NULL"
+        cursor.execute(f"ALTER TABLE FeedbackResponses ADD FeedbackKey {column_type};")
+    if dialect == "sqlite":
+        cursor.execute(
+            "CREATE INDEX IF NOT EXISTS IX_FeedbackResponses_FeedbackKey "
+            "ON FeedbackResponses (FeedbackKey);"
+        )
+    else:
+        cursor.execute("""
+        IF NOT EXISTS (SELECT 1 FROM sys.indexes
+                       WHERE name = 'IX_FeedbackResponses_FeedbackKey'
+                       AND object_id = OBJECT_ID('FeedbackResponses'))
+        CREATE INDEX IX_FeedbackResponses_FeedbackKey
+            ON FeedbackResponses (FeedbackKey) INCLUDE (approved);
+        """)
+    conn.commit()
+    backfill_feedback_keys(conn, dialect)
+
+
+def _add_created_at_index(conn, dialect):
+    # Keyset pagination and the dashboard aggregates read ranges of this index
+    cursor = conn.cursor()
+    if dialect == "sqlite":
+        cursor.execute(
+            "CREATE INDEX IF NOT EXISTS IX_FeedbackResponses_CreatedAt "
+            "ON FeedbackResponses (CreatedAt, Id);"
+        )
+    else:
+        cursor.execute("""
+        IF NOT EXISTS (SELECT 1 FROM sys.indexes
+                       WHERE name = 'IX_FeedbackResponses_CreatedAt'
+                       AND object_id = OBJECT_ID('FeedbackResponses'))
+        CREATE INDEX IX_FeedbackResponses_CreatedAt
+            ON FeedbackResponses (CreatedAt, Id) INCLUDE (Sentiment, Emotion);
+        """)
+    conn.commit()
+
+
+def _create_rollup(conn, dialect):
+    cursor = conn.cursor()
+    cursor.execute(rollup.create_table_sql(dialect))
+    conn.commit()
+    rollup.backfill(conn, dialect)
+
+
+def _rename_rollup_row_count(conn, dialect):
+    # Tables created by the first version of migration 4 (SQLite accepted the
+    # reserved name RowCount; on SQL Server that CREATE TABLE failed)
+    cursor = conn.cursor()
+    if _column_exists(cursor, dialect, rollup.ROLLUP_TABLE, "RowCount"):
+        if dialect == "sqlite":
+            cursor.execute(f"ALTER TABLE {rollup.ROLLUP_TABLE} RENAME COLUMN RowCount TO RowTotal;")
+        else:
+            cursor.execute(f"EXEC sp_rename '{rollup.ROLLUP_TABLE}.[RowCount]', 'RowTotal', 'COLUMN';")
+    conn.commit()
+
+
+# (version, description, function(conn, dialect)), in order
+MIGRATIONS = [
+    (1, "FeedbackResponses base table", _create_base_schema),
+    (2, "FeedbackKey column and index", _add_feedback_key),
+    (3, "(CreatedAt, Id) index", _add_created_at_index),
+    (4, "FeedbackDailyRollup table", _create_rollup),
+    (5, "FeedbackDailyRollup RowCount renamed to RowTotal", _rename_rollup_row_count),
+]
+
+
+def backfill_feedback_keys(conn, dialect, batch_size=None):
+    """
+    Fills FeedbackKey for rows that don't have one, walking the table by Id in
+    batches and committing after each batch.
+    Returns the number of rows updated.
+    """
+    batch_size = batch_size or BACKFILL_BATCH_SIZE
+    if dialect == "sqlite":
+        select = ("SELECT Id, CustomerText, ResponseText FROM FeedbackResponses "
+                  "WHERE FeedbackKey IS NULL AND Id > ? ORDER BY Id LIMIT ?;")
+        params = lambda last_id: (last_id, batch_size)
+    else:
+        select = ("SELECT TOP (?) Id, CustomerText, ResponseText FROM FeedbackResponses "
+                  "WHERE FeedbackKey IS NULL AND Id > ? ORDER BY Id;")
+        params = lambda last_id: (batch_size, last_id)
+
+    cursor = conn.cursor()
+    updated = 0
+    last_id = 0
+    while True:
+        cursor.execute(select, params(last_id))
+        rows = cursor.fetchall()
+        if not rows:
+            break
+        cursor.executemany(
+            "UPDATE FeedbackResponses SET FeedbackKey = ? WHERE Id = ?;",
+            [(feedback_key(customer_text, response_text), row_id)
+             for row_id, customer_text, response_text in rows]
+        )
+        conn.commit()
+        updated += len(rows)
+        last_id = rows[-1][0]
+    if updated:
+        print(f"[MIGRATE] Backfilled FeedbackKey for {updated} rows")
+    return updated
+
+
+def _ensure_migrations_table(cursor, dialect):
+    if dialect == "sqlite":
+        cursor.execute(
+            "CREATE TABLE IF NOT EXISTS SchemaMigrations ("
+            "  Version INTEGER PRIMARY KEY,"
+            "  Description TEXT NOT NULL,"
+            "  AppliedAt TIMESTAMP DEFAULT CURRENT_TIMESTAMP"
+            ");"
+        )
+    else:
+        cursor.execute(
+            "IF OBJECT_ID('SchemaMigrations', 'U') IS NULL "
+            "CREATE TABLE SchemaMigrations ("
+            "  Version INT PRIMARY KEY,"
+            "  Description NVARCHAR(200) NOT NULL,"
+            "  AppliedAt DATETIME NOT NULL DEFAULT GETDATE()"
+            ");"
+        )
+
+
+def applied_versions(conn, dialect):
+    """
+    Returns the set of migration versions already applied.
+    """
+    cursor = conn.cursor()
+    _ensure_migrations_table(cursor, dialect)
+    conn.commit()
+    cursor.execute("SELECT Version FROM SchemaMigrations;")
+    return {row[0] for row in cursor.fetchall()}
+
+
+def migrate(conn=None, dialect=None):
+    """
+    Applies the migrations that haven't run yet.
+    Returns the list of versions applied, or None if the database isn't available.
+    """
+    dialect = dialect or DB_BACKEND
+    own_conn = conn is None
+    conn = conn or get_db_connection()
+    if conn is None:
+        print("[MIGRATE] Database not available, skipping migrations")
+        return None
+    applied = []
+    try:
+        done = applied_versions(conn, dialect)
+        cursor = conn.cursor()
+        for version, description, apply in MIGRATIONS:
+            if version in done:
+                continue
+            print(f"[MIGRATE] Applying {version}: {description}")
+            apply(conn, dialect)
+            cursor.execute(
+                "INSERT INTO SchemaMigrations (Version, Description) VALUES (?, ?);",
+                (version, description)
+            )
+            conn.commit()
+            applied.append(version)
+        cursor.close()
+    except Exception as e:
+        conn.rollback()
+        print(f"[MIGRATE ERROR] {str(e)}")
+        raise
+    finally:
+        if own_conn:
+            conn.close()
+    return applied
+
+
+def pending_versions(conn, dialect):
+    """
+    Returns the versions in MIGRATIONS that haven't been applied, in order.
+    Only reads SchemaMigrations, so the cost doesn't depend on the data tables.
+    """
+    done = applied_versions(conn, dialect)
+    return [version for version, _, _ in MIGRATIONS if version not in done]
+
+
+def _has_feedback_rows(conn, dialect):
+    # One-row probe: whether applying the migrations would have data to scan
+    cursor = conn.cursor()
+    if dialect == "sqlite":
+        cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'FeedbackResponses';")
+        if cursor.fetchone() is None:
+            return False
+        cursor.execute("SELECT 1 FROM FeedbackResponses LIMIT 1;")
+    else:
+        cursor.execute("SELECT OBJECT_ID('FeedbackResponses', 'U');")
+        if cursor.fetchone()[0] is None:
+            return False
+        cursor.execute("SELECT TOP 1 1 FROM FeedbackResponses;")
+    has_rows = cursor.fetchone() is not None
+    cursor.close()
+    return has_rows
+
+
+def startup(dialect=None):
+    """
+    Schema check run when the app starts. Reads SchemaMigrations (a few rows),
+    plus one row of FeedbackResponses if migrations are pending, so restarts
+    take the same time whatever the table sizes.
+    With CAPSENSE_AUTO_MIGRATE=check (the default), pending migrations are
+    applied only if FeedbackResponses is missing or empty, and otherwise
+    reported for 'python migrations.py migrate'. 1 always applies them (the
+    backfills then scan the table before the app serves), 0 skips the check.
+    Returns the pending versions left unapplied, or None if not checked.
+    """
+    if AUTO_MIGRATE == "0":
+        return None
+    dialect = dialect or DB_BACKEND
+    conn = get_db_connection()
+    if conn is None:
+        print("[INIT] Database not available, skipping schema check")
+        return None
+    try:
+        pending = pending_versions(conn, dialect)
+        if not pending:
+            return []
+        if AUTO_MIGRATE != "1" and _has_feedback_rows(conn, dialect):
+            print(f"[INIT WARNING] Schema migrations pending: {pending}; the app may fail to store "
+                  f"results until you run 'python migrations.py migrate'")
+            return pending
+        migrate(conn, dialect)
+        return []
+    finally:
+        conn.close()
+
+
+def reset(conn, dialect):
+    """
+    Empties FeedbackResponses and FeedbackDailyRollup, keeping the schema.
+    SQL Server uses TRUNCATE TABLE (deallocates pages instead of logging every
+    row, and resets the identity); SQLite's equivalent is an unqualified DELETE,
+    which drops the pages without visiting rows, plus resetting the Id sequence.
+    """
+    tables = ["FeedbackResponses", rollup.ROLLUP_TABLE]
+    cursor = conn.cursor()
+    try:
+        for table in tables:
+            if dialect == "sqlite":
+                cursor.execute(f"DELETE FROM {table};")
+            else:
+                cursor.execute(f"TRUNCATE TABLE {table};")
+        if dialect == "sqlite":
+            cursor.execute("SELECT 1 FROM sqlite_master WHERE name = 'sqlite_sequence';")
+            if cursor.fetchone():
+                cursor.execute("DELETE FROM sqlite_sequence WHERE name IN (?, ?);", tables)
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        cursor.close()
+    print(f"[RESET] Emptied {', '.join(tables)}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Schema migrations and maintenance for the feedback database.")
+    commands = parser.add_subparsers(dest="command", required=True)
+    commands.add_parser("migrate", help="apply pending migrations")
+    commands.add_parser("status", help="list migrations and whether they are applied")
+    commands.add_parser("backfill", help="fill FeedbackKey for rows that lack it")
+    reset_cmd = commands.add_parser("reset", help="delete all feedback rows (irreversible)")
+    reset_cmd.add_argument("--yes", action="store_true", help="confirm deleting all rows")
+    args = parser.parse_args(argv)
+
+    if args.command == "reset" and not args.yes:
+        print("[RESET] This deletes every row of FeedbackResponses and FeedbackDailyRollup; "
+              "run again with --yes to confirm.")
+        return 1
+    if args.command == "migrate":
+        applied = migrate()
+        if applied is None:
+            return 1
+        print(f"[MIGRATE] Applied: {applied or 'nothing, schema is current'}")
+        return 0
+
+    conn = get_db_connection()
+    if conn is None:
+        print("[MIGRATE] Database not available")
+        return 1
+    try:
+        if args.command == "status":
+            done = applied_versions(conn, DB_BACKEND)
+            for version, description, _ in MIGRATIONS:
+                print(f"{version:>3}  {'applied' if version in done else 'pending'}  {description}")
+        elif args.command == "backfill":
+            backfill_feedback_keys(conn, DB_BACKEND)
+        else:
+            reset(conn, DB_BACKEND)
+    finally:
+        conn.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,256 @@
+"""
+model_registry.py
+Central registry for the classifier models.
+Each classifier module registers a loader function at import time, but nothing
+is loaded until the model is first requested. A worker therefore only pays for
+the models it actually uses (e.g. the RoBERTa pipeline is never built while the
+local sarcasm model works).
+
+Set CAPSENSE_PRELOAD to a comma-separated list of model names (or "all") to
+load chosen models eagerly, e.g. CAPSENSE_PRELOAD=sentiment,emotion
+
+When gunicorn preloads the app (see gunicorn.conf.py), models listed in
+CAPSENSE_PRELOAD are loaded once in the master and shared copy-on-write by the
+forked workers. Artifacts are loaded with joblib's mmap_mode so their numpy
+arrays are backed by the page cache and shared by every process reading them.
+"""
+import os
+import threading
+import time
+
+import joblib
+
+try:
+    import resource
+except ImportError:
+    # Not available on Windows
+    resource = None
+
+PRELOAD_ENV_VAR = "CAPSENSE_PRELOAD"
+
+# 'r' memory-maps numpy arrays read-only; set CAPSENSE_MMAP_MODE=none to load them into private memory
+MMAP_MODE = os.getenv("CAPSENSE_MMAP_MODE", "r")
+if MMAP_MODE.lower() in ("", "none", "off"):
+    MMAP_MODE = None
+
+# count | hashing: which family of sklearn artifacts to serve (see train_models.py)
+VECTORIZER_MODE = os.getenv("CAPSENSE_VECTORIZER", "count").lower()
+
+
+class _Entry:
+    """
+    Holds a registered loader and the state of the model it produces.
+    """
+    def __init__(self, loader, version=None):
+        self.loader = loader
+        self.version = version
+        self.version_override = None
+        self.value = None
+        self.attempted = False
+        self.load_seconds = None
+        self.error = None
+        self.lock = threading.Lock()
+
+
+_entries = {}
+_entries_lock = threading.Lock()
+
+
+def register(name, loader, version=None):
+    """
+    Registers a loader for a model. The loader takes no arguments and returns the
+    loaded object, or None if the model is not available.
+    `version` is a string, or a zero-argument function returning one, that
+    identifies the artifacts (see artifact_version()); caches use it in their keys.
+    Registering the same name twice keeps the first loader.
+    """
+    with _entries_lock:
+        if name not in _entries:
+            _entries[name] = _Entry(loader, version)
+
+
+def get(name):
+    """
+    Returns the model registered under `name`, loading it on first use.
+    Returns None if the loader failed or found no model. A failed load is not
+    retried on every call; use reload() to try again.
+    """
+    entry = _entries.get(name)
+    if entry is None:
+        raise KeyError(f"No model registered under '{name}'")
+
+    if entry.attempted:
+        return entry.value
+
+    with entry.lock:
+        # Another thread may have finished loading while we waited
+        if not entry.attempted:
+            start = time.perf_counter()
+            try:
+                entry.value = entry.loader()
+                entry.error = None
+            except Exception as e:
+                print(f"[MODEL REGISTRY] Failed to load '{name}': {str(e)}")
+                entry.value = None
+                entry.error = str(e)
+            entry.load_seconds = round(time.perf_counter() - start, 3)
+            entry.attempted = True
+            print(f"[MODEL REGISTRY] Loaded '{name}' in {entry.load_seconds}s "
+                  f"({'available' if entry.value is not None else 'unavailable'})")
+    return entry.value
+
+
+def set_model(name, value):
+    """
+    Replaces the loaded value for a model, e.g. right after retraining it.
+    """
+    entry = _entries.get(name)
+    if entry is None:
+        raise KeyError(f"No model registered under '{name}'")
+    with entry.lock:
+        entry.value = value
+        entry.attempted = True
+        entry.error = None
+        # Results cached for the previous model must not be reused
+        entry.version_override = f"set-{time.time()}"
+
+
+def reload(name):
+    """
+    Discards the current value for a model and loads it again.
+    """
+    entry = _entries.get(name)
+    if entry is None:
+        raise KeyError(f"No model registered under '{name}'")
+    with entry.lock:
+        entry.attempted = False
+        entry.value = None
+    return get(name)
+
+
+def model_version(name):
+    """
+    Returns the version string of a registered model ("" if it has none).
+    """
+    entry = _entries.get(name)
+    if entry is None:
+        raise KeyError(f"No model registered under '{name}'")
+    if entry.version_override:
+        return entry.version_override
+    if callable(entry.version):
+        # Resolved once; artifacts don't change under a running worker
+        entry.version = entry.version()
+    return entry.version or ""
+
+
+def artifact_path(base_dir, filename, mode=None):
+    """
+    Returns the path of a model artifact for the selected vectorizer mode.
+    Hashing-mode artifacts live in a 'hashing' subfolder under the same file names.
+    """
+    if (mode or VECTORIZER_MODE) == "hashing":
+        return os.path.join(base_dir, "hashing", filename)
+    return os.path.join(base_dir, filename)
+
+
+def artifact_version(*paths):
+    """
+    Builds a version string from the size and modification time of artifact files.
+    """
+    parts = []
+    for path in paths:
+        try:
+            stat = os.stat(path)
+            parts.append(f"{os.path.basename(path)}:{stat.st_size}:{int(stat.st_mtime)}")
+        except OSError:
+            parts.append(f"{os.path.basename(path)}:missing")
+    return "|".join(parts)
+
+
+def is_loaded(name):
+    """
+    Returns True if the model has been loaded successfully.
+    """
+    entry = _entries.get(name)
+    return bool(entry and entry.attempted and entry.value is not None)
+
+
+def registered_models():
+    """
+    Returns the names of all registered models.
+    """
+    return list(_entries.keys())
+
+
+def status():
+    """
+    Reports what is registered and what is loaded in this process.
+    Returns a dict like {"sentiment": {"loaded": True, "load_seconds": 0.12, "error": None}}
+    """
+    report = {}
+    for name, entry in _entries.items():
+        report[name] = {
+            "loaded": entry.attempted and entry.value is not None,
+            "attempted": entry.attempted,
+            "load_seconds": entry.load_seconds,
+            "error": entry.error
+        }
+    return report
+
+
+def preload(names=None):
+    """
+    Loads the given models now instead of on first use.
+    If `names` is None, the list is read from the CAPSENSE_PRELOAD environment variable.
+    Returns the list of names that were requested.
+    """
+    if names is None:
+        raw = os.getenv(PRELOAD_ENV_VAR, "")
+        names = [n.strip() for n in raw.split(",") if n.strip()]
+
+    if "all" in names:
+        names = registered_models()
+
+    for name in names:
+        if name not in _entries:
+            print(f"[MODEL REGISTRY] Unknown model '{name}' in preload list, skipping")
+            continue
+        get(name)
+    return names
+
+
+def load_artifact(path):
+    """
+    Loads a joblib/pickle artifact, memory-mapping its numpy arrays when possible.
+    Arrays inside compressed files cannot be mapped; joblib then loads them normally.
+    """
+    return joblib.load(path, mmap_mode=MMAP_MODE)
+
+
+def memory_report():
+    """
+    Reports the memory usage of the current process (in kB).
+    On Linux, 'pss' splits shared pages between the processes that map them,
+    which shows how much a gunicorn worker really costs on top of the master.
+    """
+    report = {"pid": os.getpid()}
+    if resource is not None:
+        report["max_rss_kb"] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    fields = {
+        "Rss": "rss_kb",
+        "Pss": "pss_kb",
+        "Shared_Clean": "shared_clean_kb",
+        "Shared_Dirty": "shared_dirty_kb",
+        "Private_Clean": "private_clean_kb",
+        "Private_Dirty": "private_dirty_kb"
+    }
+    try:
+        with open("/proc/self/smaps_rollup") as f:
+            for line in f:
+                key, _, value = line.partition(":")
+                if key in fields:
+                    report[fields[key]] = int(value.split()[0])
+    except OSError:
+        # Not Linux, or smaps_rollup not available
+        pass
+    return report
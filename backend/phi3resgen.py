@@ -5,6 +5,11 @@ import os
 import time
 import random
 import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FuturesTimeout
+from requests.adapters import HTTPAdapter
+
+from result_cache import response_cache, make_key
 
 # Set up logging
 logging.basicConfig(
@@ -16,6 +21,54 @@ logging.basicConfig(
 )
 logger = logging.getLogger("phi3resgen")
 
+# Concurrency and deadlines for Phi-3 calls
+PHI3_MAX_CONCURRENCY = int(os.getenv("PHI3_MAX_CONCURRENCY", "8"))
+PHI3_TIMEOUT = float(os.getenv("PHI3_TIMEOUT", "30"))
+PHI3_CONNECT_TIMEOUT = float(os.getenv("PHI3_CONNECT_TIMEOUT", "5"))
+
+_session = None
+_session_pid = None
+_session_lock = threading.Lock()
+
+def get_session():
+    """
+    Returns a requests.Session shared by all Phi-3 calls in this process, so
+    connections to the endpoint are kept alive and reused instead of paying a
+    TLS handshake per call. A new session is created after a fork.
+    """
+    global _session, _session_pid
+    with _session_lock:
+        if _session is None or _session_pid != os.getpid():
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=1, pool_maxsize=max(PHI3_MAX_CONCURRENCY, 1))
+            session.mount("https://", adapter)
+            session.mount("http://", adapter)
+            _session = session
+            _session_pid = os.getpid()
+        return _session
+
+def _get_credentials():
+    """
+    Returns (endpoint, key) from the environment, logging what is missing.
+    """
+    phi3_endpoint = os.getenv("PHI3_ENDPOINT")
+    phi3_key = os.getenv("PHI3_KEY")
+    if not phi3_endpoint or not phi3_key:
+        logger.warning("PHI3_ENDPOINT or PHI3_KEY environment variables not set. Using fallback response.")
+        logger.info(f"PHI3_ENDPOINT is {'set' if phi3_endpoint else 'NOT SET'}")
+        logger.info(f"PHI3_KEY is {'set (value hidden)' if phi3_key else 'NOT SET'}")
+    return phi3_endpoint, phi3_key
+
+def _response_cache_key(customer_text, classification_data, phi3_endpoint):
+    # Identical feedback with identical classification gets the same reply
+    return make_key(
+        "response", customer_text,
+        classification_data.get('sentiment', 'neutral'),
+        classification_data.get('emotion', 'unknown'),
+        classification_data.get('sarcasm', False),
+        phi3_endpoint
+    )
+
 def generate_response(customer_text, classification_data):
     """
     Generates an empathetic response using Phi-3, based on:
@@ -24,23 +77,115 @@ def generate_response(customer_text, classification_data):
     Returns: {"response_text": str, "empathy_score": float}
     """
     # Get environment variables
-    phi3_endpoint = os.getenv("PHI3_ENDPOINT")
-    phi3_key = os.getenv("PHI3_KEY")
+    phi3_endpoint, phi3_key = _get_credentials()
     
     # Check if environment variables are properly set
     if not phi3_endpoint or not phi3_key:
-        logger.warning("PHI3_ENDPOINT or PHI3_KEY environment variables not set. Using fallback response.")
-        logger.info(f"PHI3_ENDPOINT is {'set' if phi3_endpoint else 'NOT SET'}")
-        logger.info(f"PHI3_KEY is {'set (value hidden)' if phi3_key else 'NOT SET'}")
         return generate_fallback_response(customer_text, classification_data)
     
+    cache_key = _response_cache_key(customer_text, classification_data, phi3_endpoint)
+    cached = response_cache.get(cache_key)
+    if cached is not None:
+        logger.debug("Using cached PHI-3 response")
+        return cached
+    
     # Log the environment variables (partially masked for security)
-    logger.info(f"Using PHI3_ENDPOINT: {phi3_endpoint}")
+    logger.debug(f"Using PHI3_ENDPOINT: {phi3_endpoint}")
     if phi3_key:
         masked_key = phi3_key[:5] + "..." + phi3_key[-5:] if len(phi3_key) > 10 else "***"
-        logger.info(f"Using PHI3_KEY: {masked_key}")
+        logger.debug(f"Using PHI3_KEY: {masked_key}")
     
-    # If environment variables are properly set, use Azure AI
+    ai_response = request_phi3_response(customer_text, classification_data, phi3_endpoint, phi3_key)
+    if ai_response is None:
+        # Something went wrong, use fallback
+        return generate_fallback_response(customer_text, classification_data)
+
+    # Only real model output is cached; fallbacks are cheap to rebuild
+    response_cache.set(cache_key, ai_response)
+    return ai_response
+
+def generate_responses(items, max_concurrency=None, timeout=None, endpoint=None, api_key=None):
+    """
+    Generates responses for many texts at once.
+    `items` is a list of (customer_text, classification_data) tuples.
+    Up to `max_concurrency` requests (default PHI3_MAX_CONCURRENCY) run in parallel
+    over the shared keep-alive session; each request has a `timeout` second deadline
+    (default PHI3_TIMEOUT). Rows whose call fails or times out get a fallback response.
+    `endpoint` and `api_key` override PHI3_ENDPOINT / PHI3_KEY, e.g. to point at a stub server.
+    Returns a list of {"response_text": str, "empathy_score": float} in the same order as `items`.
+    """
+    if not items:
+        return []
+
+    if endpoint and api_key:
+        phi3_endpoint, phi3_key = endpoint, api_key
+    else:
+        phi3_endpoint, phi3_key = _get_credentials()
+    if not phi3_endpoint or not phi3_key:
+        return [generate_fallback_response(text, data) for text, data in items]
+
+    max_concurrency = max(1, max_concurrency or PHI3_MAX_CONCURRENCY)
+    timeout = timeout or PHI3_TIMEOUT
+
+    results = [None] * len(items)
+    pending = {}  # cache key -> indices waiting for that response
+    for i, (customer_text, classification_data) in enumerate(items):
+        cache_key = _response_cache_key(customer_text, classification_data, phi3_endpoint)
+        if cache_key in pending:
+            pending[cache_key].append(i)
+            continue
+        cached = response_cache.get(cache_key)
+        if cached is not None:
+            results[i] = cached
+        else:
+            pending[cache_key] = [i]
+
+    if pending:
+        workers = min(max_concurrency, len(pending))
+        logger.info(f"Calling PHI-3 API for {len(pending)} texts with concurrency {workers}")
+        # Every request is bounded by its socket timeouts; the wall-clock deadline
+        # also covers servers that trickle bytes slowly enough to dodge them.
+        rounds = -(-len(pending) // workers)
+        deadline = time.monotonic() + timeout * rounds + PHI3_CONNECT_TIMEOUT
+        executor = ThreadPoolExecutor(max_workers=workers)
+        try:
+            futures = {
+                executor.submit(
+                    request_phi3_response,
+                    items[indices[0]][0], items[indices[0]][1],
+                    phi3_endpoint, phi3_key, timeout
+                ): cache_key
+                for cache_key, indices in pending.items()
+            }
+            for future, cache_key in futures.items():
+                try:
+                    ai_response = future.result(timeout=max(0.0, deadline - time.monotonic()))
+                except FuturesTimeout:
+                    logger.error("PHI-3 request missed the batch deadline, using fallback")
+                    ai_response = None
+                except Exception as e:
+                    logger.error(f"Error generating response with Azure AI: {str(e)}")
+                    ai_response = None
+                if ai_response is not None:
+                    response_cache.set(cache_key, ai_response)
+                for i in pending[cache_key]:
+                    results[i] = dict(ai_response) if ai_response is not None else None
+        finally:
+            # Don't wait for requests that missed the deadline
+            executor.shutdown(wait=False, cancel_futures=True)
+
+    for i, ai_response in enumerate(results):
+        if ai_response is None:
+            results[i] = generate_fallback_response(items[i][0], items[i][1])
+    return results
+
+def request_phi3_response(customer_text, classification_data, phi3_endpoint, phi3_key, timeout=None):
+    """
+    Makes one call to the Phi-3 endpoint over the shared session.
+    Returns {"response_text": str, "empathy_score": float}, or None if the call
+    failed, timed out or returned nothing usable.
+    """
+    timeout = timeout or PHI3_TIMEOUT
     try:
         # Prepare the prompt
         prompt = f"""
@@ -75,39 +220,39 @@ def generate_response(customer_text, classification_data):
         }
         
         # Make the request to Azure AI Foundry
-        logger.info(f"Calling PHI-3 API at {phi3_endpoint}")
-        response = requests.post(
+        logger.debug(f"Calling PHI-3 API at {phi3_endpoint}")
+        response = get_session().post(
             phi3_endpoint, 
             headers=headers,
             json=payload,
-            timeout=30
+            timeout=(min(PHI3_CONNECT_TIMEOUT, timeout), timeout)
         )
         
         # Check response status
-        logger.info(f"Received status code: {response.status_code}")
+        logger.debug(f"Received status code: {response.status_code}")
         
         # If successful, process the response
         if response.status_code == 200:
             try:
                 # Log the raw response text for debugging
-                logger.info(f"Raw response text: {response.text[:200]}...")
+                logger.debug(f"Raw response text: {response.text[:200]}...")
                 
                 # Parse the JSON response
                 if response.text.strip():
                     response_data = response.json()
-                    logger.info(f"Response type: {type(response_data)}")
+                    logger.debug(f"Response type: {type(response_data)}")
                     
                     # Check if we got usable data
                     if isinstance(response_data, dict) and response_data:
-                        logger.info(f"Response keys: {list(response_data.keys())}")
+                        logger.debug(f"Response keys: {list(response_data.keys())}")
                     elif isinstance(response_data, list):
-                        logger.info(f"Response is a list with {len(response_data)} items")
+                        logger.debug(f"Response is a list with {len(response_data)} items")
                         
                     # Extract the response text using a simple approach
                     response_text = extract_response_text(response_data)
                     
                     if response_text:
-                        logger.info(f"Successfully extracted response: {response_text[:50]}...")
+                        logger.debug(f"Successfully extracted response: {response_text[:50]}...")
                         empathy_score = calculate_empathy_score(response_text, classification_data)
                         return {
                             "response_text": response_text,
@@ -122,12 +267,11 @@ def generate_response(customer_text, classification_data):
         else:
             logger.error(f"API request failed with status {response.status_code}: {response.text}")
         
-        # If we get here, something went wrong, use fallback
-        return generate_fallback_response(customer_text, classification_data)
+        return None
             
     except Exception as e:
         logger.error(f"Error generating response with Azure AI: {str(e)}")
-        return generate_fallback_response(customer_text, classification_data)
+        return None
 
 def extract_response_text(response_data):
     """
@@ -177,7 +321,7 @@ def generate_fallback_response(customer_text, classification_data):
     """
     Generates a fallback response when the Azure AI service is unavailable
     """
-    logger.info("Using fallback response generation")
+    logger.debug("Using fallback response generation")
     sentiment = classification_data.get('sentiment', 'neutral').lower()
     emotion = classification_data.get('emotion', 'unknown').lower()
     is_sarcastic = classification_data.get('sarcasm', False)
@@ -225,7 +369,7 @@ def generate_fallback_response(customer_text, classification_data):
     
     empathy_score = 0.7  # Reasonable default for templated responses
     
-    logger.info(f"Generated fallback response: {template[:50]}...")
+    logger.debug(f"Generated fallback response: {template[:50]}...")
     return {
         "response_text": template,
         "empathy_score": empathy_score
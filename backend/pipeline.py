@@ -0,0 +1,186 @@
+"""
+pipeline.py
+The analysis steps shared by every endpoint that processes batches of texts:
+classify -> generate response -> F1 score -> buffered DB row.
+respond_batch, the streaming mode and background jobs all run chunks of texts
+through analyze_texts().
+"""
+import os
+
+from classifier_sentiment import classify_sentiment_batch
+from classifier_sarcasm import detect_sarcasm_batch, sarcasm_config_version
+from classifier_emotion import detect_emotion_batch
+from bulk_writer import BulkInsertWriter
+from features import extract_features
+from feedback_store import feedback_key
+from phi3resgen import generate_responses
+from f1_score import compute_f1_score
+import metrics
+import model_registry
+import result_cache
+import rollup
+from result_cache import classification_cache
+
+# Texts per chunk when a batch is processed incrementally (streaming, jobs)
+STREAM_CHUNK_SIZE = int(os.getenv("CAPSENSE_STREAM_CHUNK", "32"))
+# Tokenize once for the sentiment and sarcasm vectorizers (set to 0 to use each transform())
+FUSED_FEATURES = os.getenv("CAPSENSE_FUSED_FEATURES", "1") not in ("0", "false", "no")
+
+def build_classification_data(sentiment_result, sarcasm_result, emotion_result):
+    """
+    Merges the three classifier outputs into the dict passed to generate_response.
+    """
+    return {
+        "sentiment": sentiment_result["sentiment"],
+        "sentiment_confidence": sentiment_result["confidence"],
+        "sarcasm": sarcasm_result["sarcasm"],
+        "sarcasm_confidence": sarcasm_result["confidence"],
+        "emotion": emotion_result["emotion"],
+        "emotion_confidence": emotion_result["confidence"]
+    }
+
+# Columns written for every analyzed text; FeedbackKey lets /api/feedback find the row by index
+FEEDBACK_INSERT_COLUMNS = [
+    "CustomerText", "Sentiment", "ResponseText", "EmpathyScore",
+    "SarcasmDetected", "Emotion", "F1Score", "FeedbackKey"
+]
+
+def feedback_writer(conn, dialect, chunk_size=None):
+    """
+    Returns a BulkInsertWriter for FeedbackResponses that also updates the daily rollup.
+    """
+    return BulkInsertWriter(
+        conn, "FeedbackResponses", FEEDBACK_INSERT_COLUMNS,
+        chunk_size=chunk_size, dialect=dialect, after_insert=rollup.record_inserted_rows
+    )
+
+def build_feedback_row(text, classification_data, ai_response, f1_score):
+    """
+    Returns the FeedbackResponses row for one analyzed text, in FEEDBACK_INSERT_COLUMNS order.
+    """
+    return (
+        text,
+        classification_data["sentiment"],
+        ai_response["response_text"],
+        ai_response["empathy_score"],
+        classification_data["sarcasm"],
+        classification_data["emotion"],
+        f1_score,
+        feedback_key(text, ai_response["response_text"])
+    )
+
+# Bump when the shape or meaning of cached classifications changes
+# (2: confidences come from predict_proba instead of a fixed 0.8)
+CLASSIFICATION_FORMAT = 2
+
+def _classification_versions():
+    """
+    Versions of every model that can contribute to a classification, used in cache keys.
+    """
+    return [CLASSIFICATION_FORMAT, sarcasm_config_version()] + [
+        model_registry.model_version(name)
+        for name in ("sentiment", "sarcasm", "sarcasm_pipeline", "emotion")
+    ]
+
+def classify_texts(texts):
+    """
+    Runs sentiment, sarcasm and emotion classification over a list of texts
+    using the vectorized batch entry points of each classifier.
+    The sentiment and sarcasm features come from one fused pass (see features.py).
+    Results are cached by normalized text, and duplicates within the batch are
+    classified only once.
+    Returns a list of (sentiment_result, classification_data) tuples in input order.
+    """
+    versions = _classification_versions()
+    results = [None] * len(texts)
+    pending = {}  # cache key -> indices of texts still to classify
+    uncacheable = []
+    for i, text in enumerate(texts):
+        if not isinstance(text, str):
+            uncacheable.append(i)
+            continue
+        key = result_cache.make_key("classification", text, *versions)
+        if key in pending:
+            pending[key].append(i)
+            continue
+        cached = classification_cache.get(key)
+        if cached is not None:
+            results[i] = (cached["sentiment_result"], cached["classification_data"])
+        else:
+            pending[key] = [i]
+
+    keys = list(pending.keys())
+    todo = [pending[key][0] for key in keys] + uncacheable
+    if todo:
+        batch = [texts[i] for i in todo]
+        features = {}
+        if FUSED_FEATURES:
+            with metrics.timer("extract_features"):
+                features = extract_features(batch)
+        with metrics.timer("classify_sentiment"):
+            sentiment_results = classify_sentiment_batch(batch, features.get("sentiment"))
+        with metrics.timer("classify_sarcasm"):
+            sarcasm_results = detect_sarcasm_batch(batch, features.get("sarcasm"))
+        with metrics.timer("classify_emotion"):
+            emotion_results = detect_emotion_batch(batch)
+
+        for n, i in enumerate(todo):
+            sentiment_result = sentiment_results[n]
+            classification_data = build_classification_data(sentiment_result, sarcasm_results[n], emotion_results[n])
+            if n < len(keys):
+                classification_cache.set(keys[n], {
+                    "sentiment_result": sentiment_result,
+                    "classification_data": classification_data
+                })
+                for j in pending[keys[n]]:
+                    results[j] = (dict(sentiment_result), dict(classification_data))
+            else:
+                results[i] = (sentiment_result, classification_data)
+    return results
+
+def analyze_texts(texts, writer=None):
+    """
+    Runs the full pipeline over a list of texts.
+    If a BulkInsertWriter is given, one FeedbackResponses row per text is buffered into it.
+    Returns a list of {"input_text", "classification", "ai_response", "f1_score"} dicts in input order.
+    """
+    # Classify the whole batch in one vectorized pass per model
+    classified = classify_texts(texts)
+
+    # Generate AI-based responses concurrently
+    with metrics.timer("generate_response"):
+        ai_responses = generate_responses([
+            (text, classification_data)
+            for text, (_, classification_data) in zip(texts, classified)
+        ])
+
+    results = []
+    for text, (sentiment_result, classification_data), ai_response in zip(texts, classified, ai_responses):
+        # Calculate F1 score
+        with metrics.timer("compute_f1_score"):
+            f1_score = compute_f1_score(sentiment_result)
+
+        # Buffer the row; the writer inserts in chunks
+        if writer:
+            writer.add(build_feedback_row(text, classification_data, ai_response, f1_score))
+
+        results.append({
+            "input_text": text,
+            "classification": classification_data,
+            "ai_response": ai_response,
+            "f1_score": f1_score
+        })
+    return results
+
+def iter_chunks(iterable, size):
+    """
+    Yields lists of up to `size` items from any iterable, without materializing it.
+    """
+    chunk = []
+    for item in iterable:
+        chunk.append(item)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
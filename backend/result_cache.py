@@ -0,0 +1,242 @@
+"""
+result_cache.py
+Content-addressed cache for classification results and generated responses.
+The same feedback text is often submitted many times (duplicate survey answers,
+re-uploaded CSVs), so results are keyed by a hash of the normalized text and the
+versions of the models that produced them.
+
+Two tiers:
+  - an in-memory LRU bounded by CAPSENSE_CACHE_SIZE entries (per worker)
+  - an optional SQLite file at CAPSENSE_CACHE_PATH, shared by all workers
+
+Entries expire after CAPSENSE_CACHE_TTL seconds. Set CAPSENSE_CACHE=0 to disable.
+Values must be JSON-serializable; they are stored as JSON so callers always get
+their own copy back.
+"""
+import collections
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+
+CACHE_ENABLED = os.getenv("CAPSENSE_CACHE", "1") not in ("0", "false", "no")
+CACHE_SIZE = int(os.getenv("CAPSENSE_CACHE_SIZE", "10000"))
+CACHE_TTL = float(os.getenv("CAPSENSE_CACHE_TTL", "86400"))
+CACHE_PATH = os.getenv("CAPSENSE_CACHE_PATH", "")
+
+
+def normalize_text(text):
+    """
+    Normalizes text for cache keys: collapses whitespace. Case is kept: the
+    sklearn vectorizers lowercase, but the RoBERTa sarcasm model (pipeline and
+    cascade modes, and the backup in local mode) and the response generator
+    are case-sensitive.
+    """
+    return " ".join(str(text).split())
+
+
+def make_key(namespace, text, *parts):
+    """
+    Returns a hex SHA-256 key for `text` in `namespace`.
+    `parts` carry anything else the result depends on, such as model versions.
+    """
+    h = hashlib.sha256()
+    h.update(namespace.encode("utf-8"))
+    for part in (normalize_text(text),) + tuple(str(p) for p in parts):
+        h.update(b"\x1f")
+        h.update(part.encode("utf-8"))
+    return h.hexdigest()
+
+
+class _DiskTier:
+    """
+    SQLite-backed tier shared across processes.
+    The connection is opened lazily and re-opened after a fork, since a SQLite
+    handle must not be shared between a gunicorn master and its workers.
+    """
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = None
+        self._pid = None
+        # Fail early if the file can't be created
+        with self._lock:
+            self._connection()
+
+    def _connection(self):
+        # Must be called with the lock held
+        if self._conn is None or self._pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=5, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL;")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS result_cache ("
+                "  key TEXT PRIMARY KEY,"
+                "  value TEXT NOT NULL,"
+                "  expires_at REAL NOT NULL"
+                ");"
+            )
+            conn.commit()
+            self._conn = conn
+            self._pid = os.getpid()
+        return self._conn
+
+    def get(self, key):
+        with self._lock:
+            row = self._connection().execute(
+                "SELECT value, expires_at FROM result_cache WHERE key = ?;", (key,)
+            ).fetchone()
+        if row is None or row[1] < time.time():
+            return None, None
+        return row[0], row[1]
+
+    def set(self, key, value, expires_at):
+        with self._lock:
+            conn = self._connection()
+            conn.execute(
+                "INSERT OR REPLACE INTO result_cache (key, value, expires_at) VALUES (?, ?, ?);",
+                (key, value, expires_at)
+            )
+            conn.commit()
+
+    def purge_expired(self):
+        with self._lock:
+            conn = self._connection()
+            cursor = conn.execute("DELETE FROM result_cache WHERE expires_at < ?;", (time.time(),))
+            conn.commit()
+            return cursor.rowcount
+
+
+class ResultCache:
+    """
+    LRU + TTL cache with an optional shared on-disk tier and hit/miss counters.
+    """
+    def __init__(self, name, max_entries=CACHE_SIZE, ttl=CACHE_TTL, disk_path=CACHE_PATH,
+                 enabled=CACHE_ENABLED):
+        self.name = name
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.enabled = enabled
+        self._memory = collections.OrderedDict()  # key -> (expires_at, json value)
+        self._lock = threading.Lock()
+        self._disk = None
+        if enabled and disk_path:
+            try:
+                self._disk = _DiskTier(disk_path)
+            except Exception as e:
+                print(f"[CACHE] Could not open disk cache at {disk_path}: {str(e)}")
+
+        self.counters = {
+            "memory_hits": 0,
+            "disk_hits": 0,
+            "misses": 0,
+            "sets": 0,
+            "evictions": 0,
+            "errors": 0
+        }
+
+    def get(self, key):
+        """
+        Returns the cached value for `key`, or None on a miss.
+        """
+        if not self.enabled:
+            return None
+
+        now = time.time()
+        with self._lock:
+            item = self._memory.get(key)
+            if item is not None:
+                if item[0] >= now:
+                    self._memory.move_to_end(key)
+                    self.counters["memory_hits"] += 1
+                    return json.loads(item[1])
+                del self._memory[key]
+
+        if self._disk is not None:
+            try:
+                raw, expires_at = self._disk.get(key)
+            except Exception as e:
+                print(f"[CACHE] Disk read failed: {str(e)}")
+                raw = None
+                with self._lock:
+                    self.counters["errors"] += 1
+            if raw is not None:
+                with self._lock:
+                    self._store_memory(key, raw, expires_at)
+                    self.counters["disk_hits"] += 1
+                return json.loads(raw)
+
+        with self._lock:
+            self.counters["misses"] += 1
+        return None
+
+    def set(self, key, value):
+        """
+        Stores a JSON-serializable value under `key`.
+        """
+        if not self.enabled:
+            return
+
+        try:
+            raw = json.dumps(value)
+        except (TypeError, ValueError) as e:
+            print(f"[CACHE] Value for {self.name} is not serializable: {str(e)}")
+            with self._lock:
+                self.counters["errors"] += 1
+            return
+
+        expires_at = time.time() + self.ttl
+        with self._lock:
+            self._store_memory(key, raw, expires_at)
+            self.counters["sets"] += 1
+
+        if self._disk is not None:
+            try:
+                self._disk.set(key, raw, expires_at)
+            except Exception as e:
+                print(f"[CACHE] Disk write failed: {str(e)}")
+                with self._lock:
+                    self.counters["errors"] += 1
+
+    def _store_memory(self, key, raw, expires_at):
+        # Must be called with the lock held
+        self._memory[key] = (expires_at, raw)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)
+            self.counters["evictions"] += 1
+
+    def clear(self):
+        """
+        Empties the in-memory tier and purges expired disk entries.
+        """
+        with self._lock:
+            self._memory.clear()
+        if self._disk is not None:
+            self._disk.purge_expired()
+
+    def stats(self):
+        """
+        Returns hit/miss counters, the hit rate and the current size.
+        """
+        with self._lock:
+            stats = dict(self.counters)
+            stats["memory_entries"] = len(self._memory)
+        lookups = stats["memory_hits"] + stats["disk_hits"] + stats["misses"]
+        stats["hit_rate"] = round((stats["memory_hits"] + stats["disk_hits"]) / lookups, 4) if lookups else 0.0
+        stats["enabled"] = self.enabled
+        stats["disk_tier"] = self._disk is not None
+        return stats
+
+
+# Shared caches used by the app and the response generator
+classification_cache = ResultCache("classification")
+response_cache = ResultCache("response")
+
+
+def all_stats():
+    """
+    Returns the stats of every shared cache, keyed by cache name.
+    """
+    return {cache.name: cache.stats() for cache in (classification_cache, response_cache)}
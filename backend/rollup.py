@@ -0,0 +1,243 @@
+"""
+rollup.py
+FeedbackDailyRollup: per day x sentiment x emotion x sarcasm, the number of
+FeedbackResponses rows and the sums/counts behind average empathy and F1.
+
+The rollup is updated in the same transaction as the rows it counts:
+  - bulk inserts (respond_batch, streaming, jobs) through the writer from
+    pipeline.feedback_writer()
+  - rows inserted by /api/feedback, see feedback_store.py
+so the dashboard aggregates read a few hundred rollup rows instead of grouping
+the whole table. The day is the database's current date, the same clock the
+CreatedAt default uses.
+
+Rows with no sentiment / emotion / sarcasm value (feedback on a text that was
+never analyzed) are counted under '' / '' / -1.
+
+    python rollup.py backfill [--since YYYY-MM-DD]   rebuild from FeedbackResponses
+    python rollup.py check                            compare with FeedbackResponses
+"""
+import argparse
+import sys
+from collections import defaultdict
+
+ROLLUP_TABLE = "FeedbackDailyRollup"
+
+_DIMENSIONS = ("Sentiment", "Emotion", "SarcasmDetected")
+# Not "RowCount": that is a reserved keyword in T-SQL
+_MEASURES = ("RowTotal", "EmpathySum", "EmpathyCount", "F1Sum", "F1Count")
+_KEY_COLUMNS = ("Day",) + _DIMENSIONS
+
+
+def create_table_sql(dialect):
+    """
+    Returns the CREATE TABLE statement for the rollup.
+    """
+    if dialect == "sqlite":
+        return f"""
+        CREATE TABLE IF NOT EXISTS {ROLLUP_TABLE} (
+            Day TEXT NOT NULL,
+            Sentiment TEXT NOT NULL,
+            Emotion TEXT NOT NULL,
+            SarcasmDetected INTEGER NOT NULL,
+            RowTotal INTEGER NOT NULL,
+            EmpathySum REAL NOT NULL,
+            EmpathyCount INTEGER NOT NULL,
+            F1Sum REAL NOT NULL,
+            F1Count INTEGER NOT NULL,
+            PRIMARY KEY (Day, Sentiment, Emotion, SarcasmDetected)
+        );
+        """
+    return f"""
+    IF OBJECT_ID('{ROLLUP_TABLE}', 'U') IS NULL
+    CREATE TABLE {ROLLUP_TABLE} (
+        Day DATE NOT NULL,
+        Sentiment NVARCHAR(50) NOT NULL,
+        Emotion NVARCHAR(50) NOT NULL,
+        SarcasmDetected INT NOT NULL,
+        RowTotal BIGINT NOT NULL,
+        EmpathySum FLOAT NOT NULL,
+        EmpathyCount BIGINT NOT NULL,
+        F1Sum FLOAT NOT NULL,
+        F1Count BIGINT NOT NULL,
+        PRIMARY KEY (Day, Sentiment, Emotion, SarcasmDetected)
+    );
+    """
+
+
+def _today(dialect):
+    return "DATE(CURRENT_TIMESTAMP)" if dialect == "sqlite" else "CAST(GETDATE() AS DATE)"
+
+
+def _dimension_key(sentiment, emotion, sarcasm):
+    return (
+        "" if sentiment is None else str(sentiment),
+        "" if emotion is None else str(emotion),
+        -1 if sarcasm is None else int(bool(sarcasm))
+    )
+
+
+def deltas_for_rows(rows, columns):
+    """
+    Sums inserted rows (tuples in `columns` order) into rollup increments.
+    Returns {(sentiment, emotion, sarcasm): [count, empathy sum, empathy count, f1 sum, f1 count]}.
+    """
+    index = {name: i for i, name in enumerate(columns)}
+    value = lambda row, name: row[index[name]] if name in index else None
+    deltas = defaultdict(lambda: [0, 0.0, 0, 0.0, 0])
+    for row in rows:
+        delta = deltas[_dimension_key(value(row, "Sentiment"), value(row, "Emotion"), value(row, "SarcasmDetected"))]
+        delta[0] += 1
+        empathy, f1 = value(row, "EmpathyScore"), value(row, "F1Score")
+        if empathy is not None:
+            delta[1] += float(empathy)
+            delta[2] += 1
+        if f1 is not None:
+            delta[3] += float(f1)
+            delta[4] += 1
+    return deltas
+
+
+def apply_deltas(cursor, dialect, deltas):
+    """
+    Adds the increments to today's rollup rows. Does not commit: call it in the
+    transaction that inserts the counted rows.
+    """
+    if not deltas:
+        return
+    params = [key + tuple(delta) for key, delta in deltas.items()]
+    if dialect == "sqlite":
+        cursor.executemany(
+            f"INSERT INTO {ROLLUP_TABLE} ({', '.join(_KEY_COLUMNS + _MEASURES)}) "
+            f"VALUES ({_today(dialect)}, ?, ?, ?, ?, ?, ?, ?, ?) "
+            f"ON CONFLICT (Day, Sentiment, Emotion, SarcasmDetected) DO UPDATE SET "
+            + ", ".join(f"{m} = {m} + excluded.{m}" for m in _MEASURES) + ";",
+            params
+        )
+        return
+    cursor.executemany(
+        f"""
+        MERGE {ROLLUP_TABLE} WITH (HOLDLOCK) AS target
+        USING (SELECT {_today(dialect)} AS Day, ? AS Sentiment, ? AS Emotion, ? AS SarcasmDetected,
+                      ? AS RowTotal, ? AS EmpathySum, ? AS EmpathyCount, ? AS F1Sum, ? AS F1Count) AS source
+        ON target.Day = source.Day AND target.Sentiment = source.Sentiment
+           AND target.Emotion = source.Emotion AND target.SarcasmDetected = source.SarcasmDetected
+        WHEN MATCHED THEN UPDATE SET
+            {", ".join(f"{m} = target.{m} + source.{m}" for m in _MEASURES)}
+        WHEN NOT MATCHED THEN INSERT ({", ".join(_KEY_COLUMNS + _MEASURES)})
+            VALUES ({", ".join("source." + c for c in _KEY_COLUMNS + _MEASURES)});
+        """,
+        params
+    )
+
+
+def record_inserted_rows(cursor, dialect, rows, columns):
+    """
+    BulkInsertWriter after_insert hook: counts a chunk of inserted rows.
+    """
+    apply_deltas(cursor, dialect, deltas_for_rows(rows, columns))
+
+
+def _aggregate_select(dialect, since=None):
+    # The raw-table aggregate the rollup must equal
+    day = "DATE(CreatedAt)" if dialect == "sqlite" else "CAST(CreatedAt AS DATE)"
+    sarcasm = "COALESCE(CAST(SarcasmDetected AS INT), -1)"
+    sql = (
+        f"SELECT {day}, COALESCE(Sentiment, ''), COALESCE(Emotion, ''), {sarcasm}, "
+        f"COUNT(*), COALESCE(SUM(EmpathyScore), 0), COUNT(EmpathyScore), "
+        f"COALESCE(SUM(F1Score), 0), COUNT(F1Score) "
+        f"FROM FeedbackResponses"
+    )
+    params = []
+    if since is not None:
+        sql += " WHERE CreatedAt >= ?"
+        params.append(since)
+    sql += f" GROUP BY {day}, COALESCE(Sentiment, ''), COALESCE(Emotion, ''), {sarcasm}"
+    return sql, params
+
+
+def backfill(conn, dialect, since=None):
+    """
+    Rebuilds the rollup (from day `since`, 'YYYY-MM-DD', or entirely) from
+    FeedbackResponses in one transaction.
+    Returns the number of rollup rows written.
+    """
+    cursor = conn.cursor()
+    try:
+        if since is None:
+            cursor.execute(f"DELETE FROM {ROLLUP_TABLE};")
+        else:
+            cursor.execute(f"DELETE FROM {ROLLUP_TABLE} WHERE Day >= ?;", (since,))
+        select, params = _aggregate_select(dialect, since)
+        cursor.execute(
+            f"INSERT INTO {ROLLUP_TABLE} ({', '.join(_KEY_COLUMNS + _MEASURES)}) {select};",
+            params
+        )
+        cursor.execute(f"SELECT COUNT(*) FROM {ROLLUP_TABLE}" + (" WHERE Day >= ?;" if since else ";"),
+                       (since,) if since else ())
+        written = cursor.fetchone()[0]
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        cursor.close()
+    print(f"[ROLLUP] Rebuilt {written} rollup rows" + (f" from {since}" if since else ""))
+    return written
+
+
+def _normalize(row):
+    key = (str(row[0])[:10], row[1], row[2], int(row[3]))
+    measures = (int(row[4]), round(float(row[5]), 6), int(row[6]), round(float(row[7]), 6), int(row[8]))
+    return key, measures
+
+
+def check(conn, dialect):
+    """
+    Compares the rollup with an aggregate of FeedbackResponses.
+    Returns a list of {"key", "rollup", "actual"} for every group that differs.
+    """
+    cursor = conn.cursor()
+    select, params = _aggregate_select(dialect)
+    cursor.execute(select + ";", params)
+    actual = dict(_normalize(row) for row in cursor.fetchall())
+    cursor.execute(f"SELECT {', '.join(_KEY_COLUMNS + _MEASURES)} FROM {ROLLUP_TABLE};")
+    stored = dict(_normalize(row) for row in cursor.fetchall())
+    cursor.close()
+
+    differences = []
+    for key in sorted(set(actual) | set(stored)):
+        if actual.get(key) != stored.get(key):
+            differences.append({"key": list(key), "rollup": stored.get(key), "actual": actual.get(key)})
+    return differences
+
+
+def main(argv=None):
+    from database import get_db_connection, DB_BACKEND
+
+    parser = argparse.ArgumentParser(description="Backfill or check the FeedbackDailyRollup table.")
+    commands = parser.add_subparsers(dest="command", required=True)
+    backfill_cmd = commands.add_parser("backfill")
+    backfill_cmd.add_argument("--since", help="only rebuild days from this date (YYYY-MM-DD)")
+    commands.add_parser("check")
+    args = parser.parse_args(argv)
+
+    conn = get_db_connection()
+    if conn is None:
+        print("[ROLLUP] Database not available")
+        return 1
+    try:
+        if args.command == "backfill":
+            backfill(conn, DB_BACKEND, args.since)
+            return 0
+        differences = check(conn, DB_BACKEND)
+        for difference in differences:
+            print(f"[ROLLUP] {difference}")
+        print(f"[ROLLUP] {len(differences)} groups differ")
+        return 1 if differences else 0
+    finally:
+        conn.close()
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,44 @@
+"""
+scoring.py
+Label + confidence from a single scoring pass.
+Calling predict() and then predict_proba() scores the same matrix twice; the
+label is just the class with the highest probability, so one predict_proba call
+gives both. Works on the sparse matrices the vectorizers return.
+"""
+import numpy as np
+
+# Used when a model has no predict_proba (e.g. a plain linear SVM)
+DEFAULT_CONFIDENCE = 0.8
+
+
+def predict_with_proba(model, X):
+    """
+    Scores X once.
+    Returns (labels, probabilities): the predicted labels and the full
+    (n_samples, n_classes) probability matrix, or None as the matrix when the
+    model does not support predict_proba.
+    """
+    if not hasattr(model, "predict_proba"):
+        return model.predict(X), None
+    probabilities = model.predict_proba(X)
+    labels = model.classes_[np.argmax(probabilities, axis=1)]
+    return labels, probabilities
+
+
+def predict_with_confidence(model, X):
+    """
+    Returns (labels, confidences), where the confidence of each row is the
+    probability of its predicted label.
+    """
+    labels, probabilities = predict_with_proba(model, X)
+    if probabilities is None:
+        return labels, np.full(len(labels), DEFAULT_CONFIDENCE)
+    return labels, probabilities.max(axis=1)
+
+
+def class_probability(model, probabilities, cls):
+    """
+    Returns the column of `probabilities` for class `cls`.
+    """
+    index = int(np.flatnonzero(model.classes_ == cls)[0])
+    return probabilities[:, index]
@@ -0,0 +1,260 @@
+"""
+stream_input.py
+Reads customer texts from a request body incrementally, so a large upload can be
+processed while it is still arriving instead of being parsed into memory first.
+
+Two body formats are supported:
+  - NDJSON (Content-Type: application/x-ndjson): one text per line, either a JSON
+    string or an object with a "customer_text" field
+  - the regular JSON payload {"customer_texts": ["...", "..."]}, whose array is
+    decoded one element at a time
+
+A single JSON value (one text, or any field skipped on the way) may not be
+longer than CAPSENSE_STREAM_MAX_VALUE characters.
+"""
+import codecs
+import json
+import os
+import re
+
+READ_SIZE = 64 * 1024
+MAX_VALUE_CHARS = int(os.getenv("CAPSENSE_STREAM_MAX_VALUE", str(1024 * 1024)))
+
+_decoder = json.JSONDecoder()
+_WHITESPACE = " \t\n\r"
+# What the value scanner stops at inside / outside strings, and the end of a bare scalar
+_STRING_SPECIAL_RE = re.compile(r'["\\]')
+_STRUCTURE_RE = re.compile(r'["\[\]{}]')
+_SCALAR_END_RE = re.compile(r"[\s,\]}]")
+
+
+class StreamInputError(ValueError):
+    """
+    Raised when the request body is not in a supported format.
+    """
+    pass
+
+
+def _text_from_record(record, line_number):
+    if isinstance(record, dict):
+        if "customer_text" not in record:
+            raise StreamInputError(f"Line {line_number}: object has no 'customer_text' field.")
+        return record["customer_text"]
+    return record
+
+
+def iter_ndjson_texts(stream):
+    """
+    Yields one text per non-empty NDJSON line of a binary stream.
+    """
+    for line_number, line in enumerate(stream, start=1):
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            record = json.loads(line)
+        except ValueError as e:
+            raise StreamInputError(f"Line {line_number}: invalid JSON ({str(e)})")
+        yield _text_from_record(record, line_number)
+
+
+class _ValueScanner:
+    """
+    Finds where a JSON value ends, fed one piece of text at a time, without
+    decoding it. Keeps the string / escape / nesting state between pieces, so
+    each character is looked at once however many reads the value spans.
+    """
+    def __init__(self):
+        self.scalar = None
+        self.depth = 0
+        self.in_string = False
+        self.escape = False
+
+    def feed(self, text):
+        """
+        Returns the offset in `text` just past the end of the value, or None if
+        the value continues in the next piece. The first piece starts with the value.
+        """
+        i = 0
+        if self.scalar is None:
+            self.scalar = text[:1] not in ('"', "[", "{")
+        if self.scalar:
+            match = _SCALAR_END_RE.search(text)
+            return match.start() if match else None
+        while True:
+            if self.escape:
+                if i >= len(text):
+                    return None
+                i += 1
+                self.escape = False
+            if self.in_string:
+                match = _STRING_SPECIAL_RE.search(text, i)
+                if match is None:
+                    return None
+                i = match.end()
+                if match.group() == "\\":
+                    self.escape = True
+                    continue
+                self.in_string = False
+                if self.depth == 0:
+                    return i
+                continue
+            match = _STRUCTURE_RE.search(text, i)
+            if match is None:
+                return None
+            i = match.end()
+            char = match.group()
+            if char == '"':
+                self.in_string = True
+            elif char in "[{":
+                self.depth += 1
+            else:
+                self.depth -= 1
+                if self.depth <= 0:
+                    return i
+
+
+class _JsonReader:
+    """
+    Minimal pull parser over a binary stream: decodes one JSON value at a time
+    from a buffer that is refilled as needed.
+    """
+    def __init__(self, stream):
+        self.stream = stream
+        self.decoder = codecs.getincrementaldecoder("utf-8")()
+        self.buffer = ""
+        self.pos = 0
+        self.eof = False
+
+    def _read(self):
+        # Next decoded piece of the body ("" once the end is reached)
+        chunk = self.stream.read(READ_SIZE)
+        if not chunk:
+            self.eof = True
+            return self.decoder.decode(b"", final=True)
+        return self.decoder.decode(chunk)
+
+    def _fill(self):
+        if self.eof:
+            return False
+        self.buffer = self.buffer[self.pos:] + self._read()
+        self.pos = 0
+        return True
+
+    def peek(self):
+        """
+        Returns the next non-whitespace character without consuming it ("" at the end).
+        """
+        while True:
+            while self.pos < len(self.buffer) and self.buffer[self.pos] in _WHITESPACE:
+                self.pos += 1
+            if self.pos < len(self.buffer):
+                return self.buffer[self.pos]
+            if not self._fill():
+                return ""
+
+    def expect(self, char):
+        if self.peek() != char:
+            raise StreamInputError(f"Expected '{char}' in JSON body.")
+        self.pos += 1
+
+    def value(self):
+        """
+        Decodes the next complete JSON value.
+        """
+        self.peek()
+        try:
+            value, end = _decoder.raw_decode(self.buffer, self.pos)
+            # A number at the end of the buffer may continue in the next chunk
+            if end < len(self.buffer) or self.eof:
+                self.pos = end
+                return value
+        except ValueError:
+            if self.eof:
+                raise StreamInputError("Invalid or truncated JSON body.")
+        return self._long_value()
+
+    def _long_value(self):
+        """
+        Reads a value that continues past the buffer: the pieces are collected
+        until the scanner finds its end, then joined and decoded once.
+        """
+        scanner = _ValueScanner()
+        pieces = [self.buffer[self.pos:]]
+        length = 0
+        end = scanner.feed(pieces[0])
+        while end is None:
+            length += len(pieces[-1])
+            if length > MAX_VALUE_CHARS:
+                raise StreamInputError(f"A JSON value in the body is longer than {MAX_VALUE_CHARS} characters.")
+            if self.eof:
+                if not scanner.scalar:
+                    raise StreamInputError("Invalid or truncated JSON body.")
+                end = 0
+                break
+            pieces.append(self._read())
+            end = scanner.feed(pieces[-1])
+        end += length
+        text = "".join(pieces)
+        try:
+            value, decoded_end = _decoder.raw_decode(text)
+        except ValueError:
+            raise StreamInputError("Invalid or truncated JSON body.")
+        if decoded_end != end:
+            raise StreamInputError("Invalid JSON body.")
+        self.buffer = text
+        self.pos = end
+        return value
+
+
+def iter_json_array_field(stream, field):
+    """
+    Yields the elements of the array stored under `field` in a top-level JSON
+    object, decoding one element at a time. Other fields are skipped.
+    """
+    reader = _JsonReader(stream)
+    reader.expect("{")
+    found = False
+    if reader.peek() == "}":
+        reader.pos += 1
+    else:
+        while True:
+            key = reader.value()
+            reader.expect(":")
+            if key == field and not found:
+                found = True
+                if reader.peek() != "[":
+                    raise StreamInputError(f"'{field}' must be a list of strings.")
+                reader.pos += 1
+                if reader.peek() == "]":
+                    reader.pos += 1
+                else:
+                    while True:
+                        yield reader.value()
+                        next_char = reader.peek()
+                        reader.pos += 1
+                        if next_char == "]":
+                            break
+                        if next_char != ",":
+                            raise StreamInputError(f"Malformed '{field}' array.")
+            else:
+                reader.value()
+            next_char = reader.peek()
+            reader.pos += 1
+            if next_char == "}":
+                break
+            if next_char != ",":
+                raise StreamInputError("Malformed JSON object.")
+
+    if not found:
+        raise StreamInputError(f"Field '{field}' is required.")
+
+
+def iter_request_texts(stream, content_type):
+    """
+    Picks the reader for the request's content type and yields texts one at a time.
+    """
+    content_type = (content_type or "").split(";")[0].strip().lower()
+    if content_type in ("application/x-ndjson", "application/jsonl", "application/jsonlines"):
+        return iter_ndjson_texts(stream)
+    return iter_json_array_field(stream, "customer_texts")
@@ -0,0 +1,686 @@
+"""
+train_models.py
+Retrains the sentiment, sarcasm and emotion models.
+
+    python train_models.py --vectorizer hashing \
+        --sentiment sentiment.csv --sarcasm sarcasm_dataset.csv --emotion emotion.csv
+
+Each dataset is a CSV with a text column and a label column (--text-column /
+--label-column, default 'text' and 'label').
+
+The models are trained in parallel worker processes (--jobs, default: all cores).
+With --cv K, every combination of the model's hyperparameter grid (DEFAULT_GRIDS,
+or --grid FILE) is scored with K-fold cross-validation, one fit per process, and
+the model is refit with the best combination. Each run writes a new version to
+models/versions/<UTC timestamp>/ with the artifacts and a metrics.json; --promote
+also copies the artifacts to the folder the app serves from.
+
+--vectorizer hashing trains on a HashingVectorizer with a fixed number of features
+(--n-features / CAPSENSE_HASHING_FEATURES, default 2**13) instead of a
+CountVectorizer. The pickled vectorizer then holds no vocabulary dict, and the
+model's arrays are n_classes x n_features whatever the dataset size, so artifacts
+have a fixed size and load without unpickling a large dict. The report's
+"current" entry gives the served count artifacts' sizes for comparison.
+In both modes the model's per-feature arrays are stored as float32.
+Hashing artifacts are written to models/hashing/ and served with
+CAPSENSE_VECTORIZER=hashing.
+
+--streaming reads the CSV in chunks (--chunksize / CAPSENSE_TRAIN_CHUNK rows) and
+trains with partial_fit, so memory stays bounded however large the file is. It
+writes a versioned folder and honours --promote the same way, but has no grid
+search or process pool, so --cv, --grid and --jobs are rejected with it.
+
+For each model the report gives accuracy and macro F1 on a held-out split, the
+artifact size and the load time, next to the same numbers for the artifacts
+currently in models/ (evaluated on the same split).
+"""
+import argparse
+import codecs
+import json
+import os
+import sys
+import time
+from collections import Counter
+
+import joblib
+from sklearn.feature_extraction.text import CountVectorizer, HashingVectorizer
+from sklearn.metrics import accuracy_score, f1_score
+from sklearn.model_selection import train_test_split
+from sklearn.naive_bayes import MultinomialNB
+
+import model_registry
+
+# About the size of the current vocabularies (2.4k-5k terms); MultinomialNB keeps
+# dense n_classes x n_features arrays, so this sets the model size
+HASHING_FEATURES = int(os.getenv("CAPSENSE_HASHING_FEATURES", str(2 ** 13)))
+# Rows per chunk for --streaming training
+TRAIN_CHUNK_SIZE = int(os.getenv("CAPSENSE_TRAIN_CHUNK", "10000"))
+
+BASE_DIR = '/home/azureuser/Capgemini_SentimentApp_Remake/backend/models'
+
+# Artifact names and vectorizer settings of the models the app serves
+MODEL_SPECS = {
+    "sentiment": {
+        "files": ("sentiment_classifier.pkl", "vectorizer.pkl"),
+        "vectorizer": {"stop_words": "english", "ngram_range": (1, 1), "max_features": None}
+    },
+    "sarcasm": {
+        "files": ("sarcasm_classifier.pkl", "sarcasm_vectorizer.pkl"),
+        "vectorizer": {"stop_words": "english", "ngram_range": (1, 1), "max_features": 5000}
+    },
+    "emotion": {
+        "files": ("emotion_classifier.pkl", "emotion_vectorizer.pkl"),
+        "vectorizer": {"stop_words": None, "ngram_range": (1, 2), "max_features": 5000},
+        "preprocess": True
+    }
+}
+
+
+def make_vectorizer(mode, stop_words=None, ngram_range=(1, 1), max_features=None, n_features=None):
+    """
+    Returns an unfitted vectorizer for `mode` ('count' or 'hashing').
+    The hashing vectorizer produces raw, non-negative counts (no alternating
+    signs, no normalization), which is what MultinomialNB expects.
+    """
+    if mode == "hashing":
+        return HashingVectorizer(
+            n_features=n_features or HASHING_FEATURES,
+            alternate_sign=False,
+            norm=None,
+            stop_words=stop_words,
+            ngram_range=ngram_range
+        )
+    return CountVectorizer(stop_words=stop_words, ngram_range=ngram_range, max_features=max_features)
+
+
+def detect_encoding(dataset_path, sample_bytes=1024 * 1024):
+    """
+    Picks the file encoding from a sample of its first bytes instead of
+    re-reading the whole file once per candidate encoding.
+    latin1 decodes any byte sequence, so it is the last resort.
+    """
+    with open(dataset_path, "rb") as f:
+        sample = f.read(sample_bytes)
+    if sample.startswith(codecs.BOM_UTF8):
+        return "utf-8-sig"
+    for encoding in ("utf-8", "cp1252"):
+        try:
+            # Incremental, so a character cut off at the end of the sample isn't an error
+            codecs.getincrementaldecoder(encoding)().decode(sample, final=False)
+            return encoding
+        except UnicodeDecodeError:
+            continue
+    return "latin1"
+
+
+def iter_dataset_chunks(dataset_path, text_column="text", label_column="label", chunk_size=None,
+                        test_size=0.2, encoding=None):
+    """
+    Reads a CSV dataset in chunks of `chunk_size` rows, so memory use doesn't
+    depend on the file size.
+    Yields (texts, labels, is_test) per chunk, with empty rows dropped; is_test
+    marks the evaluation rows. The split is derived from each row's position in
+    the file, so every pass over the file sees the same split.
+    """
+    import numpy as np
+    import pandas as pd
+
+    encoding = encoding or detect_encoding(dataset_path)
+    reader = pd.read_csv(
+        dataset_path,
+        encoding=encoding,
+        encoding_errors="replace",
+        usecols=[text_column, label_column],
+        chunksize=chunk_size or TRAIN_CHUNK_SIZE
+    )
+    row_offset = 0
+    for chunk in reader:
+        positions = np.arange(row_offset, row_offset + len(chunk), dtype=np.uint64)
+        row_offset += len(chunk)
+        # Multiplicative hash of the row number, mapped to [0, 1)
+        split_values = (positions * np.uint64(2654435761)) % np.uint64(2 ** 32) / float(2 ** 32)
+
+        keep = chunk[label_column].notna() & chunk[text_column].notna()
+        texts = chunk[text_column].astype(str)
+        keep &= texts.str.strip() != ""
+        keep = keep.to_numpy()
+        if not keep.any():
+            continue
+        yield (
+            texts[keep].tolist(),
+            chunk[label_column][keep].tolist(),
+            (split_values[keep] < test_size).tolist()
+        )
+
+
+def read_dataset(dataset_path, text_column="text", label_column="label"):
+    """
+    Reads a whole CSV dataset into memory.
+    Returns (texts, labels) with empty rows dropped.
+    """
+    import pandas as pd
+
+    encoding = detect_encoding(dataset_path)
+    data = pd.read_csv(dataset_path, encoding=encoding, encoding_errors="replace")
+    print(f"[TRAIN] Read {dataset_path} with {encoding} encoding")
+    if text_column not in data.columns or label_column not in data.columns:
+        raise ValueError(f"{dataset_path} must have '{text_column}' and '{label_column}' columns "
+                         f"(found: {', '.join(map(str, data.columns))}).")
+
+    data = data.dropna(subset=[text_column, label_column])
+    data = data[data[text_column].astype(str).str.strip() != ""]
+    return data[text_column].astype(str).tolist(), data[label_column].tolist()
+
+
+def _model_inputs(name, texts):
+    if MODEL_SPECS[name].get("preprocess"):
+        from classifier_emotion import preprocess_texts
+        return preprocess_texts(texts)
+    return list(texts)
+
+
+def _artifact_stats(paths):
+    """
+    Returns the loaded artifacts, their sizes and the time it takes to load them
+    the way the app does.
+    """
+    model_path, vectorizer_path = paths
+    start = time.perf_counter()
+    loaded = [model_registry.load_artifact(path) for path in paths]
+    load_seconds = time.perf_counter() - start
+    return loaded, {
+        "model_bytes": os.path.getsize(model_path),
+        "vectorizer_bytes": os.path.getsize(vectorizer_path),
+        "load_seconds": round(load_seconds, 4)
+    }
+
+
+def _write_artifacts(model, vectorizer, paths):
+    """
+    Dumps the model and vectorizer, storing MultinomialNB's dense
+    n_classes x n_features arrays as float32 (half the size; predictions use
+    them through a sparse dot product, so float32 precision is plenty).
+    """
+    for attribute in ("feature_count_", "feature_log_prob_"):
+        values = getattr(model, attribute, None)
+        if values is not None:
+            setattr(model, attribute, values.astype("float32"))
+    joblib.dump(model, paths[0])
+    joblib.dump(vectorizer, paths[1])
+
+
+def _score(model, vectorizer, texts, labels):
+    predictions = model.predict(vectorizer.transform(texts))
+    return {
+        "accuracy": round(float(accuracy_score(labels, predictions)), 4),
+        "f1_macro": round(float(f1_score(labels, predictions, average="macro")), 4)
+    }
+
+
+def _split(name, texts, labels, test_size):
+    inputs = _model_inputs(name, texts)
+    return train_test_split(inputs, labels, test_size=test_size, random_state=42)
+
+
+def _build(name, mode, params=None, n_features=None):
+    """
+    Returns an unfitted (vectorizer, model) for `name`.
+    `params` overrides the model's defaults: 'alpha' goes to MultinomialNB, the
+    rest (ngram_range, max_features, n_features) to the vectorizer.
+    """
+    params = dict(params or {})
+    alpha = params.pop("alpha", 1.0)
+    settings = dict(MODEL_SPECS[name]["vectorizer"])
+    n_features = params.pop("n_features", n_features)
+    if "ngram_range" in params:
+        params["ngram_range"] = tuple(params["ngram_range"])
+    settings.update(params)
+    return make_vectorizer(mode, n_features=n_features, **settings), MultinomialNB(alpha=alpha)
+
+
+def train_model(name, texts, labels, mode="hashing", output_dir=None, test_size=0.2, n_features=None,
+                params=None, split=None):
+    """
+    Trains one model on a split of (texts, labels), writes its artifacts and
+    evaluates them, and evaluates the artifacts currently served on the same split.
+    `params` overrides the default hyperparameters (see _build); `split` is an
+    already computed (X_train, X_test, y_train, y_test).
+    Returns the report dict.
+    """
+    spec = MODEL_SPECS[name]
+    X_train, X_test, y_train, y_test = split or _split(name, texts, labels, test_size)
+
+    start = time.perf_counter()
+    vectorizer, model = _build(name, mode, params, n_features)
+    model.fit(vectorizer.fit_transform(X_train), y_train)
+    train_seconds = time.perf_counter() - start
+
+    output_dir = output_dir or os.path.dirname(model_registry.artifact_path(BASE_DIR, spec["files"][0], mode))
+    os.makedirs(output_dir, exist_ok=True)
+    paths = [os.path.join(output_dir, filename) for filename in spec["files"]]
+    _write_artifacts(model, vectorizer, paths)
+
+    (model, vectorizer), stats = _artifact_stats(paths)
+    report = {
+        "vectorizer": mode,
+        "params": params or {},
+        "train_rows": len(X_train),
+        "test_rows": len(X_test),
+        "train_seconds": round(train_seconds, 2),
+        "paths": paths,
+        **stats,
+        **_score(model, vectorizer, X_test, y_test)
+    }
+
+    current_paths = [os.path.join(BASE_DIR, filename) for filename in spec["files"]]
+    if all(os.path.exists(path) for path in current_paths) and current_paths != paths:
+        try:
+            (current_model, current_vectorizer), current_stats = _artifact_stats(current_paths)
+            report["current"] = {**current_stats, **_score(current_model, current_vectorizer, X_test, y_test)}
+        except Exception as e:
+            report["current"] = {"error": str(e)}
+    return report
+
+
+def _metrics_from_confusion(confusion, pos_label=None):
+    """
+    Computes accuracy and F1 from {(true label, predicted label): count}.
+    With `pos_label`, also precision/recall/F1 for that class (binary models).
+    """
+    total = sum(confusion.values())
+    correct = sum(count for (true, pred), count in confusion.items() if true == pred)
+    labels = {true for true, _ in confusion} | {pred for _, pred in confusion}
+
+    def class_scores(label):
+        tp = confusion.get((label, label), 0)
+        fp = sum(count for (true, pred), count in confusion.items() if pred == label and true != label)
+        fn = sum(count for (true, pred), count in confusion.items() if true == label and pred != label)
+        precision = tp / (tp + fp) if tp + fp else 0.0
+        recall = tp / (tp + fn) if tp + fn else 0.0
+        f1 = 2 * precision * recall / (precision + recall) if precision + recall else 0.0
+        return precision, recall, f1
+
+    report = {
+        "accuracy": round(correct / total, 4) if total else 0.0,
+        "f1_macro": round(sum(class_scores(label)[2] for label in labels) / len(labels), 4) if labels else 0.0
+    }
+    if pos_label is not None:
+        precision, recall, f1 = class_scores(pos_label)
+        report.update({"precision": round(precision, 4), "recall": round(recall, 4), "f1_score": round(f1, 4)})
+    return report
+
+
+def _streaming_vocabulary(name, dataset_path, spec, options):
+    """
+    First pass of count-mode streaming training: counts term frequencies on the
+    training rows and keeps the `max_features` most frequent terms, like
+    CountVectorizer.fit does. Memory grows with the vocabulary, not the data.
+    Returns (classes, vocabulary dict).
+    """
+    settings = dict(spec["vectorizer"])
+    max_features = settings.pop("max_features")
+    analyzer = CountVectorizer(**settings).build_analyzer()
+
+    classes = set()
+    term_counts = Counter()
+    for texts, labels, is_test in iter_dataset_chunks(dataset_path, **options):
+        classes.update(labels)
+        inputs = _model_inputs(name, texts)
+        for text, test in zip(inputs, is_test):
+            if not test:
+                term_counts.update(analyzer(text))
+
+    terms = sorted(term_counts, key=lambda term: (-term_counts[term], term))
+    if max_features:
+        terms = terms[:max_features]
+    return classes, {term: i for i, term in enumerate(sorted(terms))}
+
+
+def train_streaming(name, dataset_path, mode="hashing", output_dir=None, test_size=0.2,
+                    chunk_size=None, text_column="text", label_column="label", n_features=None,
+                    pos_label=None):
+    """
+    Out-of-core version of train_model for datasets that don't fit in memory.
+    The CSV is read in chunks and the model is trained with partial_fit:
+      1. a scan for the class labels (and, in count mode, the vocabulary)
+      2. partial_fit over the training rows, chunk by chunk
+      3. evaluation of the held-out rows, accumulated into a confusion matrix
+    The currently served artifacts are evaluated in the same pass.
+    Returns the report dict, like train_model.
+    """
+    import numpy as np
+
+    spec = MODEL_SPECS[name]
+    options = {
+        "text_column": text_column,
+        "label_column": label_column,
+        "chunk_size": chunk_size,
+        "test_size": test_size,
+        "encoding": detect_encoding(dataset_path)
+    }
+    print(f"[TRAIN] Streaming {dataset_path} ({options['encoding']}) for {name} ({mode})")
+
+    start = time.perf_counter()
+    if mode == "hashing":
+        classes = set()
+        for _, labels, _ in iter_dataset_chunks(dataset_path, **options):
+            classes.update(labels)
+        vectorizer = make_vectorizer(mode, n_features=n_features, **spec["vectorizer"])
+    else:
+        classes, vocabulary = _streaming_vocabulary(name, dataset_path, spec, options)
+        settings = {k: v for k, v in spec["vectorizer"].items() if k != "max_features"}
+        vectorizer = CountVectorizer(vocabulary=vocabulary, **settings)
+    classes = np.unique(np.asarray(list(classes)))
+
+    model = MultinomialNB()
+    train_rows = 0
+    for texts, labels, is_test in iter_dataset_chunks(dataset_path, **options):
+        inputs = _model_inputs(name, texts)
+        train_texts = [text for text, test in zip(inputs, is_test) if not test]
+        train_labels = [label for label, test in zip(labels, is_test) if not test]
+        if train_texts:
+            model.partial_fit(vectorizer.transform(train_texts), train_labels, classes=classes)
+            train_rows += len(train_texts)
+    if not train_rows:
+        raise ValueError(f"{dataset_path} has no training rows.")
+    train_seconds = time.perf_counter() - start
+
+    output_dir = output_dir or os.path.dirname(model_registry.artifact_path(BASE_DIR, spec["files"][0], mode))
+    os.makedirs(output_dir, exist_ok=True)
+    paths = [os.path.join(output_dir, filename) for filename in spec["files"]]
+    _write_artifacts(model, vectorizer, paths)
+    (model, vectorizer), stats = _artifact_stats(paths)
+
+    current = None
+    current_paths = [os.path.join(BASE_DIR, filename) for filename in spec["files"]]
+    if all(os.path.exists(path) for path in current_paths) and current_paths != paths:
+        try:
+            current_models, current_stats = _artifact_stats(current_paths)
+            current = (current_models, current_stats, Counter())
+        except Exception as e:
+            print(f"[TRAIN] Could not load the current {name} model for comparison: {str(e)}")
+
+    confusion = Counter()
+    test_rows = 0
+    for texts, labels, is_test in iter_dataset_chunks(dataset_path, **options):
+        test_texts = [text for text, test in zip(_model_inputs(name, texts), is_test) if test]
+        test_labels = [label for label, test in zip(labels, is_test) if test]
+        if not test_texts:
+            continue
+        test_rows += len(test_texts)
+        confusion.update(zip(test_labels, model.predict(vectorizer.transform(test_texts))))
+        if current is not None:
+            (current_model, current_vectorizer), _, current_confusion = current
+            current_confusion.update(zip(test_labels, current_model.predict(current_vectorizer.transform(test_texts))))
+
+    report = {
+        "vectorizer": mode,
+        "streaming": True,
+        "encoding": options["encoding"],
+        "train_rows": train_rows,
+        "test_rows": test_rows,
+        "train_seconds": round(train_seconds, 2),
+        "paths": paths,
+        **stats,
+        **_metrics_from_confusion(confusion, pos_label)
+    }
+    if current is not None:
+        _, current_stats, current_confusion = current
+        report["current"] = {**current_stats, **_metrics_from_confusion(current_confusion, pos_label)}
+    return report
+
+
+# Hyperparameter grids searched by --cv; override with --grid FILE (JSON, same shape)
+DEFAULT_GRIDS = {
+    "sentiment": {"alpha": [0.1, 0.5, 1.0]},
+    "sarcasm": {"alpha": [0.1, 0.5, 1.0], "max_features": [5000, 20000]},
+    "emotion": {"alpha": [0.1, 0.5, 1.0], "ngram_range": [[1, 1], [1, 2]]}
+}
+
+# Per-process dataset cache: filled in the parent before the pool starts (and
+# inherited on fork), or loaded once per worker on first use (spawn).
+_datasets = {}
+
+
+def _dataset(name, path, text_column, label_column, test_size):
+    key = (name, path, text_column, label_column, test_size)
+    if key not in _datasets:
+        texts, labels = read_dataset(path, text_column, label_column)
+        _datasets[key] = _split(name, texts, labels, test_size)
+    return _datasets[key]
+
+
+def _grid_candidates(grid, mode):
+    """
+    Expands {"param": [values...]} into a list of parameter dicts.
+    Vocabulary-size settings only apply to the matching vectorizer mode.
+    """
+    ignored = "max_features" if mode == "hashing" else "n_features"
+    grid = {key: values for key, values in (grid or {}).items() if key != ignored}
+    candidates = [{}]
+    for key, values in grid.items():
+        candidates = [dict(candidate, **{key: value}) for candidate in candidates for value in values]
+    return candidates
+
+
+def _cv_task(task):
+    """
+    Fits and scores one (model, params, fold) combination on the training split.
+    Runs in a worker process.
+    """
+    from sklearn.model_selection import StratifiedKFold
+
+    X_train, _, y_train, _ = _dataset(task["name"], *task["dataset"])
+    folds = StratifiedKFold(n_splits=task["folds"], shuffle=True, random_state=42)
+    train_idx, valid_idx = list(folds.split(X_train, y_train))[task["fold"]]
+
+    start = time.perf_counter()
+    vectorizer, model = _build(task["name"], task["mode"], task["params"], task["n_features"])
+    model.fit(vectorizer.fit_transform([X_train[i] for i in train_idx]), [y_train[i] for i in train_idx])
+    scores = _score(model, vectorizer, [X_train[i] for i in valid_idx], [y_train[i] for i in valid_idx])
+    return dict(task, seconds=round(time.perf_counter() - start, 2), **scores)
+
+
+def _final_task(task):
+    """
+    Trains a model with its chosen params on the whole training split and writes
+    the artifacts. Runs in a worker process.
+    """
+    split = _dataset(task["name"], *task["dataset"])
+    return task["name"], train_model(task["name"], None, None, mode=task["mode"], output_dir=task["output_dir"],
+                                     n_features=task["n_features"], params=task["params"], split=split)
+
+
+def _summarize_cv(results):
+    by_params = {}
+    for result in results:
+        by_params.setdefault(json.dumps(result["params"], sort_keys=True), []).append(result)
+    summary = []
+    for key, runs in by_params.items():
+        f1s = [run["f1_macro"] for run in runs]
+        mean = sum(f1s) / len(f1s)
+        summary.append({
+            "params": json.loads(key),
+            "folds": len(runs),
+            "mean_f1_macro": round(mean, 4),
+            "std_f1_macro": round((sum((f - mean) ** 2 for f in f1s) / len(f1s)) ** 0.5, 4),
+            "mean_accuracy": round(sum(run["accuracy"] for run in runs) / len(runs), 4),
+            "fit_seconds": round(sum(run["seconds"] for run in runs), 2)
+        })
+    return sorted(summary, key=lambda row: -row["mean_f1_macro"])
+
+
+def train_all(datasets, mode="hashing", cv=0, grids=None, jobs=None, test_size=0.2, n_features=None,
+              text_column="text", label_column="label", versions_dir=None, promote=False):
+    """
+    Trains several models in parallel worker processes.
+    With `cv` >= 2, every combination in each model's grid is scored with k-fold
+    cross-validation on the training split, one (model, params, fold) task per
+    worker; each model is then refit with its best params (by mean macro F1) and
+    scored on the held-out split.
+    Artifacts go to a new versioned folder (versions_dir/<version>/) together with
+    metrics.json; `promote` also copies them to the folder the app serves from.
+    Returns the metrics dict.
+    """
+    import multiprocessing
+    from concurrent.futures import ProcessPoolExecutor
+
+    grids = DEFAULT_GRIDS if grids is None else grids
+    jobs = jobs or os.cpu_count() or 1
+    version, output_dir = _new_version(versions_dir)
+
+    dataset_args = {
+        name: (path, text_column, label_column, test_size) for name, path in datasets.items()
+    }
+    # Load (and preprocess) each dataset once here, so forked workers inherit it
+    for name, args in dataset_args.items():
+        _dataset(name, *args)
+
+    methods = multiprocessing.get_all_start_methods()
+    context = multiprocessing.get_context("fork" if "fork" in methods else None)
+    start = time.perf_counter()
+    cv_summary = {}
+    best_params = {name: {} for name in datasets}
+    with ProcessPoolExecutor(max_workers=jobs, mp_context=context) as pool:
+        if cv and cv >= 2:
+            tasks = [
+                {"name": name, "dataset": dataset_args[name], "mode": mode, "params": params,
+                 "fold": fold, "folds": cv, "n_features": n_features}
+                for name in datasets
+                for params in _grid_candidates(grids.get(name), mode)
+                for fold in range(cv)
+            ]
+            print(f"[TRAIN] Running {len(tasks)} cross-validation fits on {jobs} processes")
+            results = list(pool.map(_cv_task, tasks))
+            for name in datasets:
+                cv_summary[name] = _summarize_cv([r for r in results if r["name"] == name])
+                best_params[name] = cv_summary[name][0]["params"]
+                print(f"[TRAIN] Best {name} params: {best_params[name]}")
+
+        final_tasks = [
+            {"name": name, "dataset": dataset_args[name], "mode": mode, "params": best_params[name],
+             "n_features": n_features, "output_dir": output_dir}
+            for name in datasets
+        ]
+        reports = dict(pool.map(_final_task, final_tasks))
+
+    metrics = {
+        "version": version,
+        "vectorizer": mode,
+        "cv_folds": cv if cv and cv >= 2 else 0,
+        "processes": jobs,
+        "total_seconds": round(time.perf_counter() - start, 2),
+        "models": {
+            name: {"dataset": datasets[name], "best_params": best_params[name],
+                   "cv": cv_summary.get(name, []), "holdout": reports[name]}
+            for name in datasets
+        }
+    }
+    _finish_version(metrics, output_dir, datasets, promote)
+    return metrics
+
+
+def train_all_streaming(datasets, mode="hashing", test_size=0.2, chunk_size=None, n_features=None,
+                        text_column="text", label_column="label", versions_dir=None, promote=False):
+    """
+    Trains several models with train_streaming, one after the other, into a new
+    versioned folder with metrics.json, like train_all; `promote` also copies
+    them to the folder the app serves from.
+    Returns the metrics dict.
+    """
+    version, output_dir = _new_version(versions_dir)
+    start = time.perf_counter()
+    reports = {}
+    for name, dataset_path in datasets.items():
+        reports[name] = train_streaming(name, dataset_path, mode=mode, output_dir=output_dir,
+                                        test_size=test_size, chunk_size=chunk_size, text_column=text_column,
+                                        label_column=label_column, n_features=n_features)
+    metrics = {
+        "version": version,
+        "vectorizer": mode,
+        "streaming": True,
+        "total_seconds": round(time.perf_counter() - start, 2),
+        "models": {name: {"dataset": datasets[name], "holdout": reports[name]} for name in datasets}
+    }
+    _finish_version(metrics, output_dir, datasets, promote)
+    return metrics
+
+
+def _new_version(versions_dir=None):
+    # Returns (version, folder) for a new run under versions_dir
+    from datetime import datetime, timezone
+
+    version = datetime.now(timezone.utc).strftime("%Y%m%dT%H%M%SZ")
+    versions_dir = versions_dir or os.path.join(BASE_DIR, "versions")
+    return version, os.path.join(versions_dir, version)
+
+
+def _finish_version(metrics, output_dir, datasets, promote):
+    # Writes metrics.json next to the artifacts and, with `promote`, copies them to the served folder
+    import shutil
+
+    os.makedirs(output_dir, exist_ok=True)
+    with open(os.path.join(output_dir, "metrics.json"), "w", encoding="utf-8") as f:
+        json.dump(metrics, f, indent=2, default=str)
+    print(f"[TRAIN] Wrote version {metrics['version']} to {output_dir}")
+
+    if promote:
+        mode = metrics["vectorizer"]
+        for name in datasets:
+            for filename in MODEL_SPECS[name]["files"]:
+                target = model_registry.artifact_path(BASE_DIR, filename, mode)
+                os.makedirs(os.path.dirname(target), exist_ok=True)
+                shutil.copy2(os.path.join(output_dir, filename), target)
+        print(f"[TRAIN] Promoted version {metrics['version']} ({mode})")
+        metrics["promoted"] = True
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Retrain the sentiment, sarcasm and emotion models.")
+    parser.add_argument("--vectorizer", choices=("count", "hashing"), default="hashing")
+    for name in MODEL_SPECS:
+        parser.add_argument(f"--{name}", metavar="CSV", help=f"training data for the {name} model")
+    parser.add_argument("--n-features", type=int, help=f"hashing vectorizer size (default {HASHING_FEATURES})")
+    parser.add_argument("--text-column", default="text")
+    parser.add_argument("--label-column", default="label")
+    parser.add_argument("--output-dir", help="versions folder (default: models/versions)")
+    parser.add_argument("--test-size", type=float, default=0.2)
+    parser.add_argument("--streaming", action="store_true",
+                        help="read the CSV in chunks and train with partial_fit (bounded memory)")
+    parser.add_argument("--chunksize", type=int, help=f"rows per chunk with --streaming (default {TRAIN_CHUNK_SIZE})")
+    parser.add_argument("--cv", type=int, default=0, help="cross-validation folds for the grid search (0: no search)")
+    parser.add_argument("--grid", help="JSON file with {model: {param: [values]}} (default: DEFAULT_GRIDS)")
+    parser.add_argument("--jobs", type=int, help="worker processes (default: all cores)")
+    parser.add_argument("--promote", action="store_true",
+                        help="also copy the new version to the folder the app serves from")
+    args = parser.parse_args(argv)
+
+    datasets = {name: getattr(args, name) for name in MODEL_SPECS if getattr(args, name)}
+    if not datasets:
+        parser.error("give at least one of --sentiment, --sarcasm, --emotion")
+
+    if args.streaming:
+        unsupported = [flag for flag, value in (("--cv", args.cv), ("--grid", args.grid), ("--jobs", args.jobs))
+                       if value]
+        if unsupported:
+            parser.error(f"{', '.join(unsupported)} can't be used with --streaming")
+        metrics = train_all_streaming(datasets, mode=args.vectorizer, test_size=args.test_size,
+                                      chunk_size=args.chunksize, n_features=args.n_features,
+                                      text_column=args.text_column, label_column=args.label_column,
+                                      versions_dir=args.output_dir, promote=args.promote)
+        print(json.dumps(metrics, indent=2, default=str))
+        return 0
+
+    grids = None
+    if args.grid:
+        with open(args.grid, encoding="utf-8") as f:
+            grids = json.load(f)
+    metrics = train_all(datasets, mode=args.vectorizer, cv=args.cv, grids=grids, jobs=args.jobs,
+                        test_size=args.test_size, n_features=args.n_features,
+                        text_column=args.text_column, label_column=args.label_column,
+                        versions_dir=args.output_dir, promote=args.promote)
+    print(json.dumps(metrics, indent=2, default=str))
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
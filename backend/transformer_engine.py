@@ -0,0 +1,240 @@
+"""
+transformer_engine.py
+Batched CPU inference for the Hugging Face irony model, used in place of
+transformers.pipeline():
+  - texts are tokenized once, sorted by length and padded per batch, so short
+    texts aren't padded up to the longest one in the request
+  - CAPSENSE_TRANSFORMER_BATCH_SIZE / CAPSENSE_TRANSFORMER_MAX_LENGTH control
+    batching and truncation
+  - inference runs under torch.inference_mode()
+  - torch intra-op / inter-op threads are set per worker (CAPSENSE_TORCH_THREADS,
+    CAPSENSE_TORCH_INTEROP_THREADS), so gunicorn workers don't each start one
+    thread per core and fight over the CPU
+  - CAPSENSE_TRANSFORMER_QUANTIZE=1 applies dynamic int8 quantization to the
+    Linear layers
+
+OnnxClassifier runs the same model exported to ONNX (see export_onnx.py) on
+ONNX Runtime, which avoids importing torch in the workers altogether.
+
+torch, transformers and onnxruntime are only imported when an engine is created.
+onnxruntime and tokenizers are in requirements-optional.txt.
+"""
+import json
+import os
+import sys
+import threading
+
+BATCH_SIZE = int(os.getenv("CAPSENSE_TRANSFORMER_BATCH_SIZE", "16"))
+MAX_LENGTH = int(os.getenv("CAPSENSE_TRANSFORMER_MAX_LENGTH", "128"))
+QUANTIZE = os.getenv("CAPSENSE_TRANSFORMER_QUANTIZE", "0") in ("1", "true", "yes")
+
+# Written by export_onnx.py --quantize next to the float model
+QUANTIZED_SUFFIX = ".int8.onnx"
+
+_threads_lock = threading.Lock()
+_threads_configured_pid = None
+
+
+def torch_thread_settings():
+    """
+    Returns (intra_op_threads, inter_op_threads) for this worker.
+    By default the cores are split evenly between the gunicorn workers.
+    """
+    threads = os.getenv("CAPSENSE_TORCH_THREADS")
+    if threads:
+        intra = int(threads)
+    else:
+        workers = max(1, int(os.getenv("GUNICORN_WORKERS", "1")))
+        intra = (os.cpu_count() or 1) // workers
+    interop = int(os.getenv("CAPSENSE_TORCH_INTEROP_THREADS", "1"))
+    return max(1, intra), max(1, interop)
+
+
+def configure_torch_threads():
+    """
+    Applies the thread settings to torch once per process.
+    If torch hasn't been imported yet, only the OpenMP/MKL environment variables
+    are set, so that a later import picks them up without paying for the import now.
+    Returns the (intra, inter) settings.
+    """
+    global _threads_configured_pid
+    intra, interop = torch_thread_settings()
+    os.environ.setdefault("OMP_NUM_THREADS", str(intra))
+    os.environ.setdefault("MKL_NUM_THREADS", str(intra))
+
+    torch = sys.modules.get("torch")
+    if torch is None:
+        return intra, interop
+
+    with _threads_lock:
+        if _threads_configured_pid == os.getpid():
+            return intra, interop
+        torch.set_num_threads(intra)
+        try:
+            torch.set_num_interop_threads(interop)
+        except RuntimeError:
+            # Can only be set before the first parallel op in the process
+            pass
+        _threads_configured_pid = os.getpid()
+    print(f"[TRANSFORMER] torch threads: intra-op={intra}, inter-op={interop}")
+    return intra, interop
+
+
+def length_sorted_batches(lengths, batch_size):
+    """
+    Yields lists of indices, grouping inputs of similar length so each batch is
+    padded to its own longest input. Longest first, so the first batch shows the
+    worst-case memory use early.
+    """
+    order = sorted(range(len(lengths)), key=lambda i: lengths[i], reverse=True)
+    for start in range(0, len(order), batch_size):
+        yield order[start:start + batch_size]
+
+
+class TransformerClassifier:
+    """
+    Sequence classifier that takes a list of texts and returns pipeline-style
+    [{"label": str, "score": float}, ...] in input order.
+    """
+    def __init__(self, model_name, batch_size=None, max_length=None, quantize=None):
+        import torch
+        from transformers import AutoModelForSequenceClassification, AutoTokenizer
+
+        configure_torch_threads()
+
+        self.torch = torch
+        self.model_name = model_name
+        self.batch_size = max(1, batch_size or BATCH_SIZE)
+        self.max_length = max_length or MAX_LENGTH
+        self.quantized = QUANTIZE if quantize is None else quantize
+
+        self.tokenizer = AutoTokenizer.from_pretrained(model_name)
+        model = AutoModelForSequenceClassification.from_pretrained(model_name)
+        model.eval()
+        if self.quantized:
+            model = torch.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+        self.model = model
+        self.id2label = model.config.id2label
+
+    def __call__(self, texts):
+        if isinstance(texts, str):
+            texts = [texts]
+        if not texts:
+            return []
+
+        encoded = self.tokenizer(list(texts), truncation=True, max_length=self.max_length)
+        input_ids = encoded["input_ids"]
+        attention_mask = encoded["attention_mask"]
+
+        results = [None] * len(input_ids)
+        with self.torch.inference_mode():
+            for batch_idx in length_sorted_batches([len(ids) for ids in input_ids], self.batch_size):
+                batch = self.tokenizer.pad(
+                    {
+                        "input_ids": [input_ids[i] for i in batch_idx],
+                        "attention_mask": [attention_mask[i] for i in batch_idx]
+                    },
+                    return_tensors="pt"
+                )
+                logits = self.model(**batch).logits
+                scores, labels = self.torch.softmax(logits, dim=-1).max(dim=-1)
+                for i, label, score in zip(batch_idx, labels.tolist(), scores.tolist()):
+                    results[i] = {"label": self.id2label[label], "score": score}
+        return results
+
+    def describe(self):
+        """
+        Returns the engine settings, for logs and /api/models.
+        """
+        intra, interop = torch_thread_settings()
+        return {
+            "model": self.model_name,
+            "backend": "torch",
+            "batch_size": self.batch_size,
+            "max_length": self.max_length,
+            "quantized": self.quantized,
+            "torch_threads": intra,
+            "torch_interop_threads": interop
+        }
+
+
+class OnnxClassifier:
+    """
+    ONNX Runtime version of TransformerClassifier, reading a model exported by
+    export_onnx.py. Needs only onnxruntime and tokenizers at runtime, not torch.
+    `model_path` is the .onnx file; tokenizer.json and labels.json must sit next to it.
+    """
+    def __init__(self, model_path, batch_size=None, max_length=None):
+        import numpy as np
+        import onnxruntime as ort
+        from tokenizers import Tokenizer
+
+        model_dir = os.path.dirname(os.path.abspath(model_path))
+        with open(os.path.join(model_dir, "labels.json"), encoding="utf-8") as f:
+            meta = json.load(f)
+
+        self.np = np
+        self.model_name = meta.get("model", model_path)
+        self.model_path = model_path
+        self.batch_size = max(1, batch_size or BATCH_SIZE)
+        self.max_length = max_length or MAX_LENGTH
+        self.quantized = model_path.endswith(QUANTIZED_SUFFIX)
+        self.id2label = {int(k): v for k, v in meta["id2label"].items()}
+        self.pad_token_id = meta.get("pad_token_id", 1)
+
+        self.tokenizer = Tokenizer.from_file(os.path.join(model_dir, "tokenizer.json"))
+        self.tokenizer.enable_truncation(self.max_length)
+        self.tokenizer.no_padding()
+
+        intra, interop = torch_thread_settings()
+        options = ort.SessionOptions()
+        options.intra_op_num_threads = intra
+        options.inter_op_num_threads = interop
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        self.session = ort.InferenceSession(model_path, sess_options=options, providers=["CPUExecutionProvider"])
+        self.input_names = {i.name for i in self.session.get_inputs()}
+
+    def __call__(self, texts):
+        if isinstance(texts, str):
+            texts = [texts]
+        if not texts:
+            return []
+
+        np = self.np
+        encodings = self.tokenizer.encode_batch(list(texts))
+        results = [None] * len(encodings)
+        for batch_idx in length_sorted_batches([len(e.ids) for e in encodings], self.batch_size):
+            width = len(encodings[batch_idx[0]].ids)
+            input_ids = np.full((len(batch_idx), width), self.pad_token_id, dtype=np.int64)
+            attention_mask = np.zeros((len(batch_idx), width), dtype=np.int64)
+            for row, i in enumerate(batch_idx):
+                ids = encodings[i].ids
+                input_ids[row, :len(ids)] = ids
+                attention_mask[row, :len(ids)] = 1
+
+            feeds = {"input_ids": input_ids, "attention_mask": attention_mask}
+            logits = self.session.run(["logits"], {k: v for k, v in feeds.items() if k in self.input_names})[0]
+            logits = logits - logits.max(axis=1, keepdims=True)
+            probabilities = np.exp(logits)
+            probabilities /= probabilities.sum(axis=1, keepdims=True)
+            labels = probabilities.argmax(axis=1)
+            for row, i in enumerate(batch_idx):
+                label = int(labels[row])
+                results[i] = {"label": self.id2label[label], "score": float(probabilities[row, label])}
+        return results
+
+    def describe(self):
+        """
+        Returns the engine settings, for logs and /api/models.
+        """
+        intra, interop = torch_thread_settings()
+        return {
+            "model": self.model_name,
+            "backend": "onnx",
+            "path": self.model_path,
+            "batch_size": self.batch_size,
+            "max_length": self.max_length,
+            "quantized": self.quantized,
+            "intra_op_threads": intra,
+            "inter_op_threads": interop
+        }